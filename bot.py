@@ -9,7 +9,8 @@ import re
 import logging
 import uvloop
 import random
-from urllib.parse import urlsplit, urlunsplit
+import uuid
+from urllib.parse import urlsplit, urlunsplit, unquote
 from datetime import datetime, timedelta, timezone
 from pyrogram import Client, filters, idle
 from pyrogram.types import (
@@ -19,7 +20,6 @@ from pyrogram.types import (
     Message
 )
 from pyrogram.errors import FloodWait, UserNotParticipant, RPCError
-from asyncio import Queue
 from aiohttp import web
 
 # ================== SPEED OPTIMIZATION ==================
@@ -28,7 +28,35 @@ uvloop.install()
 # ================== IMPORTS ==================
 from config import *
 from database import db
-from helpers import check_force_sub, get_invite_links, broadcast_message
+from helpers import check_force_sub, get_invite_links, fsub_sweeper
+from helpers.broadcast import broadcast_manager, BroadcastStats, format_audience
+from helpers.reachability import reachability_prober
+from helpers.flood_guard import flood_guard, DEFAULT_FLOOD_LIMITS
+from helpers.instrumentation import handler_metrics, instrument_database, instrument_client
+from helpers.loop_monitor import loop_monitor
+from helpers.file_writer import WriteBehindFile, io_executor
+from helpers.admission import admission
+from helpers.staging import staging, safe_file_name
+from helpers.bandwidth import bandwidth, MBPS
+from helpers.preflight import preflight
+from helpers.pipeline import Pipeline
+from helpers.background import background
+from helpers.backup_dispatcher import backup_dispatcher
+from helpers.gofile_pool import gofile_pool, classify_failure
+from helpers.batches import batch_manager, BatchFull
+from helpers.metrics import (
+    metrics,
+    active_workers,
+    downloaded_bytes,
+    uploaded_bytes,
+    job_phase_seconds,
+    jobs_total,
+    gofile_uploads,
+    upload_cache_hits,
+    url_requests_coalesced,
+    db_save_seconds,
+    db_size_bytes
+)
 from helpers.force_sub import (
     get_fsub_keyboard, 
     get_fsub_message,
@@ -36,6 +64,14 @@ from helpers.force_sub import (
     get_random_left_message
 )
 from helpers.decorators import admin_only, owner_only, not_banned
+from helpers.rpc_governor import rpc, PRIORITY_USER_REPLY
+from helpers.formatting import human_readable_size
+from helpers.progress import (
+    TransferProgress,
+    ProgressReporter,
+    FileUploadPayload,
+    status_edits
+)
 
 # ================== SETUP ==================
 os.makedirs(DOWNLOAD_DIR, exist_ok=True)
@@ -55,10 +91,8 @@ app = Client(
     workers=10
 )
 
-download_queue = Queue()
-MAX_CONCURRENT_QUEUE_WORKERS = 10
-queue_worker_tasks = []
 shutdown_in_progress = False
+URL_FLIGHTS = {}  # normalized URL -> [(message, status_msg)] waiting on the queued transfer
 ADMIN_WIZARDS = {}
 ACTION_UNDO = {}
 LIST_PAGE_SIZE = 10
@@ -67,17 +101,23 @@ TELEGRAM_CHANNEL_ID_THRESHOLD = -1000000000000
 ADMIN_TEXT_COMMANDS = [
     "start", "help", "stats", "ping", "about", "analytics", "usernamefile", "broadcast",
     "users", "ban", "unban", "banned", "user", "addfsub", "remfsub", "fsub", "setad",
-    "delad", "togglead", "maintenance", "setwelcome", "resetwelcome", "export"
+    "delad", "togglead", "maintenance", "setwelcome", "resetwelcome", "export", "floodlimit",
+    "bandwidth", "batch"
 ]
 
-# ================== HELPER FUNCTIONS ==================
+# ================== METRICS ==================
+metrics.gauge("queue_depth", "Jobs waiting in the transfer pipeline queues.", function=lambda: transfer_pipeline.queued())
+metrics.gauge("staging_reserved_bytes", "Disk space reserved by running jobs.", function=lambda: admission.reserved)
+metrics.gauge("staging_waiting_jobs", "Jobs waiting for staging space.", function=lambda: admission.waiting)
 
-def human_readable_size(size):
-    for unit in ['B', 'KB', 'MB', 'GB', 'TB']:
-        if size < 1024:
-            return f"{size:.2f} {unit}"
-        size /= 1024
-    return f"{size:.2f} PB"
+def record_db_write(seconds: float, size: int):
+    db_save_seconds.observe(seconds)
+    db_size_bytes.set(size)
+
+db.on_write = record_db_write
+db.io_executor = io_executor
+
+# ================== HELPER FUNCTIONS ==================
 
 def get_current_time():
     return datetime.now().strftime("%Y-%m-%d %H:%M:%S")
@@ -136,6 +176,15 @@ def is_valid_http_url(url: str) -> bool:
     except Exception:
         return False
 
+def normalize_url(url: str) -> str:
+    """Canonical form used to coalesce identical URL requests (keeps the query, drops the fragment)."""
+    parsed = urlsplit(url.strip())
+    netloc = parsed.netloc.lower()
+    default_port = {"http": ":80", "https": ":443"}.get(parsed.scheme.lower(), "")
+    if default_port and netloc.endswith(default_port):
+        netloc = netloc[:-len(default_port)]
+    return urlunsplit((parsed.scheme.lower(), netloc, parsed.path or "/", parsed.query, ""))
+
 def is_supported_fsub_chat_type(chat_type) -> bool:
     normalized = str(chat_type).lower()
     if normalized in ("channel", "supergroup"):
@@ -494,6 +543,59 @@ async def edit_start_response(callback: CallbackQuery, welcome_text: str, keyboa
             except Exception as plain_reply_error:
                 logger.error(f"Failed to send plain-text start reply fallback (user={user_id}, chat={chat_id}): {plain_reply_error}")
  
+# ================== FLOOD GUARD ==================
+# Runs before every other handler group so dropped updates cost no DB or RPC work.
+
+@app.on_message(filters.private, group=-100)
+async def flood_guard_message_filter(client: Client, message: Message):
+    if not message.from_user:
+        return
+    decision = flood_guard.check_message(message)
+    if decision.allowed:
+        return
+    if decision.warn:
+        try:
+            await rpc.reply_text(
+                message,
+                "⏳ **Slow down!**\n\n"
+                f"You're sending too fast. Messages are being ignored for about `{int(decision.retry_after) + 1}s`."
+            )
+        except Exception as e:
+            logger.debug(f"Flood warning not delivered to {message.from_user.id}: {e}")
+    message.stop_propagation()
+
+@app.on_callback_query(group=-100)
+async def flood_guard_callback_filter(client: Client, callback: CallbackQuery):
+    decision = flood_guard.check(callback.from_user.id, "callback")
+    if decision.allowed:
+        return
+    if decision.warn:
+        try:
+            await callback.answer("⏳ Slow down! Too many taps.", show_alert=False)
+        except Exception:
+            pass
+    callback.stop_propagation()
+
+# ================== UPDATE CONTEXT ==================
+# Handlers for one update share a DB context: saves and repeated user
+# upserts are collapsed and written once after the last handler group.
+
+@app.on_message(group=-99)
+async def open_message_update_context(client: Client, message: Message):
+    await db.begin_update()
+
+@app.on_callback_query(group=-99)
+async def open_callback_update_context(client: Client, callback: CallbackQuery):
+    await db.begin_update()
+
+@app.on_message(group=100)
+async def close_message_update_context(client: Client, message: Message):
+    await db.end_update()
+
+@app.on_callback_query(group=100)
+async def close_callback_update_context(client: Client, callback: CallbackQuery):
+    await db.end_update()
+
 # ================== FORCE SUBSCRIBE MIDDLEWARE ==================
 
 async def force_sub_check(client: Client, message: Message) -> bool:
@@ -656,6 +758,7 @@ async def help_command(client: Client, message: Message):
         "├ /help - Show this help\n"
         "├ /stats - Your upload statistics\n"
         "├ /ping - Check bot latency\n"
+        "├ /batch - Upload several files as one folder\n"
         "└ /about - About the bot\n\n"
         "**How to Upload:**\n"
         "1️⃣ Send any file (document/video/audio/photo)\n"
@@ -692,6 +795,7 @@ async def help_menu_callback(client: Client, callback: CallbackQuery):
         "├ /help - Show this help\n"
         "├ /stats - Your upload statistics\n"
         "├ /ping - Check bot latency\n"
+        "├ /batch - Upload several files as one folder\n"
         "└ /about - About the bot\n\n"
         "**How to Upload:**\n"
         "1️⃣ Send any file (document/video/audio/photo)\n"
@@ -813,6 +917,49 @@ async def about_command(client: Client, message: Message):
 
 # ================== ADMIN PANEL ==================
 
+def format_staging(stats: dict) -> str:
+    quota = human_readable_size(stats["quota"]) if stats["quota"] else "no quota"
+    text = (
+        f"`{human_readable_size(stats['staged'])}` used, "
+        f"`{human_readable_size(stats['reserved'])}` reserved of `{quota}`"
+    )
+    if stats["waiting"]:
+        text += f" • ⏳ `{stats['waiting']}` waiting"
+    return text
+
+MAX_PANEL_GOFILE_ACCOUNTS = 5
+
+def format_gofile_accounts(accounts: list) -> str:
+    """Busiest or failing accounts first; the rest collapse into one line to keep the panel under Telegram's limit."""
+    ranked = sorted(
+        accounts,
+        key=lambda a: (a["quarantined_for"] > 0, a["in_flight"], a["recent_errors"]),
+        reverse=True
+    )
+    lines = []
+    for account in ranked[:MAX_PANEL_GOFILE_ACCOUNTS]:
+        state = f"⛔ quarantined `{account['quarantined_for']}s`" if account["quarantined_for"] else "✅"
+        lines.append(
+            f"• `{account['id']}` {state} | in flight `{account['in_flight']}` | "
+            f"`{account['uploads']}` uploads, `{human_readable_size(account['bytes_stored'])}` | "
+            f"errors `{account['recent_errors']}`"
+        )
+    hidden = ranked[MAX_PANEL_GOFILE_ACCOUNTS:]
+    if hidden:
+        quarantined = sum(1 for account in hidden if account["quarantined_for"])
+        lines.append(f"• +{len(hidden)} more (`{quarantined}` quarantined)")
+    return "\n".join(lines)
+
+def format_pipeline(stats: dict) -> str:
+    lines = []
+    for name, stage in stats["stages"].items():
+        limit = f"/{stage['queue_limit']}" if stage["queue_limit"] else ""
+        lines.append(
+            f"• {name}: `{stage['busy']}/{stage['workers']}` busy | queued `{stage['queued']}{limit}` | "
+            f"util `{stage['utilization']}%` | wait p95 `{format_latency(stage['queue_wait']['p95'])}`"
+        )
+    return "\n".join(lines)
+
 @app.on_callback_query(filters.regex("^admin_panel$"))
 @admin_only
 async def admin_panel_callback(client: Client, callback: CallbackQuery):
@@ -820,13 +967,17 @@ async def admin_panel_callback(client: Client, callback: CallbackQuery):
     ads = await db.get_ads()
     maintenance = await db.is_maintenance()
     enforcement = await db.get_enforcement_stats()
+    active_broadcasts = await db.get_broadcast_jobs(statuses=["running", "paused"])
+    staging_stats = admission.snapshot()
 
     admin_text = (
         "👑 **Admin Control Center**\n\n"
         "**System Status**\n"
         f"• Maintenance: {format_bool_badge(maintenance)}\n"
         f"• Ads: {format_bool_badge(ads.get('enabled', False))}\n"
-        f"• Enforcement: {'🛡 Aggressive' if enforcement['mode'] == 'aggressive' else '✅ Normal'}\n\n"
+        f"• Enforcement: {'🛡 Aggressive' if enforcement['mode'] == 'aggressive' else '✅ Normal'}\n"
+        f"• Broadcasts: `{len(active_broadcasts)}` active\n"
+        f"• Staging: {format_staging(staging_stats)}\n\n"
         "**Core Metrics**\n"
         f"• Users: `{bot_stats['total_users']}`\n"
         f"• Banned: `{bot_stats['banned_users']}`\n"
@@ -875,7 +1026,7 @@ async def admin_guide_callback(client: Client, callback: CallbackQuery):
         "4) Use **Safety Logs** daily for revocations/admin actions.\n\n"
         "**Fallback commands**\n"
         "• `/ban`, `/unban`, `/addfsub`, `/remfsub`, `/setad`, `/maintenance`\n"
-        "• `/analytics`, `/usernamefile`, `/export`"
+        "• `/analytics`, `/usernamefile`, `/export`, `/floodlimit`, `/bandwidth`"
     )
     buttons = [
         [InlineKeyboardButton("👑 Admin Home", callback_data="admin_panel")],
@@ -905,13 +1056,17 @@ async def broadcast_command(client: Client, message: Message):
     
     status_msg = await message.reply_text("📡 **Preparing broadcast...**")
     
-    await broadcast_message(
+    job = await broadcast_manager.start(
         client,
-        message.reply_to_message,
-        status_msg,
+        message.reply_to_message.chat.id,
+        message.reply_to_message.id,
+        status_msg.chat.id,
+        status_msg.id,
         forward=forward,
-        pin=pin
+        pin=pin,
+        created_by=message.from_user.id
     )
+    await log_admin_action(message.from_user.id, "broadcast_started", {"job_id": job["id"]})
 
 @app.on_callback_query(filters.regex("^admin_broadcast$"))
 @admin_only
@@ -920,7 +1075,7 @@ async def admin_broadcast_callback(client: Client, callback: CallbackQuery):
     text = (
         "📡 **Broadcast Wizard**\n\n"
         "**What this does:**\n"
-        "• Send one message to all users with guided confirmations.\n\n"
+        "• Send one message to all users, or a targeted segment, with guided confirmations.\n\n"
         "**Step 1/3:** Choose delivery mode."
     )
 
@@ -930,6 +1085,7 @@ async def admin_broadcast_callback(client: Client, callback: CallbackQuery):
             InlineKeyboardButton("↪️ Forward", callback_data="wiz_broadcast_mode:forward")
         ],
         [InlineKeyboardButton("📌 Copy + Pin", callback_data="wiz_broadcast_mode:pin")],
+        [InlineKeyboardButton("📋 Active Broadcasts", callback_data="admin_broadcast_jobs")],
         [InlineKeyboardButton("🧭 Guide", callback_data="admin_guide")],
         [InlineKeyboardButton("🔙 Back", callback_data="admin_panel")]
     ]
@@ -973,7 +1129,8 @@ async def wizard_broadcast_preview_callback(client: Client, callback: CallbackQu
             await msg.forward(callback.from_user.id)
         else:
             await msg.copy(callback.from_user.id)
-        await callback.answer("Preview delivered to your chat.")
+        recipients = await db.count_audience(data.get("audience"))
+        await callback.answer(f"Preview delivered to your chat. Recipients: {recipients}")
     except Exception as e:
         logger.error(f"Broadcast preview failed: {e}")
         await callback.answer("Preview failed. Send draft again.", show_alert=True)
@@ -992,48 +1149,29 @@ async def wizard_broadcast_confirm_callback(client: Client, callback: CallbackQu
         source_msg = await client.get_messages(source_chat, source_message)
         if not source_msg:
             raise ValueError("source message not found")
-        status_msg = await callback.message.reply_text("📡 Starting broadcast to all users...")
-        stats = await broadcast_message(
+        audience = data.get("audience") or {}
+        status_msg = await callback.message.reply_text(f"📡 Starting broadcast to {format_audience(audience)}...")
+        job = await broadcast_manager.start(
             client,
-            source_msg,
-            status_msg,
+            source_chat,
+            source_message,
+            status_msg.chat.id,
+            status_msg.id,
             forward=bool(data.get("forward")),
-            pin=bool(data.get("pin"))
+            pin=bool(data.get("pin")),
+            created_by=callback.from_user.id,
+            audience=audience
         )
         clear_admin_wizard_state(callback.from_user.id)
-        await log_admin_action(
-            callback.from_user.id,
-            "broadcast_sent",
-            {
-                "success": stats.success,
-                "failed": stats.failed,
-                "blocked": stats.blocked,
-                "deleted": stats.deleted,
-                "total": stats.total
-            }
-        )
-        await db.log_user_event(
-            callback.from_user.id,
-            "broadcast_report",
-            chat_id=callback.from_user.id,
-            metadata={
-                "success": stats.success,
-                "failed": stats.failed,
-                "blocked": stats.blocked,
-                "deleted": stats.deleted,
-                "total": stats.total
-            }
-        )
+        await log_admin_action(callback.from_user.id, "broadcast_started", {"job_id": job["id"], "audience": audience})
         await callback.message.edit_text(
-            "✅ **Broadcast Finished**\n\n"
-            f"👥 Total: `{stats.total}`\n"
-            f"✅ Success: `{stats.success}`\n"
-            f"❌ Failed: `{stats.failed}`\n"
-            f"🚫 Blocked: `{stats.blocked}`\n"
-            f"👻 Deleted: `{stats.deleted}`",
+            "✅ **Broadcast Started**\n\n"
+            f"🆔 Job: `#{job['id']}`\n"
+            f"🎯 Audience: {format_audience(audience)}\n"
+            "Progress is posted below and the job resumes automatically after restarts.",
             reply_markup=InlineKeyboardMarkup([
+                [InlineKeyboardButton("📋 Active Broadcasts", callback_data="admin_broadcast_jobs")],
                 [InlineKeyboardButton("📡 New Broadcast", callback_data="admin_broadcast")],
-                [InlineKeyboardButton("🛡 Safety Logs", callback_data="admin_safety_logs:0")],
                 [InlineKeyboardButton("🔙 Admin Home", callback_data="admin_panel")]
             ])
         )
@@ -1041,6 +1179,248 @@ async def wizard_broadcast_confirm_callback(client: Client, callback: CallbackQu
         logger.error(f"Broadcast execution failed: {e}")
         await callback.answer("Broadcast failed. Try again.", show_alert=True)
 
+async def render_broadcast_draft(data: dict):
+    audience = data.get("audience") or {}
+    recipients = await db.count_audience(audience)
+    text = (
+        "📡 **Broadcast Draft Ready**\n\n"
+        f"🎯 **Audience:** {format_audience(audience)}\n"
+        f"👥 **Recipients:** `{recipients}`\n\n"
+        "**Step 3/3:** Narrow the audience, preview, or send now."
+    )
+    markup = InlineKeyboardMarkup([
+        [InlineKeyboardButton("🎯 Choose Audience", callback_data="wiz_broadcast_audience")],
+        [InlineKeyboardButton("👀 Dry-run Preview", callback_data="wiz_broadcast_preview")],
+        [InlineKeyboardButton("✅ Confirm & Send", callback_data="wiz_broadcast_confirm")],
+        [InlineKeyboardButton("❌ Cancel", callback_data="wiz_cancel")]
+    ])
+    return text, markup
+
+async def render_broadcast_audience(data: dict):
+    audience = data.get("audience") or {}
+    recipients = await db.count_audience(audience)
+    text = (
+        "🎯 **Broadcast Audience**\n\n"
+        f"**Current:** {format_audience(audience)}\n"
+        f"👥 **Recipients:** `{recipients}`\n\n"
+        "Filters combine with AND. Tap a filter again to clear it."
+    )
+
+    def mark(selected: bool, label: str) -> str:
+        return f"✅ {label}" if selected else label
+
+    active_days = int(audience.get("active_days") or 0)
+    buttons = [
+        [
+            InlineKeyboardButton(mark(active_days == days, f"Active {days}d"), callback_data=f"wiz_baud:active:{days}")
+            for days in (7, 30, 90)
+        ],
+        [
+            InlineKeyboardButton(mark(bool(audience.get("premium")), "⭐ Premium"), callback_data="wiz_baud:premium"),
+            InlineKeyboardButton(mark(bool(audience.get("uploaders")), "📤 Uploaders"), callback_data="wiz_baud:uploaders")
+        ]
+    ]
+    languages = await db.get_language_counts(limit=6)
+    if languages:
+        language_buttons = [
+            InlineKeyboardButton(
+                mark(audience.get("language") == code, f"{code} ({count})"),
+                callback_data=f"wiz_baud:lang:{code}"
+            )
+            for code, count in languages
+        ]
+        buttons.extend(language_buttons[i:i + 3] for i in range(0, len(language_buttons), 3))
+    buttons.extend([
+        [InlineKeyboardButton(
+            mark(bool(audience.get("joined_after")), "📅 Joined after..."), callback_data="wiz_baud:joined"
+        )],
+        [
+            InlineKeyboardButton("♻️ Reset", callback_data="wiz_baud:reset"),
+            InlineKeyboardButton("✅ Done", callback_data="wiz_baud:done")
+        ]
+    ])
+    return text, InlineKeyboardMarkup(buttons)
+
+@app.on_callback_query(filters.regex("^wiz_broadcast_audience$"))
+@admin_only
+async def wizard_broadcast_audience_callback(client: Client, callback: CallbackQuery):
+    state = get_admin_wizard_state(callback.from_user.id)
+    if state.get("flow") != "broadcast" or state.get("step") != "preview":
+        await callback.answer("No pending broadcast draft found.", show_alert=True)
+        return
+    text, markup = await render_broadcast_audience(state.get("data", {}))
+    await callback.message.edit_text(text, reply_markup=markup)
+
+@app.on_callback_query(filters.regex(r"^wiz_baud:(active:\d+|premium|uploaders|lang:[\w-]+|joined|reset|done)$"))
+@admin_only
+async def wizard_broadcast_audience_set_callback(client: Client, callback: CallbackQuery):
+    state = get_admin_wizard_state(callback.from_user.id)
+    if state.get("flow") != "broadcast" or state.get("step") != "preview":
+        await callback.answer("No pending broadcast draft found.", show_alert=True)
+        return
+    data = state.get("data", {})
+    audience = dict(data.get("audience") or {})
+    option, _, value = callback.data.split(":", 1)[1].partition(":")
+
+    if option == "done":
+        text, markup = await render_broadcast_draft(data)
+        await callback.message.edit_text(text, reply_markup=markup)
+        return
+    if option == "joined":
+        if audience.pop("joined_after", None):
+            set_admin_wizard_state(callback.from_user.id, "broadcast", "preview", {**data, "audience": audience})
+        else:
+            set_admin_wizard_state(callback.from_user.id, "broadcast", "await_audience_joined", data)
+            await callback.message.edit_text(
+                "📅 **Joined After**\n\n"
+                "Send a date as `YYYY-MM-DD`, or type `skip` to go back.",
+                reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("❌ Cancel", callback_data="wiz_cancel")]])
+            )
+            return
+    elif option == "reset":
+        audience = {}
+    elif option == "active":
+        days = int(value)
+        if int(audience.get("active_days") or 0) == days:
+            audience.pop("active_days", None)
+        else:
+            audience["active_days"] = days
+    elif option == "lang":
+        if audience.get("language") == value:
+            audience.pop("language", None)
+        else:
+            audience["language"] = value
+    elif option in ("premium", "uploaders"):
+        if audience.get(option):
+            audience.pop(option, None)
+        else:
+            audience[option] = True
+
+    data = {**data, "audience": audience}
+    set_admin_wizard_state(callback.from_user.id, "broadcast", "preview", data)
+    text, markup = await render_broadcast_audience(data)
+    await callback.message.edit_text(text, reply_markup=markup)
+
+async def log_broadcast_report(job: dict):
+    """Record the outcome of a finished broadcast job in safety logs."""
+    stats = BroadcastStats.from_job(job)
+    report = {
+        "job_id": job["id"],
+        "status": job.get("status", ""),
+        "success": stats.success,
+        "failed": stats.failed,
+        "blocked": stats.blocked,
+        "deleted": stats.deleted,
+        "total": stats.total,
+        "audience": job.get("audience") or {},
+        "skipped_unreachable": int(job.get("skipped_unreachable", 0)),
+        "msgs_per_sec": round(stats.rate, 2)
+    }
+    admin_id = int(job.get("created_by") or OWNER_ID or 0)
+    await log_admin_action(admin_id, "broadcast_sent", report)
+    await db.log_user_event(admin_id, "broadcast_report", chat_id=admin_id, metadata=report)
+
+broadcast_manager.on_finished = log_broadcast_report
+
+def format_reachability(reach: dict) -> str:
+    text = (
+        "**Reachability**\n"
+        f"• Skipped users: `{reach.get('unreachable', 0)}` "
+        f"(🚫 blocked `{reach.get('blocked', 0)}` | 👻 deleted `{reach.get('deactivated', 0)}` | "
+        f"⚠️ failing `{reach.get('failing', 0)}`)\n"
+        f"• Sends avoided: `{reach.get('sends_avoided', 0)}`"
+    )
+    probe = reach.get("last_probe") or {}
+    if reachability_prober.is_running():
+        progress = reachability_prober.progress
+        text += f"\n• Re-probe running: `{progress.probed}/{progress.total}` • recovered `{progress.recovered}`"
+    elif probe:
+        text += (
+            f"\n• Last re-probe: {probe.get('status', '-')} • `{probe.get('probed', 0)}/{probe.get('total', 0)}` "
+            f"• recovered `{probe.get('recovered', 0)}` • `{str(probe.get('started_at', ''))[:16].replace('T', ' ')}`"
+        )
+    return text
+
+@app.on_callback_query(filters.regex("^admin_broadcast_jobs$"))
+@admin_only
+async def admin_broadcast_jobs_callback(client: Client, callback: CallbackQuery):
+    jobs = await db.get_broadcast_jobs()
+    active = [j for j in jobs if j.get("status") in ("running", "paused")]
+    recent = [j for j in jobs if j.get("status") not in ("running", "paused")][:5]
+    lines = []
+    buttons = []
+    for job in active:
+        stats = BroadcastStats.from_job(job)
+        percent = stats.processed / stats.total * 100 if stats.total else 0.0
+        badge = "▶️" if job["status"] == "running" else "⏸"
+        lines.append(
+            f"{badge} `#{job['id']}` {job['status']} • `{stats.processed}/{stats.total}` ({percent:.1f}%) "
+            f"• ✅ `{stats.success}` ❌ `{stats.failed}` • 🎯 {format_audience(job.get('audience'))}"
+        )
+        row = []
+        if job["status"] == "running":
+            row.append(InlineKeyboardButton(f"⏸ Pause #{job['id']}", callback_data=f"bcast_pause:{job['id']}"))
+        else:
+            row.append(InlineKeyboardButton(f"▶️ Resume #{job['id']}", callback_data=f"bcast_resume:{job['id']}"))
+        row.append(InlineKeyboardButton("⛔ Cancel", callback_data=f"bcast_cancel:{job['id']}"))
+        buttons.append(row)
+    if recent:
+        lines.append("\n**Recent:**")
+        for job in recent:
+            stats = BroadcastStats.from_job(job)
+            lines.append(
+                f"• `#{job['id']}` {job.get('status')} • ✅ `{stats.success}` ❌ `{stats.failed}` "
+                f"• `{str(job.get('created_at', ''))[:16].replace('T', ' ')}`"
+            )
+    text = (
+        "📋 **Broadcast Jobs**\n\n"
+        + ("\n".join(lines) if lines else "_No broadcasts yet._")
+        + "\n\n" + format_reachability(await db.get_reachability_stats())
+    )
+    if reachability_prober.is_running():
+        buttons.append([InlineKeyboardButton("⛔ Stop Re-probe", callback_data="admin_reach_probe:cancel")])
+    else:
+        buttons.append([InlineKeyboardButton("🔁 Re-probe Skipped Users", callback_data="admin_reach_probe:start")])
+    buttons.extend([
+        [InlineKeyboardButton("🔄 Refresh", callback_data="admin_broadcast_jobs")],
+        [InlineKeyboardButton("🔙 Back", callback_data="admin_broadcast")]
+    ])
+    await callback.message.edit_text(text, reply_markup=InlineKeyboardMarkup(buttons))
+
+@app.on_callback_query(filters.regex(r"^bcast_(pause|resume|cancel):[0-9a-f]+$"))
+@admin_only
+async def broadcast_job_control_callback(client: Client, callback: CallbackQuery):
+    action, job_id = callback.data[len("bcast_"):].split(":", 1)
+    if action == "pause":
+        ok = await broadcast_manager.pause(job_id)
+    elif action == "resume":
+        ok = await broadcast_manager.resume(client, job_id)
+    else:
+        ok = await broadcast_manager.cancel(job_id)
+    if ok:
+        await log_admin_action(callback.from_user.id, f"broadcast_{action}", {"job_id": job_id})
+        await callback.answer(f"Broadcast #{job_id}: {action} requested.", show_alert=True)
+    else:
+        await callback.answer("Job not found or not in a state for that action.", show_alert=True)
+    await admin_broadcast_jobs_callback(client, callback)
+
+@app.on_callback_query(filters.regex("^admin_reach_probe:(start|cancel)$"))
+@admin_only
+async def admin_reach_probe_callback(client: Client, callback: CallbackQuery):
+    action = callback.data.split(":")[1]
+    if action == "start":
+        if reachability_prober.start(client, requested_by=callback.from_user.id):
+            await log_admin_action(callback.from_user.id, "reachability_probe_started", {"rate": REACHABILITY_PROBE_RATE})
+            await callback.answer("Re-probing skipped users in the background.", show_alert=True)
+        else:
+            await callback.answer("A re-probe is already running.", show_alert=True)
+    else:
+        if reachability_prober.cancel():
+            await callback.answer("Re-probe will stop shortly.", show_alert=True)
+        else:
+            await callback.answer("No re-probe is running.", show_alert=True)
+    await admin_broadcast_jobs_callback(client, callback)
+
 # ----- USERS MANAGEMENT -----
 async def generate_users_export_file() -> tuple[str, int]:
     users = await db.get_all_users()
@@ -1489,6 +1869,18 @@ async def fsub_list_command(client: Client, message: Message):
     
     await message.reply_text(text, reply_markup=InlineKeyboardMarkup(buttons))
 
+def format_last_sweep(sweep: dict) -> str:
+    if fsub_sweeper.is_running():
+        progress = fsub_sweeper.progress
+        return f"🔄 running `{progress.checked}/{progress.total}`"
+    if not sweep:
+        return "_never_"
+    return (
+        f"`{str(sweep.get('started_at', ''))[:16].replace('T', ' ')}` {sweep.get('status', '?')} "
+        f"`{sweep.get('checked', 0)}/{sweep.get('total', 0)}` • revoked `{sweep.get('revoked', 0)}` "
+        f"• `{sweep.get('throughput', 0)}`/s"
+    )
+
 @app.on_callback_query(filters.regex(r"^admin_fsub(?::\d+)?$"))
 @admin_only
 async def admin_fsub_callback(client: Client, callback: CallbackQuery):
@@ -1512,6 +1904,7 @@ async def admin_fsub_callback(client: Client, callback: CallbackQuery):
         f"• Required Access: {format_bool_badge(is_enabled)}\n"
         f"• Enforcement Mode: {'🛡 Aggressive' if enforcement['mode'] == 'aggressive' else '✅ Normal'}\n"
         f"• Checks: `{enforcement['checks']}` | Fails: `{enforcement['failed_checks']}` | Revoked: `{enforcement['revoked_access']}`\n"
+        f"• Last Sweep: {format_last_sweep(enforcement.get('last_sweep', {}))}\n"
         f"• Channels: `{total}`\n\n"
         "**What this does:**\n"
         "• Keeps non-admin users in required channels before bot usage.\n"
@@ -1568,16 +1961,59 @@ async def toggle_enforcement_mode_callback(client: Client, callback: CallbackQue
     await callback.answer(f"Enforcement mode set to {new_mode.upper()}.", show_alert=True)
     await admin_fsub_callback(client, callback)
 
+def format_sweep_progress(progress) -> str:
+    percent = (progress.checked + progress.errors) / progress.total * 100 if progress.total else 100.0
+    return (
+        "🔄 **FSub Re-check Sweep**\n\n"
+        f"• Status: `{progress.status}` ({progress.trigger})\n"
+        f"• Progress: `{progress.checked + progress.errors}/{progress.total}` ({percent:.1f}%)\n"
+        f"• Passed: `{progress.passed}` | Failed: `{progress.failed}` | Revoked: `{progress.revoked}`\n"
+        f"• Errors: `{progress.errors}`\n"
+        f"• Throughput: `{progress.throughput:.2f}` users/s\n"
+        f"• Elapsed: `{progress.elapsed:.0f}s`"
+    )
+
+async def report_sweep_progress(status_msg: Message, progress, interval: float = 3.0):
+    """Keep the admin's panel message updated until the sweep finishes."""
+    last_text = ""
+    while True:
+        finished = not fsub_sweeper.is_running() or fsub_sweeper.progress is not progress
+        text = format_sweep_progress(progress)
+        if text != last_text:
+            buttons = [[InlineKeyboardButton("🔙 Back", callback_data="admin_fsub:0")]]
+            if not finished:
+                buttons.insert(0, [InlineKeyboardButton("⛔ Cancel Sweep", callback_data="fsub_recheck_cancel")])
+            try:
+                await rpc.edit_text(status_msg, text, reply_markup=InlineKeyboardMarkup(buttons))
+                last_text = text
+            except Exception as e:
+                logger.debug(f"Could not update sweep progress message: {e}")
+        if finished:
+            return
+        await asyncio.sleep(interval)
+
 @app.on_callback_query(filters.regex("^fsub_recheck_now$"))
 @admin_only
 async def fsub_recheck_now_callback(client: Client, callback: CallbackQuery):
-    await db.log_user_event(
-        callback.from_user.id,
-        "admin_action",
-        chat_id=callback.from_user.id,
-        metadata={"action": "manual_recheck_requested"}
-    )
-    await callback.answer("Manual re-check marker saved to safety logs.", show_alert=True)
+    if not await db.is_fsub_enabled():
+        await callback.answer("No FSub channels configured to re-check.", show_alert=True)
+        return
+    started = fsub_sweeper.start(client, trigger="manual", requested_by=callback.from_user.id)
+    if started:
+        await log_admin_action(callback.from_user.id, "manual_recheck_started")
+        await callback.answer("Re-check sweep started.")
+    else:
+        await callback.answer("A sweep is already running. Showing its progress.")
+    asyncio.create_task(report_sweep_progress(callback.message, fsub_sweeper.progress))
+
+@app.on_callback_query(filters.regex("^fsub_recheck_cancel$"))
+@admin_only
+async def fsub_recheck_cancel_callback(client: Client, callback: CallbackQuery):
+    if fsub_sweeper.cancel():
+        await log_admin_action(callback.from_user.id, "manual_recheck_cancelled")
+        await callback.answer("Cancelling sweep...", show_alert=True)
+    else:
+        await callback.answer("No sweep is running.", show_alert=True)
 
 @app.on_callback_query(filters.regex("^wiz_fsub_start$"))
 @admin_only
@@ -1907,6 +2343,103 @@ async def maintenance_command(client: Client, message: Message):
     else:
         await message.reply_text("❌ Use: `/maintenance on` or `/maintenance off`")
 
+@app.on_message(filters.command("floodlimit") & filters.private)
+@admin_only
+async def flood_limit_command(client: Client, message: Message):
+    args = message.text.split()
+    kinds = ", ".join(DEFAULT_FLOOD_LIMITS.keys())
+
+    if len(args) == 2 and args[1].lower() == "reset":
+        await db.reset_flood_limits()
+        flood_guard.configure(DEFAULT_FLOOD_LIMITS)
+        await log_admin_action(message.from_user.id, "flood_limits_reset")
+        await message.reply_text("✅ Flood limits reset to defaults.")
+        return
+
+    if len(args) >= 3:
+        kind = args[1].lower()
+        if kind not in DEFAULT_FLOOD_LIMITS:
+            await message.reply_text(f"❌ Unknown kind. Use one of: `{kinds}`")
+            return
+        try:
+            rate = float(args[2])
+            burst = int(args[3]) if len(args) >= 4 else max(1, int(rate))
+            if rate < 0 or burst < 1:
+                raise ValueError
+        except ValueError:
+            await message.reply_text("❌ Rate must be a number ≥ 0 and burst an integer ≥ 1.")
+            return
+        await db.set_flood_limit(kind, rate, burst)
+        flood_guard.configure(await db.get_flood_limits())
+        await log_admin_action(message.from_user.id, "flood_limit_set", {"kind": kind, "rate": rate, "burst": burst})
+        await message.reply_text(f"✅ `{kind}` limit set to `{rate}`/s, burst `{burst}`.")
+        return
+
+    snapshot = flood_guard.snapshot()
+    lines = [
+        f"• `{kind}`: " + (f"`{limit['rate']}`/s, burst `{limit['burst']}`" if limit["rate"] > 0 else "off")
+        + f" • dropped `{snapshot['dropped'].get(kind, 0)}`"
+        for kind, limit in snapshot["limits"].items()
+    ]
+    await message.reply_text(
+        "🚧 **Flood Guard**\n\n"
+        + "\n".join(lines)
+        + f"\n\n✅ Allowed: `{snapshot['allowed']}` | ⚠️ Warnings: `{snapshot['warnings']}`\n\n"
+        "Usage: `/floodlimit <kind> <rate> [burst]` (rate `0` disables) or `/floodlimit reset`\n"
+        f"Kinds: `{kinds}`"
+    )
+
+def format_rate(bytes_per_second: float) -> str:
+    return f"{bytes_per_second / MBPS:.1f} Mbps" if bytes_per_second > 0 else "unlimited"
+
+@app.on_message(filters.command("bandwidth") & filters.private)
+@admin_only
+async def bandwidth_command(client: Client, message: Message):
+    args = message.text.split()
+
+    if len(args) == 2 and args[1].lower() == "reset":
+        await db.reset_bandwidth_limits()
+        bandwidth.configure({})
+        await log_admin_action(message.from_user.id, "bandwidth_reset")
+        await message.reply_text("✅ Bandwidth limits reset to defaults.")
+        return
+
+    if len(args) == 3 and args[1].lower() in ("in", "out", "reserve"):
+        key = {"in": "ingress", "out": "egress", "reserve": "control_reserve"}[args[1].lower()]
+        try:
+            value = float(args[2].rstrip("%"))
+            if value < 0 or (key == "control_reserve" and value > 90):
+                raise ValueError
+        except ValueError:
+            await message.reply_text("❌ Use a number ≥ 0 (Mbps), or a reserve between 0 and 90 (%).")
+            return
+        if key == "control_reserve":
+            value = value / 100
+        await db.set_bandwidth_limit(key, value)
+        bandwidth.configure(await db.get_bandwidth_limits())
+        await log_admin_action(message.from_user.id, "bandwidth_set", {"key": key, "value": value})
+        await message.reply_text(f"✅ `{key}` set to `{args[2]}`.")
+        return
+
+    snapshot = bandwidth.snapshot()
+    lines = []
+    for direction, label in (("ingress", "⬇️ Downloads"), ("egress", "⬆️ Uploads")):
+        row = snapshot["directions"][direction]
+        lines.append(
+            f"{label}: `{format_rate(row['rate'])}` for transfers"
+            + (f" (link `{snapshot['limits'][direction]:g} Mbps`)" if snapshot["limits"][direction] else "")
+            + f"\n• Active: `{row['active']}`"
+            + (f" • share `{format_rate(row['share'])}` each" if row["share"] else "")
+            + f"\n• Moved: `{human_readable_size(row['bytes'])}` • throttled `{row['throttled_seconds']}s`"
+        )
+    await message.reply_text(
+        "📶 **Bandwidth Shaping**\n\n"
+        + "\n\n".join(lines)
+        + f"\n\n🛟 Control reserve: `{snapshot['limits']['control_reserve'] * 100:.0f}%` of each link\n\n"
+        "Usage: `/bandwidth in <Mbps>`, `/bandwidth out <Mbps>` (`0` = unlimited), "
+        "`/bandwidth reserve <percent>` or `/bandwidth reset`"
+    )
+
 @app.on_message(filters.command("setwelcome") & filters.private)
 @admin_only
 async def set_welcome_command(client: Client, message: Message):
@@ -2050,15 +2583,24 @@ async def admin_wizard_input_handler(client: Client, message: Message):
                 "source_message": message.id
             }
         )
-        await message.reply_text(
-            "📡 **Broadcast Draft Ready**\n\n"
-            "**Step 3/3:** Preview or send now.",
-            reply_markup=InlineKeyboardMarkup([
-                [InlineKeyboardButton("👀 Dry-run Preview", callback_data="wiz_broadcast_preview")],
-                [InlineKeyboardButton("✅ Confirm & Send", callback_data="wiz_broadcast_confirm")],
-                [InlineKeyboardButton("❌ Cancel", callback_data="wiz_cancel")]
-            ])
-        )
+        text, markup = await render_broadcast_draft(data)
+        await message.reply_text(text, reply_markup=markup)
+        return
+
+    if flow == "broadcast" and step == "await_audience_joined":
+        text = (message.text or "").strip()
+        audience = dict(data.get("audience") or {})
+        if text.lower() != "skip":
+            try:
+                datetime.strptime(text, "%Y-%m-%d")
+            except ValueError:
+                await message.reply_text("❌ Use the `YYYY-MM-DD` format, or type `skip`.")
+                return
+            audience["joined_after"] = text
+        data = {**data, "audience": audience}
+        set_admin_wizard_state(message.from_user.id, "broadcast", "preview", data)
+        text, markup = await render_broadcast_audience(data)
+        await message.reply_text(text, reply_markup=markup)
         return
 
     if flow == "ads":
@@ -2206,6 +2748,19 @@ async def admin_wizard_input_handler(client: Client, message: Message):
 async def admin_stats_detail_callback(client: Client, callback: CallbackQuery):
     stats = await db.get_bot_stats()
     enforcement = stats.get("enforcement", {})
+    governor = rpc.snapshot()
+    queue_depth = governor["queue_depth"]
+    reach = await db.get_reachability_stats()
+    writes = await db.get_write_stats()
+    flood = flood_guard.snapshot()
+    upload_cache = await db.get_upload_cache_stats()
+    staging_stats = admission.snapshot()
+    shaping = bandwidth.snapshot()
+    pipeline = transfer_pipeline.snapshot()
+    finalize = background.snapshot()
+    backups = await backup_dispatcher.snapshot()
+    accounts = gofile_pool.snapshot()
+    batches = batch_manager.snapshot()
     
     text = (
         "📊 **Detailed Statistics**\n\n"
@@ -2218,16 +2773,108 @@ async def admin_stats_detail_callback(client: Client, callback: CallbackQuery):
         f"📤 **Total Uploads:** {stats['total_uploads']}\n"
         f"💾 **Total Data:** {human_readable_size(stats['total_size'])}\n"
         f"📅 **Bot Started:** {stats['start_time'][:10]}\n\n"
+        f"📡 {format_reachability(reach)}\n\n"
+        "🗄 **Database Writes**\n"
+        f"• Per update: `{writes['writes_per_update']}` (unbatched `{writes['unbatched_writes_per_update']}`)\n"
+        f"• Saves avoided: `{writes['saves_avoided']}` | Deduped upserts: `{writes['deduped_upserts']}`\n\n"
+        "💽 **Staging Area**\n"
+        f"• {format_staging(staging_stats)}\n"
+        f"• Disk free: `{human_readable_size(staging_stats['disk_free'])}` | Jobs: `{staging_stats['active']}` | "
+        f"Waited: `{staging_stats['waited']}` | Rejected: `{staging_stats['rejected']}`\n"
+        f"• Janitor: last freed `{human_readable_size(staging.last_sweep.get('bytes', 0))}`\n\n"
+        f"🏭 **Transfer Pipeline** (`{pipeline['in_flight']}` in flight)\n"
+        f"{format_pipeline(pipeline)}\n"
+        f"• Open batches: `{batches['open']}` (`{batches['files']}` files)\n"
+        f"• Finalize tasks: `{finalize['running']}` running | `{finalize['retried']}` retried | `{finalize['failed']}` failed\n\n"
+        "📶 **Bandwidth**\n"
+        f"• Down `{format_rate(shaping['directions']['ingress']['rate'])}` ({shaping['directions']['ingress']['active']} active) | "
+        f"Up `{format_rate(shaping['directions']['egress']['rate'])}` ({shaping['directions']['egress']['active']} active)\n\n"
+        "🗃 **Backup Channel**\n"
+        f"• Pending: `{backups['pending']['url']}` URLs / `{backups['pending']['file']}` files / "
+        f"`{backups['pending']['upload']}` upload logs | Digest every `{backups['upload_interval']}s`\n"
+        f"• Sent: `{backups['sent']}` ({backups['digests']} digests, {backups['copies']} copies)\n"
+        f"• Retried: `{backups['retried']}` | Failed: `{backups['failed']}` | Dropped: `{backups['dropped']}`\n\n"
+        "🗂 **GoFile Accounts**\n"
+        f"{format_gofile_accounts(accounts)}\n\n"
+        "♻️ **Upload Dedup Cache**\n"
+        f"• Entries: `{upload_cache['entries']}` | Hit rate: `{upload_cache['hit_rate']}%` "
+        f"({upload_cache['hits']} hits / {upload_cache['misses']} misses)\n"
+        f"• Stale links: `{upload_cache['stale']}` | Evicted: `{upload_cache['evicted']}` | "
+        f"Saved: `{human_readable_size(upload_cache['bytes_saved'])}`\n\n"
+        "🚧 **Flood Guard**\n"
+        f"• Dropped: `{sum(flood['dropped'].values())}` | Warnings: `{flood['warnings']}` | Allowed: `{flood['allowed']}`\n\n"
+        "🚦 **Telegram RPC Governor**\n"
+        f"• Queued: reply `{queue_depth['user_reply']}` | edit `{queue_depth['status_edit']}` | "
+        f"backup `{queue_depth['backup_log']}` | broadcast `{queue_depth['broadcast']}`\n"
+        f"• In flight: `{governor['in_flight']}` | Errors: `{governor['errors']}`\n"
+        f"• FloodWaits: `{governor['flood_waits']}` (`{governor['flood_wait_seconds']}s`)"
+        f"{' | paused `' + str(governor['paused_for']) + 's`' if governor['paused_for'] else ''}\n\n"
         "📈 Use **Analytics** panel for daily/weekly/monthly/yearly trends."
     )
     
     buttons = [
         [InlineKeyboardButton("📈 Analytics", callback_data="admin_analytics")],
+        [
+            InlineKeyboardButton("⏱ Handler Latency", callback_data="admin_handlers"),
+            InlineKeyboardButton("🐢 Loop Lag", callback_data="admin_loop_lag")
+        ],
         [InlineKeyboardButton("🧭 Guide", callback_data="admin_guide")],
         [InlineKeyboardButton("🔙 Back", callback_data="admin_panel")]
     ]
     await callback.message.edit_text(text, reply_markup=InlineKeyboardMarkup(buttons))
 
+def format_latency(seconds: float) -> str:
+    return f"{seconds * 1000:.0f}ms" if seconds < 1 else f"{seconds:.2f}s"
+
+@app.on_callback_query(filters.regex("^admin_handlers$"))
+@admin_only
+async def admin_handlers_callback(client: Client, callback: CallbackQuery):
+    rows = list(handler_metrics.snapshot().items())[:12]
+    lines = []
+    for name, row in rows:
+        wall = row["wall"]
+        lines.append(
+            f"• `{name}` ×{row['calls']}"
+            f"{' ⚠️' + str(row['slow']) if row['slow'] else ''}\n"
+            f"  p50 `{format_latency(wall['p50'])}` p95 `{format_latency(wall['p95'])}` "
+            f"p99 `{format_latency(wall['p99'])}` • db p95 `{format_latency(row['db']['p95'])}` "
+            f"• rpc p95 `{format_latency(row['rpc']['p95'])}`"
+        )
+    text = (
+        "⏱ **Handler Latency** (slowest p95 first)\n\n"
+        + ("\n".join(lines) if lines else "_No handler runs recorded yet._")
+        + f"\n\n⚠️ = runs slower than `{HANDLER_SLOW_SECONDS}s`"
+    )
+    buttons = [
+        [InlineKeyboardButton("🔄 Refresh", callback_data="admin_handlers")],
+        [InlineKeyboardButton("🔙 Back", callback_data="admin_stats_detail")]
+    ]
+    await callback.message.edit_text(text, reply_markup=InlineKeyboardMarkup(buttons))
+
+@app.on_callback_query(filters.regex("^admin_loop_lag$"))
+@admin_only
+async def admin_loop_lag_callback(client: Client, callback: CallbackQuery):
+    snapshot = loop_monitor.snapshot()
+    lag = snapshot["lag"]
+    lines = [
+        f"• `{site['site']}`\n"
+        f"  ×{site['count']} • total `{format_latency(site['total'])}` • max `{format_latency(site['max'])}`"
+        for site in snapshot["top_sites"]
+    ]
+    text = (
+        "🐢 **Event Loop Lag**\n\n"
+        f"• p50 `{format_latency(lag['p50'])}` | p95 `{format_latency(lag['p95'])}` | "
+        f"p99 `{format_latency(lag['p99'])}` | max `{format_latency(lag['max'])}`\n"
+        f"• Stalls over `{format_latency(snapshot['threshold'])}`: `{snapshot['stalls']}`\n\n"
+        "**Top blocking call sites**\n"
+        + ("\n".join(lines) if lines else "_No stalls recorded._")
+    )
+    buttons = [
+        [InlineKeyboardButton("🔄 Refresh", callback_data="admin_loop_lag")],
+        [InlineKeyboardButton("🔙 Back", callback_data="admin_stats_detail")]
+    ]
+    await callback.message.edit_text(text, reply_markup=InlineKeyboardMarkup(buttons))
+
 def format_analytics_block(title: str, data: dict) -> str:
     return (
         f"**{title}**\n"
@@ -2301,29 +2948,12 @@ async def admin_analytics_callback(client: Client, callback: CallbackQuery):
 # ================== IMMEDIATE BACKUP ==================
 
 async def immediate_backup(client, message, is_url=False, url_text=None):
-    """Step 1: Immediately forward content to backup channel before processing."""
-    if not BACKUP_CHANNEL_ID:
-        return
-
+    """Step 1: Queue the request for the backup channel; the dispatcher sends it off the request path."""
     try:
-        user_info = (
-            f"#INCOMING_REQUEST\n"
-            f"👤 User: {message.from_user.first_name} (ID: `{message.from_user.id}`)\n"
-            f"🕒 Time: {get_current_time()}\n"
-        )
-
         if is_url:
-            await client.send_message(
-                BACKUP_CHANNEL_ID,
-                f"{user_info}🔗 **URL Source:**\n`{url_text}`"
-            )
+            await backup_dispatcher.submit_url(message, url_text)
         else:
-            await client.copy_message(
-                chat_id=BACKUP_CHANNEL_ID,
-                from_chat_id=message.chat.id,
-                message_id=message.id,
-                caption=f"{user_info}\n⬇️ **Original File Backup**"
-            )
+            await backup_dispatcher.submit_file(message)
     except Exception as e:
         logger.error(f"Immediate Backup Failed: {e}")
 
@@ -2357,15 +2987,87 @@ async def url_handler(client: Client, message: Message):
     # 1. IMMEDIATE BACKUP
     await immediate_backup(client, message, is_url=True, url_text=text)
 
-    msg = await message.reply_text(
+    flight_key = normalize_url(text)
+    if flight_key in URL_FLIGHTS:
+        msg = await rpc.reply_text(
+            message,
+            "🔗 **URL Detected!**\n\n"
+            "♻️ This link is already being processed for another user.\n"
+            "⏳ You'll get the same GoFile link as soon as it's ready."
+        )
+        URL_FLIGHTS[flight_key].append((message, msg))
+        url_requests_coalesced.inc()
+        return
+
+    msg = await rpc.reply_text(
+        message,
         "🔗 **URL Detected!**\n\n"
-        "🚀 Queued for High-Speed Processing...\n"
-        "⏳ Please wait..."
+        "🔎 Checking the link..."
     )
+
+    probe = await preflight.check(flight_key)
+    if probe.ok and probe.size and admission.quota and probe.size > admission.quota:
+        probe.rejection = "The file is larger than the bot's staging area."
+    if not probe.ok:
+        await rpc.edit_text(
+            msg,
+            f"❌ **Link Rejected**\n\n{probe.rejection}\n\n🔗 `{text[:100]}`",
+            priority=PRIORITY_USER_REPLY
+        )
+        try:
+            await db.log_user_event(
+                message.from_user.id,
+                "url_rejected",
+                chat_id=message.chat.id,
+                metadata={"reason": probe.rejection, "status": probe.status, "size": probe.size}
+            )
+        except Exception as e:
+            logger.error(f"Failed to log URL rejection event: {e}")
+        return
+
     if shutdown_in_progress:
-        await msg.edit_text("⚠️ Bot is restarting. Please send your request again in a moment.")
+        await rpc.edit_text(msg, "⚠️ Bot is restarting. Please send your request again in a moment.")
+        return
+    # Another request for this URL may have been queued while we probed.
+    if flight_key in URL_FLIGHTS:
+        URL_FLIGHTS[flight_key].append((message, msg))
+        url_requests_coalesced.inc()
+        await rpc.edit_text(
+            msg,
+            "🔗 **URL Detected!**\n\n"
+            "♻️ This link is already being processed for another user.\n"
+            "⏳ You'll get the same GoFile link as soon as it's ready."
+        )
         return
-    await download_queue.put(("url", text, message, msg))
+    # Register before any await: a concurrent request for this URL resumes from
+    # the same preflight task and must find the flight, not start its own.
+    URL_FLIGHTS[flight_key] = []
+
+    details = ""
+    if probe.file_name:
+        details += f"📄 **File:** `{probe.file_name}`\n"
+    if probe.size:
+        details += f"📦 **Size:** `{human_readable_size(probe.size)}`\n"
+    if details:
+        details += "\n"
+    try:
+        await rpc.edit_text(
+            msg,
+            "🔗 **URL Detected!**\n\n"
+            f"{details}"
+            "🚀 Queued for High-Speed Processing...\n"
+            "⏳ Please wait..."
+        )
+        await submit_transfer(TransferJob(client, "url", message, msg, url=text, probe=probe))
+    except BaseException:
+        # The job never reached the pipeline, so pipeline_job_done won't answer the followers.
+        followers = URL_FLIGHTS.pop(flight_key, [])
+        if followers:
+            await asyncio.gather(
+                *(finish_coalesced_request(client, f_message, f_status, None) for f_message, f_status in followers),
+                return_exceptions=True
+            )
+        raise
 
 # ================== FILE HANDLING ==================
 
@@ -2398,235 +3100,686 @@ async def file_handler(client: Client, message: Message):
     await immediate_backup(client, message, is_url=False)
 
     media = message.document or message.video or message.audio or message.photo
+
+    if message.media_group_id or batch_manager.session(message.from_user.id):
+        await add_to_batch(client, message, media)
+        return
     
     file_size = getattr(media, 'file_size', 0)
     file_name = getattr(media, 'file_name', 'file')
     
-    msg = await message.reply_text(
+    msg = await rpc.reply_text(
+        message,
         f"📁 **File Detected!**\n\n"
         f"📄 **Name:** `{file_name}`\n"
         f"📦 **Size:** `{human_readable_size(file_size)}`\n\n"
         f"🚀 Queued for High-Speed Processing..."
     )
     if shutdown_in_progress:
-        await msg.edit_text("⚠️ Bot is restarting. Please send your file again in a moment.")
+        await rpc.edit_text(msg, "⚠️ Bot is restarting. Please send your file again in a moment.")
         return
-    await download_queue.put(("file", media, message, msg))
+    await submit_transfer(TransferJob(client, "file", message, msg, media=media))
 
-# ================== QUEUE PROCESSOR ==================
+@app.on_message(filters.command("batch") & filters.private)
+async def batch_command(client: Client, message: Message):
+    if not await force_sub_check(client, message):
+        return
+    user_id = message.from_user.id
+    action = message.command[1].lower() if len(message.command) > 1 else ""
+    batch = batch_manager.session(user_id)
 
-async def queue_worker(client: Client, worker_number: int):
-    while True:
-        queued_task = await download_queue.get()
-        if queued_task is None:
-            download_queue.task_done()
-            break
+    if action == "start":
+        if batch is not None:
+            await message.reply_text(
+                f"📦 A batch is already open with `{len(batch.jobs)}` file(s).\n"
+                "Send more files, or /batch finish to upload them as one folder."
+            )
+            return
+        if shutdown_in_progress:
+            await message.reply_text("⚠️ Bot is restarting. Please try again in a moment.")
+            return
+        msg = await rpc.reply_text(message, "📦 **Batch Upload**\n\nSend your files now.")
+        batch = batch_manager.open_session(user_id, message.chat.id, msg)
+        await update_batch_status(batch)
+        return
 
-        type_ = queued_task[0]
+    if action in ("finish", "done"):
+        if batch is None:
+            await message.reply_text("❌ No open batch. Start one with `/batch start`.")
+            return
+        count = len(batch.jobs)
+        await batch.close()
+        if count:
+            await message.reply_text(
+                f"✅ Batch closed with `{count}` file(s).\nYou'll get one folder link when they are all uploaded."
+            )
+        return
 
-        try:
-            if type_ == "file":
-                await process_tg_file(client, *queued_task[1:])
-            elif type_ == "url":
-                await process_url_file(client, *queued_task[1:])
-        except Exception as e:
-            logger.error(f"Queue Worker {worker_number} Error: {e}")
-            try:
-                await queued_task[3].edit_text(f"❌ **Error:**\n`{str(e)}`")
-            except:
-                pass
-        finally:
-            download_queue.task_done()
+    await message.reply_text(
+        "📦 **Batch Uploads**\n\n"
+        "`/batch start` - collect the next files into one GoFile folder\n"
+        "`/batch finish` - upload them and get one link\n\n"
+        "Albums are batched automatically."
+    )
 
-# ================== FAST DOWNLOAD LOGIC ==================
+# ================== TRANSFER PIPELINE ==================
+
+class TransferJob:
+    """State carried by one request through the pipeline stages."""
+
+    def __init__(self, client, kind: str, message, status_msg, media=None, url: str = None, probe=None):
+        self.client = client
+        self.kind = kind  # "file" or "url"
+        self.message = message
+        self.status_msg = status_msg
+        self.media = media
+        self.url = url
+        self.probe = probe
+        self.flight_key = normalize_url(url) if url else None
+        self.file_name = ""
+        self.file_size = 0
+        self.file_path = ""
+        self.staging = None
+        self.reservation = None
+        self.cache_key = None
+        self.validators = None
+        self.source = ""
+        self.link = None
+        self.job_stats = {}
+        self.batch = None
+        self.error = ""
+        self.failed = False
+        self.started = time.perf_counter()
+
+    async def report_error(self, reason: str, text: str):
+        """Show a failure to the user; batch members keep it for the batch summary instead."""
+        self.error = reason
+        if self.status_msg is not None:
+            await rpc.edit_text(self.status_msg, text, priority=PRIORITY_USER_REPLY)
+
+    def release_staging(self):
+        """Free the reserved disk space and delete the job's staging directory."""
+        if self.reservation is not None:
+            admission.release(self.reservation)
+            self.reservation = None
+        if self.staging is not None:
+            self.staging.close()
+            self.staging = None
+
+def upload_cache_key(media) -> str:
+    """Content key for Telegram media: file_unique_id is stable across chats and re-sends."""
+    unique_id = getattr(media, "file_unique_id", None)
+    if not UPLOAD_CACHE_ENABLED or not unique_id:
+        return None
+    return f"{unique_id}:{int(getattr(media, 'file_size', 0) or 0)}"
 
-async def process_tg_file(client, media, message, status_msg):
-    file_name = getattr(media, "file_name", f"file_{message.id}_{int(time.time())}")
-    file_path = os.path.join(DOWNLOAD_DIR, file_name)
+async def gofile_link_alive(link: str):
+    """Check a GoFile download page still exists.
 
+    Returns None when GoFile cannot tell: the contents endpoint answers
+    `error-notPremium` for non-premium tokens, and network errors prove
+    nothing either way.
+    """
+    code = link.rstrip("/").rsplit("/", 1)[-1]
     try:
-        await status_msg.edit_text(
-            f"⬇️ **Downloading...**\n\n"
-            f"📄 **File:** `{file_name}`\n"
-            f"📦 **Size:** `{human_readable_size(media.file_size)}`\n"
-            f"⚡ **Mode:** Native Stream"
-        )
+        timeout = aiohttp.ClientTimeout(total=10)
+        async with aiohttp.ClientSession(timeout=timeout) as session:
+            async with session.get(f"{GOFILE_API_URL}/contents/{code}", headers=gofile_pool.primary.headers) as response:
+                if response.status == 404:
+                    return False
+                result = await response.json(content_type=None)
+                status = str(result.get("status", ""))
+                if "notFound" in status:
+                    return False
+                return True if status == "ok" else None
+    except Exception as e:
+        logger.warning(f"GoFile link check failed for {link}: {e}")
+        return None
 
-        await client.download_media(message, file_path)
+async def lookup_cached_upload(cache_key: str):
+    """Return a still-valid cached GoFile link for the key, or None."""
+    if not cache_key:
+        return None
+    entry = await db.get_cached_upload(cache_key)
+    if entry and UPLOAD_CACHE_REVALIDATE_AFTER > 0:
+        validated_at = datetime.fromisoformat(entry.get("validated_at") or entry["created_at"])
+        unverified_for = (datetime.now() - validated_at).total_seconds()
+        if unverified_for >= UPLOAD_CACHE_REVALIDATE_AFTER:
+            alive = await gofile_link_alive(entry["link"])
+            if alive:
+                await db.mark_cached_upload_validated(cache_key)
+            elif alive is False or unverified_for >= UPLOAD_CACHE_UNVERIFIED_TTL:
+                # Links GoFile will not vouch for are only trusted for UPLOAD_CACHE_UNVERIFIED_TTL.
+                logger.info(f"Cached GoFile link expired: {entry['link']}")
+                await db.record_upload_cache_lookup(cache_key, hit=False, stale=True)
+                return None
+    await db.record_upload_cache_lookup(cache_key, hit=entry is not None)
+    return entry
+
+def url_validators(etag: str, last_modified: str, content_length: int) -> dict:
+    """ETag/Last-Modified/Content-Length identifying one version of a URL's content.
+
+    Returns None when the server sent neither ETag nor Last-Modified, since
+    such a result cannot be safely reused.
+    """
+    if not etag and not last_modified:
+        return None
+    return {"etag": etag or "", "last_modified": last_modified or "", "content_length": int(content_length or 0)}
 
-        await upload_handler(
-            client, message, status_msg,
-            file_path, media.file_size,
-            file_name, "Telegram File"
+def url_file_name(url: str, probe=None) -> str:
+    try:
+        file_name = (probe.file_name if probe else "") or safe_file_name(
+            unquote(urlsplit(url).path.split("/")[-1]), "download.bin"
         )
     except Exception:
-        if os.path.exists(file_path):
-            try:
-                os.remove(file_path)
-            except OSError as cleanup_error:
-                logger.warning(f"Failed to remove tg file {file_path}: {cleanup_error}")
-        raise
-
-async def process_url_file(client, url, message, status_msg):
-    try:
-        file_name = url.split("/")[-1].split("?")[0]
-    except:
         file_name = "download.bin"
-
     if not file_name or len(file_name) > 100:
         file_name = f"url_file_{int(time.time())}.bin"
-        
-    file_path = os.path.join(DOWNLOAD_DIR, file_name)
+    return file_name
 
+def staging_wait_notice(status_msg):
+    """Admission wait callback telling the user their job is held for disk space."""
+    async def notify(size: int, stats: dict):
+        await status_edits.edit(
+            status_msg,
+            "⏳ **Waiting for disk space...**\n\n"
+            f"📦 **Needed:** `{human_readable_size(size)}`\n"
+            f"💽 **Staging:** `{human_readable_size(stats['reserved'])}` reserved of "
+            f"`{human_readable_size(stats['quota']) if stats['quota'] else 'unlimited'}`\n\n"
+            "Your job starts automatically once other transfers finish.",
+            force=True
+        )
+    return notify
+
+async def preflight_stage(job: TransferJob):
+    """Answer from the upload cache when possible, otherwise reserve staging space."""
+    if job.kind == "file":
+        media = job.media
+        job.file_name = safe_file_name(getattr(media, "file_name", None), f"file_{job.message.id}_{int(time.time())}")
+        job.file_size = media.file_size
+        job.source = "Telegram File"
+        # Batch members all go into the batch's folder, so a per-file cached link would not fit.
+        job.cache_key = None if job.batch else upload_cache_key(media)
+        cached = await lookup_cached_upload(job.cache_key)
+        if cached:
+            upload_cache_hits.inc(source="telegram")
+            job.link, job.source, job.job_stats = cached["link"], "Telegram File (cached)", {"cache_hit": True}
+            return "finalize"
+    else:
+        probe = job.probe
+        job.file_name = url_file_name(job.url, probe)
+        job.file_size = probe.size if probe else 0
+        job.source = "HTTP URL"
+        if UPLOAD_CACHE_ENABLED and probe is not None and probe.checked:
+            # Validators from the pre-flight probe let a cache hit skip the download entirely.
+            job.validators = url_validators(probe.etag, probe.last_modified, probe.size)
+            if job.validators:
+                job.cache_key = f"url:{job.flight_key}"
+                entry = await db.get_cached_upload(job.cache_key, max_age_seconds=URL_CACHE_TTL)
+                if entry and entry.get("validators") == job.validators:
+                    await db.record_upload_cache_lookup(job.cache_key, hit=True)
+                    upload_cache_hits.inc(source="url")
+                    job.link, job.file_name, job.file_size = entry["link"], entry["file_name"], entry["file_size"]
+                    job.source, job.job_stats = "HTTP URL (cached)", {"cache_hit": True}
+                    return "finalize"
+                await db.record_upload_cache_lookup(job.cache_key, hit=False, stale=entry is not None)
+
+    job.staging = staging.job().open()
+    job.file_path = job.staging.path(job.file_name)
+    job.reservation = await admission.reserve(
+        job.file_name, job.file_size, on_wait=staging_wait_notice(job.status_msg)
+    )
+    await status_edits.edit(job.status_msg, f"📥 **Starting download...**\n\n📄 **File:** `{job.file_name}`", force=True)
+    return "fetch"
+
+async def fetch_stage(job: TransferJob):
+    """Download the Telegram file or URL into the job's staging directory."""
+    started = time.perf_counter()
+    if job.kind == "file":
+        await fetch_tg_file(job)
+    elif not await fetch_url(job):
+        return None
+    job_phase_seconds.observe(time.perf_counter() - started, phase="download")
+    return "upload"
+
+async def fetch_tg_file(job: TransferJob):
+    header = (
+        f"⬇️ **Downloading...**\n\n"
+        f"📄 **File:** `{job.file_name}`\n"
+        f"📦 **Size:** `{human_readable_size(job.file_size)}`\n"
+        f"⚡ **Mode:** Native Stream\n\n"
+    )
+    await status_edits.edit(job.status_msg, header.rstrip(), force=True)
+
+    progress = TransferProgress(job.file_size)
+
+    async def on_download_progress(current, total):
+        received = current - progress.done
+        progress.update(current, total)
+        job.reservation.wrote(current)
+        # Pyrogram awaits this callback between chunks, so sleeping here paces the download.
+        await shaper.throttle(received)
+
+    async with ProgressReporter(job.status_msg, progress, lambda p: header + p.render()):
+        with bandwidth.transfer("ingress", job.file_name) as shaper:
+            await job.client.download_media(job.message, job.file_path, progress=on_download_progress)
+    downloaded_bytes.inc(progress.done, source="telegram")
+
+async def fetch_url(job: TransferJob) -> bool:
+    header = (
+        "⬇️ **Fast Downloading...**\n\n"
+        f"🔗 **URL:** `{job.url[:50]}...`\n"
+        "⏳ **Mode:** Optimized HTTP Stream\n\n"
+    )
+    await status_edits.edit(job.status_msg, header.rstrip(), force=True)
+
+    connector = aiohttp.TCPConnector(limit=None, ttl_dns_cache=300)
+    async with aiohttp.ClientSession(connector=connector) as session:
+        async with session.get(job.url, timeout=None) as response:
+            if response.status != 200:
+                await job.report_error(f"URL error {response.status}", f"❌ URL Error: {response.status}")
+                return False
+
+            if job.cache_key:
+                # Cache the result under what was actually downloaded, not what the probe saw.
+                job.validators = url_validators(
+                    response.headers.get("ETag", ""),
+                    response.headers.get("Last-Modified", ""),
+                    response.content_length
+                )
+            progress = TransferProgress(response.content_length or job.file_size)
+            async with ProgressReporter(job.status_msg, progress, lambda p: header + p.render()):
+                with bandwidth.transfer("ingress", job.file_name) as shaper:
+                    async with WriteBehindFile(job.file_path) as f:
+                        async for chunk in response.content.iter_chunked(CHUNK_SIZE):
+                            # Unknown or wrong Content-Length: grow the reservation before writing past it.
+                            job.reservation.ensure(progress.done + len(chunk))
+                            await f.write(chunk)
+                            progress.add(len(chunk))
+                            job.reservation.wrote(progress.done)
+                            downloaded_bytes.inc(len(chunk), source="url")
+                            await shaper.throttle(len(chunk))
+
+    disk_stats = f.stats()
+    logger.info(
+        f"Download of {job.file_name}: {disk_stats['bytes']} bytes written at {disk_stats['disk_mbps']} MB/s, "
+        f"blocked {disk_stats['blocked_seconds']}s on disk"
+    )
+    job.file_size = os.path.getsize(job.file_path)
+    job.reservation.reconcile(job.file_size)
+    job.job_stats = {"disk": disk_stats}
+    return True
+
+async def upload_stage(job: TransferJob):
+    """Upload the staged file to GoFile, then free its disk space."""
     try:
-        await status_msg.edit_text(
-            "⬇️ **Fast Downloading...**\n\n"
-            f"🔗 **URL:** `{url[:50]}...`\n"
-            "⏳ **Mode:** Optimized HTTP Stream"
+        header = (
+            "⬆️ **Uploading to GoFile...**\n\n"
+            f"📄 **File:** `{job.file_name}`\n"
+            f"📦 **Size:** `{human_readable_size(job.file_size)}`\n"
+            "🚀 **Optimized Buffer Active**\n\n"
         )
+        await status_edits.edit(job.status_msg, header.rstrip(), force=True)
+
+        account = folder_id = None
+        if job.batch is not None:
+            folder = await job.batch.ensure_folder(create_gofile_folder)
+            if folder:
+                account, folder_id = folder["account"], folder["id"]
+
+        progress = TransferProgress(job.file_size)
+        started = time.perf_counter()
+        async with ProgressReporter(job.status_msg, progress, lambda p: header + p.render()):
+            with bandwidth.transfer("egress", job.file_name) as shaper:
+                link = await upload_to_gofile(
+                    job.file_path, progress=progress, shaper=shaper, account=account, folder_id=folder_id
+                )
+        job_phase_seconds.observe(time.perf_counter() - started, phase="upload")
+    finally:
+        job.release_staging()
 
-        connector = aiohttp.TCPConnector(limit=None, ttl_dns_cache=300)
-        async with aiohttp.ClientSession(connector=connector) as session:
-            async with session.get(url, timeout=None) as response:
-                if response.status != 200:
-                    return await status_msg.edit_text(f"❌ URL Error: {response.status}")
-                
-                with open(file_path, "wb") as f:
-                    async for chunk in response.content.iter_chunked(CHUNK_SIZE):
-                        f.write(chunk)
-
-        final_size = os.path.getsize(file_path)
-        
-        await upload_handler(
+    if not link:
+        await job.report_error("upload failed", "❌ **Upload Failed.**\nGoFile servers might be busy.")
+        return None
+
+    uploaded_bytes.inc(job.file_size)
+    job.link = link
+    if job.cache_key:
+        await db.cache_upload(job.cache_key, link, job.file_name, job.file_size, validators=job.validators)
+    return "finalize"
+
+async def finalize_stage(job: TransferJob):
+    if job.batch is not None:
+        # The batch answers once for all its members.
+        await record_upload(job.client, job.message, job.link, job.file_name, job.file_size, job.source, job.job_stats)
+        return None
+    await finalize_upload(
+        job.client, job.message, job.status_msg,
+        job.link, job.file_name, job.file_size,
+        job.source, job.job_stats
+    )
+    return None
+
+async def pipeline_job_failed(job: TransferJob, stage: str, error: Exception):
+    job.failed = True
+    logger.error(f"Pipeline {stage} stage failed for {job.kind} job: {error}")
+    try:
+        await job.report_error(str(error), f"❌ **Error:**\n`{str(error)}`")
+    except Exception:
+        pass
+
+async def pipeline_job_done(job: TransferJob):
+    """Runs once per job however it ended: frees staging and answers coalesced requests."""
+    job.release_staging()
+    active_workers.dec()
+    jobs_total.inc(type=job.kind, result="error" if job.failed else ("completed" if job.link else "failed"))
+    job_phase_seconds.observe(time.perf_counter() - job.started, phase="total")
+    status_edits.forget(job.status_msg)
+
+    if job.flight_key:
+        followers = URL_FLIGHTS.pop(job.flight_key, [])
+        result = {"link": job.link, "file_name": job.file_name, "file_size": job.file_size} if job.link else None
+        if followers:
+            await asyncio.gather(
+                *(finish_coalesced_request(job.client, f_message, f_status, result) for f_message, f_status in followers),
+                return_exceptions=True
+            )
+    if job.batch is not None:
+        await job.batch.member_done(job)
+
+async def finish_coalesced_request(client, message, status_msg, result: dict):
+    try:
+        if not result:
+            await rpc.edit_text(
+                status_msg,
+                "❌ **Shared download failed.**\nPlease send the URL again in a moment.",
+                priority=PRIORITY_USER_REPLY
+            )
+            return
+        await finalize_upload(
             client, message, status_msg,
-            file_path, final_size,
-            file_name, "HTTP URL"
+            result["link"], result["file_name"], result["file_size"],
+            "HTTP URL (shared)",
+            job_stats={"coalesced": True}
         )
-    except Exception:
-        if os.path.exists(file_path):
-            try:
-                os.remove(file_path)
-            except OSError as cleanup_error:
-                logger.warning(f"Failed to remove url file {file_path}: {cleanup_error}")
-        raise
+    finally:
+        status_edits.forget(status_msg)
+
+async def submit_transfer(job: TransferJob):
+    active_workers.inc()
+    await transfer_pipeline.submit(job)
+
+transfer_pipeline = Pipeline(on_error=pipeline_job_failed, on_done=pipeline_job_done)
+transfer_pipeline.add_stage("preflight", preflight_stage, PIPELINE_PREFLIGHT_WORKERS)
+transfer_pipeline.add_stage("fetch", fetch_stage, PIPELINE_FETCH_WORKERS, queue_size=PIPELINE_HANDOFF_QUEUE)
+transfer_pipeline.add_stage("upload", upload_stage, PIPELINE_UPLOAD_WORKERS, queue_size=PIPELINE_HANDOFF_QUEUE)
+transfer_pipeline.add_stage("finalize", finalize_stage, PIPELINE_FINALIZE_WORKERS, queue_size=PIPELINE_HANDOFF_QUEUE)
 
-# ================== UPLOAD & FINAL LOGGING ==================
+# ================== BATCH UPLOADS ==================
+
+MAX_BATCH_SUMMARY_LENGTH = 3000
+
+async def add_to_batch(client, message, media):
+    """Albums and /batch sessions share one status message, one GoFile folder and one summary."""
+    user_id = message.from_user.id
+    batch = batch_manager.session(user_id)
+    if batch is None:
+        batch = batch_manager.media_group(message.media_group_id)
+        if batch is None:
+            batch = batch_manager.open_media_group(message.media_group_id, user_id, message.chat.id)
+            status_msg = None
+            try:
+                status_msg = await rpc.reply_text(
+                    message,
+                    "📦 **Album Detected!**\n\n🚀 Collecting the files for one batch upload..."
+                )
+            finally:
+                batch.set_status_msg(status_msg)
 
-async def upload_handler(client, message, status_msg, file_path, file_size, file_name, source):
+    if shutdown_in_progress:
+        await rpc.reply_text(message, "⚠️ Bot is restarting. Please send your file again in a moment.")
+        return
     try:
-        await status_msg.edit_text(
-            "⬆️ **Uploading to GoFile...**\n\n"
-            f"📄 **File:** `{file_name}`\n"
-            f"📦 **Size:** `{human_readable_size(file_size)}`\n"
-            "🚀 **Optimized Buffer Active**"
-        )
-        
-        link = await upload_to_gofile(file_path)
+        await batch.add(TransferJob(client, "file", message, None, media=media))
+    except BatchFull as e:
+        await rpc.reply_text(message, f"⚠️ {e}\nThis file was not added. Send /batch finish and start a new batch.")
+        return
+    await update_batch_status(batch)
 
-        if not link:
-            return await status_msg.edit_text("❌ **Upload Failed.**\nGoFile servers might be busy.")
+def batch_status_text(batch) -> str:
+    text = (
+        "📦 **Batch Upload**\n\n"
+        f"🗂 **Files:** `{len(batch.jobs)}`\n"
+        f"✅ **Done:** `{batch.finished}` | ⚡ **Active:** `{batch.running}` | ⏳ **Waiting:** `{len(batch.pending)}`"
+    )
+    if batch.origin == "command" and not batch.closed:
+        text += "\n\nSend more files, then /batch finish when you're done."
+    return text
 
-        # Update user stats
-        await db.update_user_stats(message.from_user.id, file_size)
-        try:
-            await db.log_user_event(
-                message.from_user.id,
-                "upload_complete",
-                chat_id=message.chat.id,
-                metadata={
-                    "file_name": file_name,
-                    "file_size": file_size,
-                    "source": source,
-                    "link": link
-                }
-            )
-        except Exception as e:
-            logger.error(f"Failed to log upload completion event: {e}")
-
-        # ================== 1. USER RESPONSE ==================
-        user_text = (
-            f"✅ **Upload Complete!**\n\n"
-            f"📄 **File:** `{file_name}`\n"
-            f"📦 **Size:** `{human_readable_size(file_size)}`\n"
-            f"📥 **Source:** {source}\n\n"
-            f"🔗 **Download Link:**\n{link}\n\n"
-            f"🔹**Powered By : @TOOLS_BOTS_KING **🔸"
+async def update_batch_status(batch):
+    if batch.status_msg is not None:
+        await status_edits.edit(batch.status_msg, batch_status_text(batch))
+
+async def send_batch_summary(batch):
+    if batch.status_msg is None:
+        return
+    if not batch.jobs:
+        await rpc.edit_text(batch.status_msg, "📦 Batch closed. No files were added.", priority=PRIORITY_USER_REPLY)
+        return
+
+    results = batch.results()
+    uploaded = [r for r in results if r["link"]]
+    folder = batch.folder if uploaded else None
+    lines = []
+    for index, result in enumerate(results):
+        if sum(len(line) + 1 for line in lines) > MAX_BATCH_SUMMARY_LENGTH:
+            lines.append(f"… and {len(results) - index} more")
+            break
+        if result["link"]:
+            line = f"✅ `{result['file_name']}` ({human_readable_size(result['file_size'])})"
+            if not folder:
+                line += f"\n{result['link']}"
+        else:
+            line = f"❌ `{result['file_name'] or 'file'}`: {result['error'] or 'failed'}"
+        lines.append(line)
+
+    text = (
+        f"{'✅' if len(uploaded) == len(results) else '⚠️'} **Batch Complete!**\n\n"
+        f"🗂 **Uploaded:** `{len(uploaded)}/{len(results)}` files\n"
+        f"📦 **Total Size:** `{human_readable_size(sum(r['file_size'] for r in uploaded))}`\n\n"
+    )
+    if folder:
+        text += f"🔗 **Folder Link:**\n{folder['link']}\n\n"
+    text += "\n".join(lines) + "\n\n🔹**Powered By : @TOOLS_BOTS_KING **🔸"
+
+    buttons = []
+    if folder:
+        buttons.append([InlineKeyboardButton("🔗 Open Folder", url=folder["link"])])
+    buttons.append([InlineKeyboardButton("📤 Upload Another", callback_data="go_start")])
+    try:
+        await status_edits.edit(
+            batch.status_msg,
+            text,
+            force=True,
+            priority=PRIORITY_USER_REPLY,
+            disable_web_page_preview=True,
+            reply_markup=InlineKeyboardMarkup(buttons)
         )
-        
-        buttons = [
-            [InlineKeyboardButton("🔗 Open Link", url=link)],
-            [InlineKeyboardButton("📤 Upload Another", callback_data="go_start")]
-        ]
-        
-        await status_msg.edit_text(
-            user_text, 
+    finally:
+        status_edits.forget(batch.status_msg)
+
+    await db.log_user_event(
+        batch.user_id,
+        "batch_complete",
+        chat_id=batch.chat_id,
+        metadata={
+            "origin": batch.origin,
+            "files": len(results),
+            "uploaded": len(uploaded),
+            "folder_link": folder["link"] if folder else "",
+            "folder_error": batch.folder_error
+        },
+        persist=False
+    )
+    background.spawn(f"Batch {batch.id}", {"save_event": db.save})
+
+batch_manager.configure(submit=submit_transfer, on_complete=send_batch_summary, on_progress=update_batch_status)
+
+# ================== FINAL LOGGING ==================
+
+async def finalize_upload(client, message, status_msg, link, file_name, file_size, source, job_stats: dict = None):
+    """Answer the user, then record the upload and log it to the backup channel in the background."""
+    # ================== 1. USER RESPONSE ==================
+    user_text = (
+        f"✅ **Upload Complete!**\n\n"
+        f"📄 **File:** `{file_name}`\n"
+        f"📦 **Size:** `{human_readable_size(file_size)}`\n"
+        f"📥 **Source:** {source}\n\n"
+        f"🔗 **Download Link:**\n{link}\n\n"
+        f"🔹**Powered By : @TOOLS_BOTS_KING **🔸"
+    )
+    
+    buttons = [
+        [InlineKeyboardButton("🔗 Open Link", url=link)],
+        [InlineKeyboardButton("📤 Upload Another", callback_data="go_start")]
+    ]
+    
+    try:
+        await status_edits.edit(
+            status_msg,
+            user_text,
+            force=True,
+            priority=PRIORITY_USER_REPLY,
             disable_web_page_preview=True,
             reply_markup=InlineKeyboardMarkup(buttons)
         )
+    except Exception as e:
+        logger.error(f"Failed to send upload result to user: {e}")
 
-        # ================== 2. BACKUP CHANNEL FINAL LOG ==================
-        if BACKUP_CHANNEL_ID:
-            user = message.from_user
-            log_text = (
-                f"#UPLOAD_COMPLETE\n\n"
-                f"👤 **User:** {user.first_name} (`{user.id}`)\n"
-                f"📛 **Username:** @{user.username if user.username else 'None'}\n"
-                f"📅 **Date:** {get_current_time()}\n"
-                f"📥 **Source:** {source}\n"
-                f"📄 **File:** `{file_name}`\n"
-                f"📦 **Size:** `{human_readable_size(file_size)}`\n"
-                f"🔗 **GoFile Link:** {link}"
-            )
-            
-            try:
-                await client.send_message(
-                    BACKUP_CHANNEL_ID,
-                    log_text,
-                    disable_web_page_preview=True
-                )
-            except Exception as e:
-                logger.error(f"Failed to send final log to backup: {e}")
+    # ================== 2. STATS, EVENTS & BACKUP LOG ==================
+    await record_upload(client, message, link, file_name, file_size, source, job_stats)
 
-    except Exception as e:
-        logger.error(f"Upload Handler Error: {e}")
-        await status_msg.edit_text(f"❌ **Critical Error:** {e}")
-    finally:
-        if os.path.exists(file_path):
-            os.remove(file_path)
+async def record_upload(client, message, link, file_name, file_size, source, job_stats: dict = None):
+    """Count the upload and log its event, then save and queue the backup log in the background."""
+    user = message.from_user
+    # In-memory updates run exactly once here; only steps that are safe to repeat are retried.
+    await db.update_user_stats(user.id, file_size, persist=False)
+    await db.log_user_event(
+        user.id,
+        "upload_complete",
+        chat_id=message.chat.id,
+        metadata={
+            "file_name": file_name,
+            "file_size": file_size,
+            "source": source,
+            "link": link,
+            **(job_stats or {})
+        },
+        persist=False
+    )
+    # None of these change what the user sees, so they run concurrently off the worker with retries.
+    steps = {"save_stats": db.save}
+    if BACKUP_CHANNEL_ID:
+        # Buffered into periodic #UPLOAD_COMPLETE digests instead of one channel post per upload.
+        upload_id = uuid.uuid4().hex[:12]
+        steps["backup_log"] = lambda: backup_dispatcher.submit_upload(
+            user, file_name, file_size, source, link, upload_id=upload_id
+        )
+    background.spawn(f"Finalize {file_name}", steps)
 
 # ================== GOFILE UPLOADER ==================
 
-async def upload_to_gofile(path):
+async def upload_to_gofile(path, progress: TransferProgress = None, shaper=None, account=None, folder_id: str = None):
+    """Upload to GoFile and return the download page, or None.
+
+    With `account` (and optionally `folder_id`) the upload stays on that
+    account, e.g. for a batch folder it owns; otherwise the pool picks.
+    """
     mime_type, _ = mimetypes.guess_type(path)
     if mime_type is None:
         mime_type = "application/octet-stream"
 
-    connector = aiohttp.TCPConnector(limit=None, ttl_dns_cache=300)
+    file_size = os.path.getsize(path)
+    if progress is None:
+        progress = TransferProgress(file_size)
 
-    for server in PRIORITIZED_SERVERS:
-        try:
-            url = f"https://{server}.gofile.io/uploadfile"
-            
-            async with aiohttp.ClientSession(connector=connector) as session:
-                with open(path, "rb") as f:
-                    data = aiohttp.FormData()
-                    data.add_field('file', f, filename=os.path.basename(path), content_type=mime_type)
-                    data.add_field('token', GOFILE_API_TOKEN)
-                    
-                    if GOFILE_FOLDER_ID:
-                        data.add_field('folderId', GOFILE_FOLDER_ID)
-
-                    async with session.post(url, data=data) as response:
-                        if response.status == 200:
-                            result = await response.json()
-                            if result.get("status") == "ok":
+    if GOFILE_UPLOAD_URL:
+        servers = [("custom", GOFILE_UPLOAD_URL)]
+    else:
+        servers = [(server, f"https://{server}.gofile.io/uploadfile") for server in PRIORITIZED_SERVERS]
+
+    connector = aiohttp.TCPConnector(limit=None, ttl_dns_cache=300)
+    async with aiohttp.ClientSession(connector=connector) as session:
+        # Least loaded healthy account first; an auth or quota failure moves on to the next account.
+        for candidate in ([account] if account is not None else gofile_pool.ranked()):
+            folder = folder_id or candidate.folder_id
+            with gofile_pool.lease(candidate):
+                for server, url in servers:
+                    try:
+                        progress.update(0)
+                        data = aiohttp.FormData()
+                        data.add_field(
+                            'file', FileUploadPayload(path, progress, shaper=shaper, content_type=mime_type),
+                            filename=os.path.basename(path), content_type=mime_type
+                        )
+                        if candidate.token:
+                            data.add_field('token', candidate.token)
+                        if folder:
+                            data.add_field('folderId', folder)
+
+                        async with session.post(url, data=data, headers=candidate.headers) as response:
+                            try:
+                                result = await response.json(content_type=None)
+                            except Exception:
+                                result = {}
+                            if response.status == 200 and result.get("status") == "ok":
+                                gofile_uploads.inc(server=server, result="success")
+                                gofile_pool.report_success(candidate, file_size)
+                                await db.record_gofile_upload(candidate.id, file_size, persist=False)
                                 return result["data"]["downloadPage"]
-        except Exception as e:
-            logger.error(f"Server {server} failed: {e}")
-            continue
-            
+                            api_status = str(result.get("status", "")) if isinstance(result, dict) else ""
+                            failure = classify_failure(response.status, api_status)
+                            detail = f"HTTP {response.status} {api_status}".strip()
+                    except Exception as e:
+                        failure, detail = "error", str(e)
+                    gofile_uploads.inc(server=server, result="error")
+                    logger.error(f"Server {server} failed for account {candidate.id}: {detail}")
+                    if gofile_pool.report_failure(candidate, failure, detail):
+                        break
+
     return None
 
+async def create_gofile_folder() -> dict:
+    """Create a public folder for a batch inside the least loaded account's folder."""
+    account = gofile_pool.primary
+    if not account.token or not account.folder_id:
+        raise RuntimeError("batch folders need a GoFile account token and folder id")
+    timeout = aiohttp.ClientTimeout(total=20)
+    async with aiohttp.ClientSession(timeout=timeout) as session:
+        async with session.post(
+            f"{GOFILE_API_URL}/contents/createFolder",
+            json={"parentFolderId": account.folder_id},
+            headers=account.headers
+        ) as response:
+            result = await response.json(content_type=None)
+        if result.get("status") != "ok":
+            raise RuntimeError(f"createFolder returned {result.get('status')}")
+        folder = result["data"]
+        # New folders are private; the batch link has to open for the user.
+        async with session.put(
+            f"{GOFILE_API_URL}/contents/{folder['id']}/update",
+            json={"attribute": "public", "attributeValue": "true"},
+            headers=account.headers
+        ) as response:
+            result = await response.json(content_type=None)
+        if result.get("status") != "ok":
+            logger.warning(f"Could not make GoFile folder {folder['id']} public: {result.get('status')}")
+    return {
+        "id": folder["id"],
+        "link": f"https://gofile.io/d/{folder.get('code') or folder['id']}",
+        "account": account
+    }
+
 # ================== WEB SERVER (RENDER KEEP-ALIVE) ==================
 
 async def web_handler(request):
@@ -2657,7 +3810,39 @@ async def admin_dashboard_data_handler(request):
         "summary": summary,
         "series_30d": daily_series,
         "storage": storage_summary,
-        "bot_stats": bot_stats
+        "bot_stats": bot_stats,
+        "rpc": rpc.snapshot(),
+        "db_writes": await db.get_write_stats(),
+        "upload_cache": await db.get_upload_cache_stats(),
+        "staging": admission.snapshot(),
+        "bandwidth": bandwidth.snapshot(),
+        "preflight": preflight.snapshot(),
+        "pipeline": transfer_pipeline.snapshot(),
+        "finalize": background.snapshot(),
+        "backup": await backup_dispatcher.snapshot(),
+        "gofile_accounts": gofile_pool.snapshot(),
+        "batches": batch_manager.snapshot()
+    })
+
+async def metrics_handler(request):
+    if METRICS_TOKEN:
+        auth = request.headers.get("Authorization", "")
+        if request.query.get("token", "") != METRICS_TOKEN and auth != f"Bearer {METRICS_TOKEN}":
+            return web.Response(status=401, text="Unauthorized")
+    return web.Response(
+        text=metrics.render(),
+        content_type="text/plain",
+        charset="utf-8",
+        headers={"X-Content-Type-Options": "nosniff"}
+    )
+
+async def admin_handlers_data_handler(request):
+    if not dashboard_access_granted(request):
+        return web.json_response({"ok": False, "error": "Unauthorized"}, status=401)
+    return web.json_response({
+        "ok": True,
+        "slow_threshold_seconds": HANDLER_SLOW_SECONDS,
+        "handlers": handler_metrics.snapshot()
     })
 
 def build_dashboard_html() -> str:
@@ -2772,6 +3957,8 @@ async def start_web():
     appw.router.add_get("/", web_handler)
     appw.router.add_get("/admin/dashboard", admin_dashboard_handler)
     appw.router.add_get("/admin/dashboard/data", admin_dashboard_data_handler)
+    appw.router.add_get("/admin/handlers", admin_handlers_data_handler)
+    appw.router.add_get("/metrics", metrics_handler)
     runner = web.AppRunner(appw)
     await runner.setup()
     await web.TCPSite(
@@ -2785,22 +3972,46 @@ async def main():
     global shutdown_in_progress
     print("🤖 Bot Starting with uvloop optimization...")
     await db.get_username_export_file_path()
+    reclaimed = await staging.reclaim_orphans()
+    if reclaimed["files"]:
+        print(f"🧹 Reclaimed {reclaimed['files']} orphaned staging file(s), {human_readable_size(reclaimed['bytes'])} freed.")
+    flood_guard.configure(await db.get_flood_limits())
+    bandwidth.configure(await db.get_bandwidth_limits())
+    gofile_pool.load(await db.get_gofile_account_stats())
+    print(f"🗂 GoFile account pool: {len(gofile_pool.accounts)} account(s).")
+    instrument_database(db)
     await app.start()
+    instrument_client(app)
+    print(f"⏱ Instrumented {handler_metrics.instrument_dispatcher(app)} handlers.")
     await ensure_default_fsub_channel(app)
     await seed_admin_channels(app)
-    for i in range(MAX_CONCURRENT_QUEUE_WORKERS):
-        queue_worker_tasks.append(asyncio.create_task(queue_worker(app, i)))
-    print(f"⚙️ Started {MAX_CONCURRENT_QUEUE_WORKERS} concurrent queue workers.")
+    fsub_sweeper.start_periodic(app)
+    backup_dispatcher.start(app)
+    staging.start_periodic()
+    resumed_broadcasts = await broadcast_manager.resume_all(app)
+    if resumed_broadcasts:
+        print(f"📡 Resumed {resumed_broadcasts} interrupted broadcast job(s).")
+    transfer_pipeline.start()
+    print(
+        "⚙️ Started transfer pipeline: "
+        + ", ".join(f"{name} x{stage.workers}" for name, stage in transfer_pipeline.stages.items())
+    )
+    loop_monitor.start()
     print("✅ Bot Connected to Telegram")
     print("🌍 Starting Web Server...")
     await start_web()
     print("🚀 High Speed Pipeline Ready. Waiting for requests.")
     await idle()
     shutdown_in_progress = True
-    await download_queue.join()
-    for _ in queue_worker_tasks:
-        await download_queue.put(None)
-    await asyncio.gather(*queue_worker_tasks, return_exceptions=True)
+    await fsub_sweeper.stop()
+    await broadcast_manager.stop()
+    await reachability_prober.stop()
+    await loop_monitor.stop()
+    await staging.stop()
+    await transfer_pipeline.join()
+    await transfer_pipeline.stop()
+    await background.drain(timeout=30)
+    await backup_dispatcher.stop(app)
     await app.stop()
 
 if __name__ == "__main__":
@@ -8,6 +8,7 @@ API_HASH = os.environ.get("API_HASH", "")
 BOT_TOKEN = os.environ.get("BOT_TOKEN", "")
 GOFILE_API_TOKEN = os.environ.get("GOFILE_API_TOKEN", "")
 GOFILE_FOLDER_ID = os.environ.get("GOFILE_FOLDER_ID", "")
+GOFILE_ACCOUNTS = os.environ.get("GOFILE_ACCOUNTS", "")  # "token:folder_id,token2:folder_id2"; overrides the two above
 
 # Helper to fix Channel IDs
 def sanitize_channel_id(value):
@@ -44,6 +45,112 @@ OWNER_ID = int(os.environ.get("OWNER_ID", ADMIN_IDS[0] if ADMIN_IDS else 0))
 # LIMITS
 MAX_FILE_SIZE = 50 * 1024 * 1024 * 1024  # 50GB
 CHUNK_SIZE = 4 * 1024 * 1024  # 4MB
+DISK_WRITE_BUFFER = int(os.environ.get("DISK_WRITE_BUFFER", 16 * 1024 * 1024))  # write-behind buffer per download
+DISK_IO_WORKERS = int(os.environ.get("DISK_IO_WORKERS", 4))  # threads dedicated to download writes
+PROGRESS_EDIT_INTERVAL = float(os.environ.get("PROGRESS_EDIT_INTERVAL", 5))  # seconds between progress edits
+
+# TRANSFER PIPELINE (workers per stage; hand-off queues between stages are bounded)
+PIPELINE_PREFLIGHT_WORKERS = int(os.environ.get("PIPELINE_PREFLIGHT_WORKERS", 4))
+PIPELINE_FETCH_WORKERS = int(os.environ.get("PIPELINE_FETCH_WORKERS", 5))
+PIPELINE_UPLOAD_WORKERS = int(os.environ.get("PIPELINE_UPLOAD_WORKERS", 5))
+PIPELINE_FINALIZE_WORKERS = int(os.environ.get("PIPELINE_FINALIZE_WORKERS", 4))
+PIPELINE_HANDOFF_QUEUE = int(os.environ.get("PIPELINE_HANDOFF_QUEUE", 2))
+FINALIZE_RETRIES = int(os.environ.get("FINALIZE_RETRIES", 3))  # retries for post-upload stats/event/backup writes
+FINALIZE_RETRY_DELAY = float(os.environ.get("FINALIZE_RETRY_DELAY", 2))  # seconds, doubled on each retry
+
+# STAGING AREA ADMISSION (bytes; a quota of 0 only enforces STAGING_MIN_FREE)
+STAGING_QUOTA = int(float(os.environ.get("STAGING_QUOTA_GB", 20)) * 1024 ** 3)
+STAGING_MIN_FREE = int(float(os.environ.get("STAGING_MIN_FREE_MB", 512)) * 1024 ** 2)  # disk space always left free
+STAGING_UNKNOWN_SIZE_RESERVE = int(float(os.environ.get("STAGING_UNKNOWN_SIZE_RESERVE_MB", 512)) * 1024 ** 2)  # URLs without Content-Length
+STAGING_SWEEP_INTERVAL = int(os.environ.get("STAGING_SWEEP_INTERVAL", 3600))  # seconds; 0 disables the periodic sweep
+STAGING_MAX_AGE_HOURS = float(os.environ.get("STAGING_MAX_AGE_HOURS", 12))  # leftovers older than this are removed
+
+# BANDWIDTH SHAPING (megabits per second of link capacity; 0 = unlimited)
+BANDWIDTH_INGRESS_MBPS = float(os.environ.get("BANDWIDTH_INGRESS_MBPS", 0))
+BANDWIDTH_EGRESS_MBPS = float(os.environ.get("BANDWIDTH_EGRESS_MBPS", 0))
+BANDWIDTH_CONTROL_RESERVE = float(os.environ.get("BANDWIDTH_CONTROL_RESERVE", 0.1))  # share kept free for Telegram control traffic
+
+# URL PRE-FLIGHT
+PREFLIGHT_TIMEOUT = float(os.environ.get("PREFLIGHT_TIMEOUT", 15))  # seconds for the HEAD / ranged GET probe
+PREFLIGHT_CACHE_TTL = int(os.environ.get("PREFLIGHT_CACHE_TTL", 300))  # seconds a probe result is reused per URL
+PREFLIGHT_REJECT_HTML = os.environ.get("PREFLIGHT_REJECT_HTML", "true").lower() in ("1", "true", "yes", "on")
+
+# FSUB RE-VERIFICATION SWEEPER
+FSUB_SWEEP_INTERVAL = int(os.environ.get("FSUB_SWEEP_INTERVAL", 1800))  # seconds, aggressive mode only
+FSUB_SWEEP_ACTIVE_DAYS = int(os.environ.get("FSUB_SWEEP_ACTIVE_DAYS", 7))
+FSUB_SWEEP_MAX_USERS = int(os.environ.get("FSUB_SWEEP_MAX_USERS", 5000))
+FSUB_SWEEP_BATCH_SIZE = int(os.environ.get("FSUB_SWEEP_BATCH_SIZE", 10))
+FSUB_SWEEP_RATE = float(os.environ.get("FSUB_SWEEP_RATE", 5))  # users per second
+
+# TELEGRAM RPC GOVERNOR (calls per second)
+RPC_SEND_RATE = float(os.environ.get("RPC_SEND_RATE", 25))
+RPC_EDIT_RATE = float(os.environ.get("RPC_EDIT_RATE", 20))
+RPC_MEMBER_RATE = float(os.environ.get("RPC_MEMBER_RATE", 20))
+RPC_PRIVATE_CHAT_RATE = float(os.environ.get("RPC_PRIVATE_CHAT_RATE", 1))
+RPC_GROUP_CHAT_RATE = float(os.environ.get("RPC_GROUP_CHAT_RATE", 20 / 60))
+RPC_FLOODWAIT_RETRIES = int(os.environ.get("RPC_FLOODWAIT_RETRIES", 2))
+
+# BROADCAST
+BROADCAST_WORKERS = int(os.environ.get("BROADCAST_WORKERS", 20))
+BROADCAST_RATE = float(os.environ.get("BROADCAST_RATE", 20))  # messages per second, below RPC_SEND_RATE
+BROADCAST_PROGRESS_INTERVAL = float(os.environ.get("BROADCAST_PROGRESS_INTERVAL", 10))  # seconds
+BROADCAST_CHECKPOINT_EVERY = int(os.environ.get("BROADCAST_CHECKPOINT_EVERY", 100))  # sends between saves
+BROADCAST_THROTTLE_RETRIES = int(os.environ.get("BROADCAST_THROTTLE_RETRIES", 3))  # extra passes for users skipped on FloodWait
+
+# RECIPIENT REACHABILITY
+REACHABILITY_MAX_FAILURES = int(os.environ.get("REACHABILITY_MAX_FAILURES", 3))  # consecutive failed sends before skipping
+REACHABILITY_PROBE_RATE = float(os.environ.get("REACHABILITY_PROBE_RATE", 2))  # dormant users re-probed per second
+
+# FLOOD GUARD (updates per second per user, burst; rate 0 disables a limit)
+FLOOD_URL_RATE = float(os.environ.get("FLOOD_URL_RATE", 0.2))
+FLOOD_URL_BURST = int(os.environ.get("FLOOD_URL_BURST", 3))
+FLOOD_FILE_RATE = float(os.environ.get("FLOOD_FILE_RATE", 0.2))
+FLOOD_FILE_BURST = int(os.environ.get("FLOOD_FILE_BURST", 5))
+FLOOD_COMMAND_RATE = float(os.environ.get("FLOOD_COMMAND_RATE", 1))
+FLOOD_COMMAND_BURST = int(os.environ.get("FLOOD_COMMAND_BURST", 5))
+FLOOD_TEXT_RATE = float(os.environ.get("FLOOD_TEXT_RATE", 0.5))
+FLOOD_TEXT_BURST = int(os.environ.get("FLOOD_TEXT_BURST", 5))
+FLOOD_CALLBACK_RATE = float(os.environ.get("FLOOD_CALLBACK_RATE", 2))
+FLOOD_CALLBACK_BURST = int(os.environ.get("FLOOD_CALLBACK_BURST", 8))
+FLOOD_GLOBAL_RATE = float(os.environ.get("FLOOD_GLOBAL_RATE", 30))  # all users combined
+FLOOD_GLOBAL_BURST = int(os.environ.get("FLOOD_GLOBAL_BURST", 60))
+FLOOD_WARN_WINDOW = int(os.environ.get("FLOOD_WARN_WINDOW", 30))  # seconds between warnings to one user
+
+# HANDLER INSTRUMENTATION
+HANDLER_SLOW_SECONDS = float(os.environ.get("HANDLER_SLOW_SECONDS", 2))  # log handlers slower than this
+
+# EVENT LOOP MONITOR
+LOOP_MONITOR_INTERVAL = float(os.environ.get("LOOP_MONITOR_INTERVAL", 0.1))  # heartbeat period, seconds
+LOOP_LAG_THRESHOLD = float(os.environ.get("LOOP_LAG_THRESHOLD", 0.25))  # lag that counts as a blocking stall
+
+# PROMETHEUS METRICS (/metrics is open when no token is set)
+METRICS_TOKEN = os.environ.get("METRICS_TOKEN", "")
+
+# UPLOAD DEDUP CACHE (Telegram file_unique_id + size -> GoFile link)
+UPLOAD_CACHE_ENABLED = os.environ.get("UPLOAD_CACHE_ENABLED", "true").lower() in ("1", "true", "yes", "on")
+UPLOAD_CACHE_MAX_ENTRIES = int(os.environ.get("UPLOAD_CACHE_MAX_ENTRIES", 5000))  # least recently used evicted first
+UPLOAD_CACHE_MAX_AGE_DAYS = int(os.environ.get("UPLOAD_CACHE_MAX_AGE_DAYS", 30))
+UPLOAD_CACHE_REVALIDATE_AFTER = int(os.environ.get("UPLOAD_CACHE_REVALIDATE_AFTER", 86400))  # seconds; 0 disables link checks
+UPLOAD_CACHE_UNVERIFIED_TTL = int(os.environ.get("UPLOAD_CACHE_UNVERIFIED_TTL", 259200))  # seconds a link is reused when GoFile cannot confirm it
+URL_CACHE_TTL = int(os.environ.get("URL_CACHE_TTL", 21600))  # seconds a URL result is reused while its ETag/Last-Modified match
+
+# BATCH UPLOADS (albums and /batch sessions go into one GoFile folder)
+BATCH_PARALLELISM = int(os.environ.get("BATCH_PARALLELISM", 3))  # members of one batch transferring at once
+BATCH_GROUP_WINDOW = float(os.environ.get("BATCH_GROUP_WINDOW", 3))  # seconds to wait for more album parts
+BATCH_SESSION_TIMEOUT = int(os.environ.get("BATCH_SESSION_TIMEOUT", 600))  # idle seconds before /batch closes itself
+BATCH_MAX_FILES = int(os.environ.get("BATCH_MAX_FILES", 50))
+
+# BACKUP CHANNEL DISPATCHER (incoming requests are logged off the request path)
+BACKUP_DIGEST_INTERVAL = float(os.environ.get("BACKUP_DIGEST_INTERVAL", 60))  # seconds between URL digest messages
+BACKUP_DIGEST_MAX_ITEMS = int(os.environ.get("BACKUP_DIGEST_MAX_ITEMS", 25))  # URLs per digest message
+BACKUP_COPY_RATE = float(os.environ.get("BACKUP_COPY_RATE", 0.5))  # file copies per second
+BACKUP_MAX_ATTEMPTS = int(os.environ.get("BACKUP_MAX_ATTEMPTS", 5))
+BACKUP_QUEUE_MAX_ITEMS = int(os.environ.get("BACKUP_QUEUE_MAX_ITEMS", 5000))  # oldest entries dropped beyond this
+UPLOAD_LOG_DIGEST_INTERVAL = float(os.environ.get("UPLOAD_LOG_DIGEST_INTERVAL", 60))  # seconds between #UPLOAD_COMPLETE digests
+UPLOAD_LOG_DIGEST_MAX_ITEMS = int(os.environ.get("UPLOAD_LOG_DIGEST_MAX_ITEMS", 20))  # flush early at this many records
+UPLOAD_LOG_MAX_INTERVAL = float(os.environ.get("UPLOAD_LOG_MAX_INTERVAL", 600))  # digest interval ceiling while the channel is rate-limited
+UPLOAD_LOG_DAILY_CSV = os.environ.get("UPLOAD_LOG_DAILY_CSV", "false").lower() in ("1", "true", "yes", "on")
+BACKUP_JOURNAL_FLUSH_INTERVAL = float(os.environ.get("BACKUP_JOURNAL_FLUSH_INTERVAL", 5))  # seconds between backup-queue journal writes
 
 # GoFile Servers
 PRIORITIZED_SERVERS = [
@@ -51,9 +158,14 @@ PRIORITIZED_SERVERS = [
     "upload-ap-tyo", "upload-sa-sao", "upload-eu-fra"
 ]
 
+GOFILE_UPLOAD_URL = os.environ.get("GOFILE_UPLOAD_URL", "")  # e.g. http://127.0.0.1:8080/uploadfile for a local stand-in server
+GOFILE_API_URL = os.environ.get("GOFILE_API_URL", "https://api.gofile.io").rstrip("/")
+GOFILE_QUARANTINE_SECONDS = int(os.environ.get("GOFILE_QUARANTINE_SECONDS", 1800))  # after auth or quota failures
+
 HEADERS = {"Authorization": f"Bearer {GOFILE_API_TOKEN}"}
 DOWNLOAD_DIR = "downloads"
 DATABASE_FILE = "database.json"
+BACKUP_QUEUE_FILE = "backup_queue.jsonl"  # append-only journal of queued backup-channel posts
 
 # Bot Info
 BOT_USERNAME = os.environ.get("BOT_USERNAME", "YourBot")
@@ -2,19 +2,62 @@
 import json
 import os
 import asyncio
+import bisect
+import contextvars
+import time
 from datetime import datetime, timedelta
-from config import DATABASE_FILE, REQUIRED_FSUB_CHANNELS
+from config import (
+    DATABASE_FILE, BACKUP_QUEUE_FILE, REQUIRED_FSUB_CHANNELS, REACHABILITY_MAX_FAILURES,
+    UPLOAD_CACHE_MAX_ENTRIES, UPLOAD_CACHE_MAX_AGE_DAYS, BACKUP_MAX_ATTEMPTS, BACKUP_QUEUE_MAX_ITEMS
+)
 import logging
 
 logger = logging.getLogger(__name__)
 MAX_USER_EVENTS_PER_USER = 200
 MAX_GLOBAL_USER_EVENTS = 20000
+MAX_FINISHED_BROADCAST_JOBS = 20
+UPDATE_CONTEXT_TIMEOUT = 30
+BACKUP_JOURNAL_COMPACT_LINES = 1000
+
+class UpdateContext:
+    """Database work gathered while one Telegram update is dispatched.
+
+    While a context is open, saves are deferred and repeated user upserts
+    are collapsed; `Database.end_update` writes everything once.
+    """
+
+    def __init__(self):
+        self.closed = False
+        self.save_requests = 0
+        self.deduped_upserts = 0
+        self.upserted_users = set()
+        self.expiry = None
+
+_update_context = contextvars.ContextVar("db_update_context", default=None)
 
 class Database:
     def __init__(self):
         self.db_file = DATABASE_FILE
         self.lock = asyncio.Lock()
         self.data = self._load_db()
+        self.unreachable_users = set()
+        self._rebuild_reachability_index()
+        self._rebuild_user_indexes()
+        self.backup_file = BACKUP_QUEUE_FILE
+        self.backup_lock = asyncio.Lock()
+        self.backup_journal = []
+        self.backup_items = self._load_backup_queue()
+        self.write_stats = {
+            "writes": 0,
+            "updates": 0,
+            "update_writes": 0,
+            "save_requests": 0,
+            "deduped_upserts": 0
+        }
+        # Optional hook called with (seconds, size_bytes) after each write.
+        self.on_write = None
+        # Executor for backup-journal writes; the bot shares its disk thread pool here.
+        self.io_executor = None
     
     def _load_db(self):
         """Load database from file"""
@@ -49,10 +92,24 @@ class Database:
                 "failed_checks": 0,
                 "revoked_access": 0,
                 "last_revoked_at": "",
-                "last_revoked_user": 0
+                "last_revoked_user": 0,
+                "last_sweep": {}
             },
             "user_events": [],
-            "admin_channels": []
+            "admin_channels": [],
+            "broadcast_jobs": {},
+            "reachability": {
+                "sends_avoided": 0,
+                "last_probe": {}
+            },
+            "upload_cache": {
+                "entries": {},
+                "stats": {"hits": 0, "misses": 0, "stale": 0, "evicted": 0}
+            },
+            "gofile_accounts": {},
+            "backup_queue": {
+                "stats": {"sent": 0, "digests": 0, "copies": 0, "retried": 0, "failed": 0, "dropped": 0}
+            }
         }
         
         if os.path.exists(self.db_file):
@@ -83,17 +140,88 @@ class Database:
                         for key, value in default_data["enforcement"].items():
                             if key not in loaded["enforcement"]:
                                 loaded["enforcement"][key] = value
+                    for key, value in default_data["reachability"].items():
+                        loaded["reachability"].setdefault(key, value)
+                    for key, value in default_data["upload_cache"].items():
+                        loaded["upload_cache"].setdefault(key, value)
+                    for key, value in default_data["backup_queue"].items():
+                        loaded["backup_queue"].setdefault(key, value)
                     return loaded
             except:
                 return default_data
         return default_data
     
     async def _save_db(self):
-        """Save database to file"""
+        """Save database to file (deferred to the end of the current update, if any)"""
+        ctx = _update_context.get()
+        if ctx is not None and not ctx.closed:
+            ctx.save_requests += 1
+            return
+        await self._write_db()
+
+    async def _write_db(self):
         async with self.lock:
+            started = time.perf_counter()
             with open(self.db_file, 'w') as f:
                 json.dump(self.data, f, indent=2, default=str)
-    
+            elapsed = time.perf_counter() - started
+        self.write_stats["writes"] += 1
+        if self.on_write:
+            try:
+                self.on_write(elapsed, os.path.getsize(self.db_file))
+            except Exception as e:
+                logger.debug(f"DB write hook failed: {e}")
+
+    async def save(self):
+        """Persist changes made with `persist=False`."""
+        await self._save_db()
+
+    # ================== UPDATE CONTEXT ==================
+
+    async def begin_update(self) -> UpdateContext:
+        """Open a per-update context in the current task."""
+        previous = _update_context.get()
+        if previous is not None and not previous.closed:
+            # Propagation stopped before the previous update was closed.
+            await self.end_update(previous)
+        ctx = UpdateContext()
+        ctx.expiry = asyncio.get_running_loop().call_later(
+            UPDATE_CONTEXT_TIMEOUT, lambda: asyncio.ensure_future(self.end_update(ctx))
+        )
+        _update_context.set(ctx)
+        return ctx
+
+    async def end_update(self, ctx: UpdateContext = None):
+        """Close the per-update context and write its changes once."""
+        ctx = ctx or _update_context.get()
+        if _update_context.get() is ctx:
+            _update_context.set(None)
+        if ctx is None or ctx.closed:
+            return
+        ctx.closed = True
+        if ctx.expiry:
+            ctx.expiry.cancel()
+        stats = self.write_stats
+        stats["updates"] += 1
+        stats["save_requests"] += ctx.save_requests
+        stats["deduped_upserts"] += ctx.deduped_upserts
+        if ctx.save_requests:
+            stats["update_writes"] += 1
+            await self._write_db()
+
+    async def get_write_stats(self):
+        """DB writes per update, with and without per-update batching."""
+        stats = self.write_stats
+        updates = max(1, stats["updates"])
+        return {
+            "writes": stats["writes"],
+            "updates": stats["updates"],
+            "writes_per_update": round(stats["update_writes"] / updates, 2),
+            "unbatched_writes_per_update": round(stats["save_requests"] / updates, 2),
+            "saves_avoided": stats["save_requests"] - stats["update_writes"],
+            "deduped_upserts": stats["deduped_upserts"]
+        }
+
     # ================== USER MANAGEMENT ==================
     
     async def add_user(self, user_id: int, user_info: dict, chat_id: int = None, source: str = "unknown", persist: bool = True):
@@ -104,6 +232,20 @@ class Database:
         is_new_user = user_id not in self.data["users"]
         profile_changed = False
 
+        ctx = _update_context.get()
+        if ctx is not None and not ctx.closed:
+            if not is_new_user and user_id in ctx.upserted_users:
+                # Already refreshed by an earlier handler for this update.
+                self.data["users"][user_id]["last_seen_source"] = source
+                ctx.deduped_upserts += 1
+                if persist:
+                    await self._save_db()
+                return
+            ctx.upserted_users.add(user_id)
+
+        if not is_new_user:
+            self._unindex_user(self.data["users"][user_id])
+
         if is_new_user:
             self.data["users"][user_id] = {
                 "user_id": int(user_id),
@@ -150,6 +292,7 @@ class Database:
             user_row["is_scam"] = bool(user_info.get("is_scam", False))
             user_row["is_fake"] = bool(user_info.get("is_fake", False))
             user_row["last_seen_source"] = source
+            self._mark_reachable(user_row)
 
             if chat_id is not None:
                 user_row["chat_id"] = chat_id
@@ -164,6 +307,7 @@ class Database:
             if previous_username != current_username:
                 profile_changed = True
 
+        self._index_user(self.data["users"][user_id])
         await self.track_activity(int(user_id), event_type="activity", is_new_user=is_new_user, persist=False)
         if is_new_user or profile_changed:
             self._write_username_snapshot()
@@ -242,7 +386,7 @@ class Database:
                 user_events[:] = user_events[-MAX_USER_EVENTS_PER_USER:]
             user_data["events_count"] = int(user_data.get("events_count", 0)) + 1
             user_data["last_active"] = now_iso
-            user_data["last_active_unix"] = int(datetime.now().timestamp())
+            self._set_last_active_unix(user_data, int(datetime.now().timestamp()))
 
             if event_type == "command":
                 user_data["commands_count"] = int(user_data.get("commands_count", 0)) + 1
@@ -273,20 +417,137 @@ class Database:
     async def get_user_count(self):
         """Get total user count"""
         return len(self.data["users"])
+
+    async def get_recently_active_user_ids(self, since_unix: int = 0, limit: int = 0):
+        """Get user IDs active since `since_unix`, most recently active first."""
+        start = bisect.bisect_left(self.active_index, (int(since_unix), -1))
+        rows = self.active_index[start:][::-1]
+        if limit and limit > 0:
+            rows = rows[:limit]
+        return [user_id for _, user_id in rows]
     
-    async def update_user_stats(self, user_id: int, file_size: int):
+    async def update_user_stats(self, user_id: int, file_size: int, persist: bool = True):
         """Update user upload stats"""
         user_id = str(user_id)
         if user_id in self.data["users"]:
             self.data["users"][user_id]["uploads_count"] += 1
             self.data["users"][user_id]["total_size"] += file_size
             self.data["users"][user_id]["last_active"] = datetime.now().isoformat()
+            self.uploader_users.add(int(user_id))
         
         self.data["bot_stats"]["total_uploads"] += 1
         self.data["bot_stats"]["total_size_uploaded"] += file_size
         await self.track_activity(int(user_id), event_type="upload", upload_size=file_size, persist=False)
-        await self._save_db()
+        if persist:
+            await self._save_db()
     
+    # ================== USER INDEXES ==================
+
+    def _rebuild_user_indexes(self):
+        """Build the in-memory secondary indexes used for audience targeting."""
+        self.active_index = []
+        self.joined_index = []
+        self.language_index = {}
+        self.premium_users = set()
+        self.uploader_users = set()
+        for user in self.data["users"].values():
+            self._index_user(user, sort=False)
+        self.active_index.sort()
+        self.joined_index.sort()
+
+    def _index_user(self, user: dict, sort: bool = True):
+        user_id = int(user["user_id"])
+        active_key = (int(user.get("last_active_unix", 0) or 0), user_id)
+        joined_key = (int(user.get("created_unix", 0) or 0), user_id)
+        if sort:
+            bisect.insort(self.active_index, active_key)
+            bisect.insort(self.joined_index, joined_key)
+        else:
+            self.active_index.append(active_key)
+            self.joined_index.append(joined_key)
+        language = (user.get("language_code") or "").lower()
+        if language:
+            self.language_index.setdefault(language, set()).add(user_id)
+        if user.get("is_premium"):
+            self.premium_users.add(user_id)
+        if int(user.get("uploads_count", 0) or 0) > 0:
+            self.uploader_users.add(user_id)
+
+    def _unindex_user(self, user: dict):
+        user_id = int(user["user_id"])
+        for index, key in (
+            (self.active_index, (int(user.get("last_active_unix", 0) or 0), user_id)),
+            (self.joined_index, (int(user.get("created_unix", 0) or 0), user_id)),
+        ):
+            pos = bisect.bisect_left(index, key)
+            if pos < len(index) and index[pos] == key:
+                del index[pos]
+        language = (user.get("language_code") or "").lower()
+        if language in self.language_index:
+            self.language_index[language].discard(user_id)
+            if not self.language_index[language]:
+                del self.language_index[language]
+        self.premium_users.discard(user_id)
+
+    def _set_last_active_unix(self, user: dict, last_active_unix: int):
+        """Update last_active_unix and its position in the activity index."""
+        user_id = int(user["user_id"])
+        old_key = (int(user.get("last_active_unix", 0) or 0), user_id)
+        pos = bisect.bisect_left(self.active_index, old_key)
+        if pos < len(self.active_index) and self.active_index[pos] == old_key:
+            del self.active_index[pos]
+        user["last_active_unix"] = last_active_unix
+        bisect.insort(self.active_index, (last_active_unix, user_id))
+
+    def _ids_since(self, index: list, since_unix: int) -> set:
+        start = bisect.bisect_left(index, (int(since_unix), -1))
+        return {user_id for _, user_id in index[start:]}
+
+    async def resolve_audience(self, audience: dict = None, include_unreachable: bool = False):
+        """Resolve a broadcast audience to user IDs in ascending order.
+
+        Supported keys: active_days, language, premium, uploaders and
+        joined_after (YYYY-MM-DD). Criteria are combined with AND; an empty
+        audience means every user.
+        """
+        audience = audience or {}
+        selected = None
+
+        def narrow(ids):
+            nonlocal selected
+            selected = set(ids) if selected is None else selected & ids
+
+        if audience.get("active_days"):
+            since = int(datetime.now().timestamp()) - int(audience["active_days"]) * 86400
+            narrow(self._ids_since(self.active_index, since))
+        if audience.get("language"):
+            narrow(self.language_index.get(str(audience["language"]).lower(), set()))
+        if audience.get("premium"):
+            narrow(self.premium_users)
+        if audience.get("uploaders"):
+            narrow(self.uploader_users)
+        if audience.get("joined_after"):
+            since = int(datetime.strptime(audience["joined_after"], "%Y-%m-%d").timestamp())
+            narrow(self._ids_since(self.joined_index, since))
+
+        if selected is None:
+            selected = {int(user_id) for user_id in self.data["users"].keys()}
+        if not include_unreachable:
+            selected = selected - self.unreachable_users
+        return sorted(selected)
+
+    async def count_audience(self, audience: dict = None, include_unreachable: bool = False):
+        """Number of users a broadcast with this audience would reach."""
+        return len(await self.resolve_audience(audience, include_unreachable=include_unreachable))
+
+    async def get_language_counts(self, limit: int = 10):
+        """Most common user language codes, largest first."""
+        counts = sorted(
+            ((len(ids), language) for language, ids in self.language_index.items()),
+            reverse=True
+        )
+        return [(language, count) for count, language in counts[:limit]]
+
     # ================== BAN MANAGEMENT ==================
     
     async def ban_user(self, user_id: int):
@@ -412,6 +673,395 @@ class Database:
         """Get channels where bot is known as admin."""
         return list(self.data.get("admin_channels", []))
 
+    # ================== BROADCAST JOBS ==================
+
+    async def create_broadcast_job(self, job: dict):
+        """Store a new persistent broadcast job and prune old finished ones."""
+        jobs = self.data.setdefault("broadcast_jobs", {})
+        jobs[job["id"]] = job
+        finished = sorted(
+            (j for j in jobs.values() if j.get("status") in ("completed", "cancelled", "failed")),
+            key=lambda j: j.get("created_at", "")
+        )
+        excess = len(finished) - MAX_FINISHED_BROADCAST_JOBS
+        for old in finished[:max(0, excess)]:
+            jobs.pop(old["id"], None)
+        await self._save_db()
+        return job
+
+    async def get_broadcast_job(self, job_id: str):
+        """Get a broadcast job (live record; call save() after mutating)."""
+        return self.data.setdefault("broadcast_jobs", {}).get(job_id)
+
+    async def get_broadcast_jobs(self, statuses: list = None):
+        """List broadcast jobs, newest first, optionally filtered by status."""
+        jobs = list(self.data.setdefault("broadcast_jobs", {}).values())
+        if statuses:
+            allowed = set(statuses)
+            jobs = [j for j in jobs if j.get("status") in allowed]
+        return sorted(jobs, key=lambda j: j.get("created_at", ""), reverse=True)
+
+    # ================== REACHABILITY ==================
+
+    def _is_unreachable(self, user: dict) -> bool:
+        state = user.get("reachability") or {}
+        return bool(
+            state.get("blocked_at")
+            or state.get("deactivated")
+            or int(state.get("consecutive_failures", 0)) >= REACHABILITY_MAX_FAILURES
+        )
+
+    def _rebuild_reachability_index(self):
+        self.unreachable_users = {
+            int(user_id) for user_id, user in self.data["users"].items()
+            if self._is_unreachable(user)
+        }
+
+    def _mark_reachable(self, user: dict):
+        """A user who just wrote to the bot can receive messages again."""
+        state = user.get("reachability")
+        if state:
+            state["blocked_at"] = ""
+            state["deactivated"] = False
+            state["consecutive_failures"] = 0
+        self.unreachable_users.discard(int(user["user_id"]))
+
+    async def record_delivery(self, user_id: int, outcome: str, persist: bool = True):
+        """Update a user's reachability from a delivery outcome.
+
+        Outcomes: success, blocked, deleted, invalid, failed. Anything else
+        (e.g. throttled) says nothing about the recipient and is ignored.
+        """
+        user = self.data["users"].get(str(user_id))
+        if not user or outcome not in ("success", "blocked", "deleted", "invalid", "failed"):
+            return
+        state = user.setdefault("reachability", {
+            "blocked_at": "",
+            "deactivated": False,
+            "consecutive_failures": 0,
+            "last_failure_at": "",
+            "last_success_at": ""
+        })
+        now_iso = datetime.now().isoformat()
+        if outcome == "success":
+            state["blocked_at"] = ""
+            state["deactivated"] = False
+            state["consecutive_failures"] = 0
+            state["last_success_at"] = now_iso
+        else:
+            state["consecutive_failures"] = int(state.get("consecutive_failures", 0)) + 1
+            state["last_failure_at"] = now_iso
+            if outcome == "blocked" and not state.get("blocked_at"):
+                state["blocked_at"] = now_iso
+            elif outcome == "deleted":
+                state["deactivated"] = True
+
+        if self._is_unreachable(user):
+            self.unreachable_users.add(int(user_id))
+        else:
+            self.unreachable_users.discard(int(user_id))
+        if persist:
+            await self._save_db()
+
+    async def get_reachable_user_ids(self):
+        """User IDs not known to be unreachable, in ascending order."""
+        return await self.resolve_audience()
+
+    async def get_unreachable_user_ids(self, include_deactivated: bool = True):
+        """User IDs currently skipped by broadcasts, in ascending order."""
+        user_ids = []
+        for user_id in sorted(self.unreachable_users):
+            user = self.data["users"].get(str(user_id)) or {}
+            if not include_deactivated and (user.get("reachability") or {}).get("deactivated"):
+                continue
+            user_ids.append(user_id)
+        return user_ids
+
+    async def record_sends_avoided(self, count: int, persist: bool = True):
+        """Count broadcast sends skipped because the recipient was unreachable."""
+        reachability = self.data.setdefault("reachability", {})
+        reachability["sends_avoided"] = int(reachability.get("sends_avoided", 0)) + int(count)
+        if persist:
+            await self._save_db()
+
+    async def record_reachability_probe(self, summary: dict, persist: bool = True):
+        """Store the summary of the latest dormant-user re-probe."""
+        self.data.setdefault("reachability", {})["last_probe"] = dict(summary or {})
+        if persist:
+            await self._save_db()
+
+    async def get_reachability_stats(self):
+        """Get reachability summary for admin panels."""
+        blocked = deactivated = 0
+        for user_id in self.unreachable_users:
+            state = (self.data["users"].get(str(user_id)) or {}).get("reachability") or {}
+            if state.get("deactivated"):
+                deactivated += 1
+            elif state.get("blocked_at"):
+                blocked += 1
+        reachability = self.data.get("reachability", {})
+        return {
+            "unreachable": len(self.unreachable_users),
+            "blocked": blocked,
+            "deactivated": deactivated,
+            "failing": len(self.unreachable_users) - blocked - deactivated,
+            "sends_avoided": int(reachability.get("sends_avoided", 0)),
+            "last_probe": dict(reachability.get("last_probe", {}) or {})
+        }
+
+    # ================== UPLOAD CACHE ==================
+
+    async def get_cached_upload(self, key: str, max_age_seconds: int = None):
+        """Get a cached GoFile upload by content key, dropping it if expired."""
+        cache = self.data["upload_cache"]
+        entry = cache["entries"].get(key)
+        if not entry:
+            return None
+        if max_age_seconds is None:
+            max_age_seconds = UPLOAD_CACHE_MAX_AGE_DAYS * 86400
+        max_age = timedelta(seconds=max_age_seconds)
+        if max_age_seconds > 0 and datetime.now() - datetime.fromisoformat(entry["created_at"]) > max_age:
+            cache["entries"].pop(key, None)
+            cache["stats"]["evicted"] = int(cache["stats"].get("evicted", 0)) + 1
+            return None
+        return entry
+
+    async def record_upload_cache_lookup(self, key: str, hit: bool, stale: bool = False, persist: bool = True):
+        """Count a cache lookup; a hit refreshes the entry's LRU position."""
+        cache = self.data["upload_cache"]
+        stats = cache["stats"]
+        if stale:
+            cache["entries"].pop(key, None)
+            stats["stale"] = int(stats.get("stale", 0)) + 1
+        if hit:
+            stats["hits"] = int(stats.get("hits", 0)) + 1
+            entry = cache["entries"].get(key)
+            if entry:
+                entry["hits"] = int(entry.get("hits", 0)) + 1
+                entry["last_hit_at"] = datetime.now().isoformat()
+        else:
+            stats["misses"] = int(stats.get("misses", 0)) + 1
+        if persist:
+            await self._save_db()
+
+    async def mark_cached_upload_validated(self, key: str, persist: bool = False):
+        entry = self.data["upload_cache"]["entries"].get(key)
+        if entry:
+            entry["validated_at"] = datetime.now().isoformat()
+        if persist:
+            await self._save_db()
+
+    async def cache_upload(
+        self, key: str, link: str, file_name: str, file_size: int,
+        validators: dict = None, persist: bool = True
+    ):
+        """Remember the GoFile link for a file and evict least recently used entries."""
+        cache = self.data["upload_cache"]
+        now_iso = datetime.now().isoformat()
+        cache["entries"][key] = {
+            "link": link,
+            "file_name": file_name,
+            "file_size": int(file_size or 0),
+            "created_at": now_iso,
+            "validated_at": now_iso,
+            "last_hit_at": now_iso,
+            "hits": 0
+        }
+        if validators:
+            cache["entries"][key]["validators"] = dict(validators)
+        excess = len(cache["entries"]) - max(1, UPLOAD_CACHE_MAX_ENTRIES)
+        if excess > 0:
+            oldest = sorted(cache["entries"].items(), key=lambda item: item[1].get("last_hit_at", ""))
+            for old_key, _ in oldest[:excess]:
+                cache["entries"].pop(old_key, None)
+            cache["stats"]["evicted"] = int(cache["stats"].get("evicted", 0)) + excess
+        if persist:
+            await self._save_db()
+
+    async def get_upload_cache_stats(self):
+        """Get dedup cache size and hit rate."""
+        cache = self.data["upload_cache"]
+        stats = cache["stats"]
+        hits = int(stats.get("hits", 0))
+        misses = int(stats.get("misses", 0))
+        return {
+            "entries": len(cache["entries"]),
+            "hits": hits,
+            "misses": misses,
+            "stale": int(stats.get("stale", 0)),
+            "evicted": int(stats.get("evicted", 0)),
+            "hit_rate": round(hits / (hits + misses) * 100, 1) if hits + misses else 0.0,
+            "bytes_saved": sum(
+                int(entry.get("file_size", 0)) * int(entry.get("hits", 0))
+                for entry in cache["entries"].values()
+            )
+        }
+
+    # ================== GOFILE ACCOUNTS ==================
+
+    async def get_gofile_account_stats(self):
+        return {key: dict(value) for key, value in self.data["gofile_accounts"].items()}
+
+    async def record_gofile_upload(self, account_id: str, file_size: int, persist: bool = True):
+        """Count an upload against a GoFile account."""
+        stats = self.data["gofile_accounts"].setdefault(account_id, {"uploads": 0, "bytes_stored": 0})
+        stats["uploads"] = int(stats.get("uploads", 0)) + 1
+        stats["bytes_stored"] = int(stats.get("bytes_stored", 0)) + int(file_size or 0)
+        if persist:
+            await self._save_db()
+
+    # ================== BACKUP QUEUE ==================
+    # Queued items live in their own append-only journal, so queueing or
+    # completing a backup appends a line instead of rewriting the database.
+
+    def _load_backup_queue(self) -> dict:
+        items = {}
+        legacy_items = self.data["backup_queue"].pop("items", None) or []
+        if not os.path.exists(self.backup_file):
+            # Queues kept inside the main database by older versions move to the journal.
+            for item in legacy_items:
+                items[item["id"]] = item
+            if items:
+                self._rewrite_backup_journal([self._backup_add_record(item) for item in items.values()])
+            self.backup_journal_lines = len(items)
+            return items
+        lines = 0
+        with open(self.backup_file) as f:
+            for line in f:
+                lines += 1
+                try:
+                    self._apply_backup_record(items, json.loads(line))
+                except (ValueError, KeyError, TypeError):
+                    # A line cut short by a crash.
+                    continue
+        if lines > max(BACKUP_JOURNAL_COMPACT_LINES, 4 * len(items)):
+            lines = len(items)
+            self._rewrite_backup_journal([self._backup_add_record(item) for item in items.values()])
+        self.backup_journal_lines = lines
+        return items
+
+    @staticmethod
+    def _apply_backup_record(items: dict, record: dict):
+        op = record["op"]
+        if op == "add":
+            items[record["item"]["id"]] = record["item"]
+        elif op == "done":
+            for item_id in record["ids"]:
+                items.pop(item_id, None)
+        elif op == "retry" and record["id"] in items:
+            items[record["id"]]["attempts"] = record["attempts"]
+            items[record["id"]]["next_attempt_at"] = record["next_attempt_at"]
+
+    @staticmethod
+    def _backup_add_record(item: dict) -> str:
+        return json.dumps({"op": "add", "item": item}, default=str)
+
+    def _append_backup_journal(self, lines: list):
+        with open(self.backup_file, "a") as f:
+            f.write("".join(line + "\n" for line in lines))
+
+    def _rewrite_backup_journal(self, lines: list):
+        tmp_file = self.backup_file + ".tmp"
+        with open(tmp_file, "w") as f:
+            f.write("".join(line + "\n" for line in lines))
+        os.replace(tmp_file, self.backup_file)
+
+    async def _journal_backups(self, records: list, persist: bool = True):
+        self.backup_journal.extend(json.dumps(record, default=str) for record in records)
+        if persist:
+            await self.flush_backup_queue()
+
+    async def flush_backup_queue(self):
+        """Append buffered queue changes to the journal, compacting it once it is mostly dead lines."""
+        if not self.backup_journal:
+            return
+        async with self.backup_lock:
+            lines, self.backup_journal = self.backup_journal, []
+            if not lines:
+                return
+            loop = asyncio.get_running_loop()
+            if self.backup_journal_lines + len(lines) > max(BACKUP_JOURNAL_COMPACT_LINES, 4 * len(self.backup_items)):
+                # The in-memory queue already includes every buffered change.
+                snapshot = [self._backup_add_record(item) for item in self.backup_items.values()]
+                await loop.run_in_executor(self.io_executor, self._rewrite_backup_journal, snapshot)
+                self.backup_journal_lines = len(snapshot)
+            else:
+                await loop.run_in_executor(self.io_executor, self._append_backup_journal, lines)
+                self.backup_journal_lines += len(lines)
+
+    async def enqueue_backup(self, item: dict, persist: bool = True):
+        """Queue a backup for the dispatcher, dropping the oldest past the cap.
+
+        Returns None when an item with the same id is already queued.
+        """
+        if item["id"] in self.backup_items:
+            return None
+        item.setdefault("attempts", 0)
+        item.setdefault("next_attempt_at", 0)
+        item.setdefault("created_at", datetime.now().isoformat())
+        self.backup_items[item["id"]] = item
+        records = [{"op": "add", "item": item}]
+        excess = len(self.backup_items) - max(1, BACKUP_QUEUE_MAX_ITEMS)
+        if excess > 0:
+            dropped = list(self.backup_items)[:excess]
+            for item_id in dropped:
+                self.backup_items.pop(item_id, None)
+            records.append({"op": "done", "ids": dropped})
+            stats = self.data["backup_queue"]["stats"]
+            stats["dropped"] = int(stats.get("dropped", 0)) + excess
+        await self._journal_backups(records, persist=persist)
+        return item
+
+    async def get_pending_backups(self, kind: str, limit: int = 0):
+        """Backups of `kind` that are due now, oldest first."""
+        now = time.time()
+        due = [
+            item for item in self.backup_items.values()
+            if item.get("kind") == kind and float(item.get("next_attempt_at", 0)) <= now
+        ]
+        return due[:limit] if limit else due
+
+    async def complete_backups(self, ids: list, digest: bool = False, persist: bool = True):
+        done = [item_id for item_id in dict.fromkeys(ids) if self.backup_items.pop(item_id, None) is not None]
+        stats = self.data["backup_queue"]["stats"]
+        stats["sent"] = int(stats.get("sent", 0)) + len(done)
+        key = "digests" if digest else "copies"
+        stats[key] = int(stats.get(key, 0)) + (1 if digest else len(done))
+        if done:
+            await self._journal_backups([{"op": "done", "ids": done}], persist=persist)
+
+    async def fail_backups(self, ids: list, retry_delay: float, persist: bool = True):
+        """Back off failed backups exponentially; give up after BACKUP_MAX_ATTEMPTS."""
+        stats = self.data["backup_queue"]["stats"]
+        records, given_up = [], []
+        for item_id in dict.fromkeys(ids):
+            item = self.backup_items.get(item_id)
+            if item is None:
+                continue
+            item["attempts"] = int(item.get("attempts", 0)) + 1
+            if item["attempts"] >= BACKUP_MAX_ATTEMPTS:
+                self.backup_items.pop(item_id, None)
+                given_up.append(item_id)
+                stats["failed"] = int(stats.get("failed", 0)) + 1
+                continue
+            item["next_attempt_at"] = time.time() + retry_delay * (2 ** (item["attempts"] - 1))
+            stats["retried"] = int(stats.get("retried", 0)) + 1
+            records.append({
+                "op": "retry", "id": item_id,
+                "attempts": item["attempts"], "next_attempt_at": item["next_attempt_at"]
+            })
+        if given_up:
+            records.append({"op": "done", "ids": given_up})
+        if records:
+            await self._journal_backups(records, persist=persist)
+
+    async def get_backup_queue_stats(self):
+        pending = {"url": 0, "file": 0, "upload": 0}
+        for item in self.backup_items.values():
+            pending[item.get("kind", "url")] = pending.get(item.get("kind", "url"), 0) + 1
+        stats = self.data["backup_queue"]["stats"]
+        return {"pending": pending, **{key: int(value) for key, value in stats.items()}}
+
     # ================== ADS MANAGEMENT ==================
 
     async def set_ads(self, enabled: bool, message: str = "", button_text: str = "", button_url: str = ""):
@@ -453,6 +1103,36 @@ class Database:
         """Get custom welcome message"""
         return self.data["settings"].get("welcome_message", "")
 
+    async def get_flood_limits(self):
+        """Get admin overrides for flood-guard limits."""
+        return dict(self.data["settings"].get("flood_limits", {}) or {})
+
+    async def set_flood_limit(self, kind: str, rate: float, burst: int):
+        """Override one flood-guard limit."""
+        limits = self.data["settings"].setdefault("flood_limits", {})
+        limits[kind] = {"rate": float(rate), "burst": int(burst)}
+        await self._save_db()
+
+    async def reset_flood_limits(self):
+        """Drop all flood-guard overrides."""
+        self.data["settings"]["flood_limits"] = {}
+        await self._save_db()
+
+    async def get_bandwidth_limits(self):
+        """Get admin overrides for bandwidth shaping."""
+        return dict(self.data["settings"].get("bandwidth_limits", {}) or {})
+
+    async def set_bandwidth_limit(self, key: str, value: float):
+        """Override one bandwidth setting (ingress, egress or control_reserve)."""
+        limits = self.data["settings"].setdefault("bandwidth_limits", {})
+        limits[key] = float(value)
+        await self._save_db()
+
+    async def reset_bandwidth_limits(self):
+        """Drop all bandwidth overrides."""
+        self.data["settings"]["bandwidth_limits"] = {}
+        await self._save_db()
+
     async def get_enforcement_mode(self):
         """Get current enforcement mode."""
         return self._normalize_enforcement_mode(
@@ -496,8 +1176,16 @@ class Database:
             "revoked_access": int(enforcement.get("revoked_access", 0)),
             "last_revoked_at": enforcement.get("last_revoked_at", ""),
             "last_revoked_user": int(enforcement.get("last_revoked_user", 0)),
+            "last_sweep": dict(enforcement.get("last_sweep", {}) or {}),
             "mode": await self.get_enforcement_mode()
         }
+
+    async def record_fsub_sweep(self, summary: dict, persist: bool = True):
+        """Store the summary of the latest force-subscription re-verification sweep."""
+        enforcement = self.data.setdefault("enforcement", {})
+        enforcement["last_sweep"] = dict(summary or {})
+        if persist:
+            await self._save_db()
     
     # ================== STATS ==================
     
@@ -511,7 +1199,8 @@ class Database:
             "total_size": self.data["bot_stats"]["total_size_uploaded"],
             "start_time": self.data["bot_stats"]["start_time"],
             "enforcement_mode": await self.get_enforcement_mode(),
-            "enforcement": await self.get_enforcement_stats()
+            "enforcement": await self.get_enforcement_stats(),
+            "reachability": await self.get_reachability_stats()
         }
 
     # ================== ANALYTICS ==================
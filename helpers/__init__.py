@@ -1,3 +1,5 @@
 from .force_sub import check_force_sub, get_invite_links
 from .broadcast import broadcast_message
-from .decorators import admin_only, owner_only, not_banned
\ No newline at end of file
+from .decorators import admin_only, owner_only, not_banned
+from .fsub_sweeper import fsub_sweeper
+from .rpc_governor import rpc
\ No newline at end of file
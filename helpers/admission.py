@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+import asyncio
+import logging
+import shutil
+import time
+from config import DOWNLOAD_DIR, STAGING_QUOTA, STAGING_MIN_FREE, STAGING_UNKNOWN_SIZE_RESERVE
+
+logger = logging.getLogger(__name__)
+
+class StagingQuotaExceeded(Exception):
+    """A job needs more staging space than the quota can ever provide."""
+
+class Reservation:
+    """Staging space held by one job until its files are removed."""
+
+    def __init__(self, controller, label: str, size: int, estimated: bool = False):
+        self.controller = controller
+        self.label = label
+        self.size = size
+        self.written = 0
+        self.estimated = estimated
+        self.created_at = time.monotonic()
+
+    def ensure(self, needed: int):
+        """Grow an estimated reservation as bytes arrive; raises if the quota is full."""
+        if needed <= self.size:
+            return
+        try:
+            # Grow in large steps so the check runs rarely, falling back to the exact need.
+            self.controller._resize(self, max(needed, self.size + STAGING_UNKNOWN_SIZE_RESERVE))
+        except StagingQuotaExceeded:
+            self.controller._resize(self, needed)
+
+    def wrote(self, total: int):
+        """Record how many of the reserved bytes are on disk so far."""
+        self.written = max(self.written, int(total))
+
+    def reconcile(self, actual: int):
+        """Shrink or grow to the size actually on disk."""
+        self.controller._resize(self, actual, strict=False)
+        self.written = self.size
+        self.estimated = False
+
+class AdmissionController:
+    """Reserve download staging space per job before it starts.
+
+    A job is admitted when its size fits in the staging quota alongside
+    the other reservations, and the disk keeps STAGING_MIN_FREE bytes free
+    after every reservation is fully written. Jobs that do not fit wait
+    (holding their queue slot, not disk space) until another job releases
+    its reservation.
+    """
+
+    def __init__(self, directory: str = DOWNLOAD_DIR, quota: int = STAGING_QUOTA, min_free: int = STAGING_MIN_FREE):
+        self.directory = directory
+        self.quota = quota
+        self.min_free = min_free
+        self.reservations = set()
+        self.waiting = 0
+        self.admitted = 0
+        self.waited = 0
+        self.rejected = 0
+        self._changed = asyncio.Condition()
+
+    @property
+    def reserved(self) -> int:
+        return sum(r.size for r in self.reservations)
+
+    @property
+    def staged(self) -> int:
+        """Bytes running jobs have written so far, as reported through Reservation.wrote."""
+        return sum(min(r.written, r.size) for r in self.reservations)
+
+    def _disk_free(self) -> int:
+        try:
+            return shutil.disk_usage(self.directory).free
+        except OSError:
+            return 0
+
+    def _fits(self, extra: int) -> bool:
+        reserved = self.reserved
+        if self.quota > 0 and reserved + extra > self.quota:
+            return False
+        # Bytes already written count against free space, so only the unwritten part of reservations is pending.
+        pending = max(0, reserved - self.staged)
+        return self._disk_free() - pending - extra >= self.min_free
+
+    async def reserve(self, label: str, size: int, on_wait=None) -> Reservation:
+        """Wait until `size` bytes fit, then hold them. Unknown sizes (0) reserve an estimate."""
+        estimated = not size or size <= 0
+        size = STAGING_UNKNOWN_SIZE_RESERVE if estimated else int(size)
+        if self.quota > 0 and size > self.quota:
+            self.rejected += 1
+            raise StagingQuotaExceeded(
+                f"File needs {size} bytes of staging space but the quota is {self.quota} bytes."
+            )
+
+        async with self._changed:
+            if self._fits(size):
+                return self._admit(label, size, estimated)
+
+        logger.info(f"Staging space busy, {label} waits for {size} bytes")
+        if on_wait is not None:
+            try:
+                await on_wait(size, self.snapshot())
+            except Exception as e:
+                logger.debug(f"Admission wait callback failed: {e}")
+
+        async with self._changed:
+            self.waiting += 1
+            self.waited += 1
+            try:
+                await self._changed.wait_for(lambda: self._fits(size) or not self.reservations)
+            finally:
+                self.waiting -= 1
+            if not self._fits(size):
+                # Nothing left to wait for: the disk itself is too small.
+                self.rejected += 1
+                raise StagingQuotaExceeded(
+                    f"Not enough free disk space to stage {size} bytes."
+                )
+            return self._admit(label, size, estimated)
+
+    def _admit(self, label: str, size: int, estimated: bool) -> Reservation:
+        reservation = Reservation(self, label, size, estimated=estimated)
+        self.reservations.add(reservation)
+        self.admitted += 1
+        return reservation
+
+    def _resize(self, reservation: Reservation, size: int, strict: bool = True):
+        size = max(0, int(size))
+        extra = size - reservation.size
+        if extra > 0 and strict and not self._fits(extra):
+            raise StagingQuotaExceeded(
+                f"Staging area is full: {reservation.label} grew past its {reservation.size} byte reservation."
+            )
+        reservation.size = size
+        if extra < 0:
+            self._notify()
+
+    def release(self, reservation: Reservation):
+        if reservation in self.reservations:
+            self.reservations.discard(reservation)
+            self._notify()
+
+    def _notify(self):
+        async def wake():
+            async with self._changed:
+                self._changed.notify_all()
+        try:
+            asyncio.get_running_loop().create_task(wake())
+        except RuntimeError:
+            pass
+
+    def snapshot(self) -> dict:
+        return {
+            "quota": self.quota,
+            "reserved": self.reserved,
+            "staged": self.staged,
+            "disk_free": self._disk_free(),
+            "min_free": self.min_free,
+            "active": len(self.reservations),
+            "waiting": self.waiting,
+            "admitted": self.admitted,
+            "waited": self.waited,
+            "rejected": self.rejected
+        }
+
+# Global staging admission controller
+admission = AdmissionController()
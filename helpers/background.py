@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+import asyncio
+import logging
+from config import FINALIZE_RETRIES, FINALIZE_RETRY_DELAY
+from .metrics import background_tasks_running, background_task_results
+
+logger = logging.getLogger(__name__)
+
+class BackgroundTasks:
+    """Fire-and-forget work that must still finish: retried, tracked and drained on shutdown.
+
+    Each task is a group of named steps run concurrently. A step is a
+    zero-argument callable returning a coroutine, so it can be called again
+    on retry; failing steps retry with exponential backoff without holding
+    up the other steps of the group. Steps must be safe to repeat: apply
+    in-memory changes before spawning and retry only the save, or pass an
+    id the step can deduplicate on.
+    """
+
+    def __init__(self, retries: int = FINALIZE_RETRIES, retry_delay: float = FINALIZE_RETRY_DELAY):
+        self.retries = max(0, int(retries))
+        self.retry_delay = max(0.0, retry_delay)
+        self.tasks = set()
+        self.completed = 0
+        self.retried = 0
+        self.failed = 0
+
+    def spawn(self, group: str, steps: dict) -> asyncio.Task:
+        """Run `steps` ({name: callable}) concurrently in the background."""
+        task = asyncio.create_task(self._run_group(group, steps))
+        self.tasks.add(task)
+        background_tasks_running.set(len(self.tasks))
+        task.add_done_callback(self._discard)
+        return task
+
+    def _discard(self, task: asyncio.Task):
+        self.tasks.discard(task)
+        background_tasks_running.set(len(self.tasks))
+
+    async def _run_group(self, group: str, steps: dict):
+        await asyncio.gather(*(self._run_step(group, name, step) for name, step in steps.items()))
+
+    async def _run_step(self, group: str, name: str, step):
+        for attempt in range(self.retries + 1):
+            try:
+                await step()
+                self.completed += 1
+                background_task_results.inc(step=name, result="ok")
+                return
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                if attempt >= self.retries:
+                    self.failed += 1
+                    background_task_results.inc(step=name, result="failed")
+                    logger.error(f"{group}: {name} failed after {attempt + 1} attempt(s): {e}")
+                    return
+                self.retried += 1
+                background_task_results.inc(step=name, result="retried")
+                logger.warning(f"{group}: {name} failed ({e}), retrying")
+                await asyncio.sleep(self.retry_delay * (2 ** attempt))
+
+    async def drain(self, timeout: float = None):
+        """Wait for outstanding tasks (e.g. on shutdown); cancel what is left after `timeout`."""
+        if not self.tasks:
+            return
+        pending = list(self.tasks)
+        done, still_pending = await asyncio.wait(pending, timeout=timeout)
+        for task in still_pending:
+            task.cancel()
+        if still_pending:
+            logger.warning(f"Cancelled {len(still_pending)} background task(s) at shutdown")
+            await asyncio.gather(*still_pending, return_exceptions=True)
+
+    def snapshot(self) -> dict:
+        return {
+            "running": len(self.tasks),
+            "completed": self.completed,
+            "retried": self.retried,
+            "failed": self.failed
+        }
+
+# Global background task runner
+background = BackgroundTasks()
@@ -0,0 +1,345 @@
+#!/usr/bin/env python3
+import asyncio
+import csv
+import glob
+import logging
+import os
+import time
+import uuid
+from datetime import datetime
+from pyrogram import Client
+from database import db
+from config import (
+    BACKUP_CHANNEL_ID, BACKUP_DIGEST_INTERVAL, BACKUP_DIGEST_MAX_ITEMS, BACKUP_COPY_RATE, DATABASE_FILE,
+    BACKUP_JOURNAL_FLUSH_INTERVAL,
+    UPLOAD_LOG_DIGEST_INTERVAL, UPLOAD_LOG_DIGEST_MAX_ITEMS, UPLOAD_LOG_MAX_INTERVAL, UPLOAD_LOG_DAILY_CSV
+)
+from .file_writer import io_executor
+from .formatting import human_readable_size
+from .rate_limit import TokenBucket
+from .rpc_governor import rpc, PRIORITY_BACKUP_LOG
+
+logger = logging.getLogger(__name__)
+
+MAX_DIGEST_LENGTH = 3900  # stay under Telegram's 4096 character limit
+MAX_DIGEST_URL_LENGTH = 300
+RETRY_DELAY = 30  # seconds before the first retry, doubled each attempt
+CSV_LOGGED_MEMORY = 1000  # recent upload ids remembered so a retried submit is not logged twice
+CSV_FIELDS = ["completed_at", "user_id", "username", "first_name", "source", "file_name", "file_size", "link"]
+
+def _build_digest(items: list, render_line, header) -> tuple:
+    """Pack as many items as fit into one message. Returns (text, included ids)."""
+    lines, included, length = [], [], 0
+    for item in items:
+        line = render_line(item)
+        if included and length + len(line) + 2 > MAX_DIGEST_LENGTH:
+            break
+        lines.append(line)
+        included.append(item)
+        length += len(line) + 2
+    return header(included) + "\n\n" + "\n\n".join(lines), [item["id"] for item in included]
+
+def _url_line(item: dict) -> str:
+    url = item.get("url", "")
+    if len(url) > MAX_DIGEST_URL_LENGTH:
+        url = url[:MAX_DIGEST_URL_LENGTH] + "…"
+    return (
+        f"👤 {item.get('first_name', '')} (`{item.get('user_id')}`) • 🕒 {item.get('received_at', '')}\n"
+        f"🔗 `{url}`"
+    )
+
+def _upload_line(item: dict) -> str:
+    return (
+        f"📄 `{item.get('file_name', '')}` ({human_readable_size(item.get('file_size', 0))}) • {item.get('source', '')}\n"
+        f"👤 {item.get('first_name', '')} (`{item.get('user_id')}`) • 🕒 {item.get('received_at', '')}\n"
+        f"🔗 {item.get('link', '')}"
+    )
+
+class BackupDispatcher:
+    """Log requests and completed uploads to the backup channel off the request path.
+
+    Records go into the database's append-only backup journal. Incoming
+    URLs and completed uploads are sent as periodic digest messages; file
+    copies are sent one by one, paced by BACKUP_COPY_RATE so they never
+    crowd out user replies. Failed items retry with exponential backoff and
+    survive restarts. Queue changes are written to the journal in batches
+    every BACKUP_JOURNAL_FLUSH_INTERVAL, like the digests they feed.
+    """
+
+    def __init__(self):
+        self.copy_bucket = TokenBucket(max(0.01, BACKUP_COPY_RATE), 1)
+        self.upload_interval = max(1.0, UPLOAD_LOG_DIGEST_INTERVAL)
+        self.pending_uploads = 0
+        self.csv_logged = {}  # upload ids already in the CSV, oldest first
+        self.csv_dir = os.path.dirname(DATABASE_FILE) or "."
+        self._wake_copies = asyncio.Event()
+        self._flush_uploads = asyncio.Event()
+        self._tasks = []
+
+    @staticmethod
+    def _item(user, kind: str, item_id: str = None, **extra) -> dict:
+        return {
+            "id": item_id or uuid.uuid4().hex[:12],
+            "kind": kind,
+            "user_id": user.id,
+            "first_name": user.first_name or "",
+            "received_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            **extra
+        }
+
+    async def submit_url(self, message, url: str):
+        if not BACKUP_CHANNEL_ID:
+            return
+        await db.enqueue_backup(self._item(message.from_user, "url", url=url), persist=False)
+
+    async def submit_file(self, message):
+        if not BACKUP_CHANNEL_ID:
+            return
+        await db.enqueue_backup(self._item(
+            message.from_user, "file", chat_id=message.chat.id, message_id=message.id
+        ), persist=False)
+        self._wake_copies.set()
+
+    async def submit_upload(self, user, file_name: str, file_size: int, source: str, link: str, upload_id: str = None):
+        """Buffer a completed upload for the next #UPLOAD_COMPLETE digest (and the daily CSV).
+
+        Safe to retry with the same `upload_id`: the upload is queued and
+        written to the CSV once.
+        """
+        if not BACKUP_CHANNEL_ID:
+            return
+        item = self._item(
+            user, "upload",
+            item_id=upload_id,
+            username=user.username or "",
+            file_name=file_name,
+            file_size=int(file_size or 0),
+            source=source,
+            link=link
+        )
+        if await db.enqueue_backup(item, persist=False) is not None:
+            self.pending_uploads += 1
+            if self.pending_uploads >= UPLOAD_LOG_DIGEST_MAX_ITEMS:
+                self._flush_uploads.set()
+        if UPLOAD_LOG_DAILY_CSV and item["id"] not in self.csv_logged:
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(io_executor, self._append_csv, item)
+            self.csv_logged[item["id"]] = True
+            if len(self.csv_logged) > CSV_LOGGED_MEMORY:
+                self.csv_logged.pop(next(iter(self.csv_logged)))
+
+    def start(self, client: Client):
+        if not BACKUP_CHANNEL_ID or any(not task.done() for task in self._tasks):
+            return
+        self._tasks = [
+            asyncio.create_task(self._digest_loop(client)),
+            asyncio.create_task(self._copy_loop(client)),
+            asyncio.create_task(self._upload_loop(client)),
+            asyncio.create_task(self._journal_loop())
+        ]
+
+    async def stop(self, client: Client = None):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        if client is not None and BACKUP_CHANNEL_ID:
+            # Flush what is due; anything left stays queued for the next start.
+            try:
+                await self.send_digest(client)
+                await self.send_upload_digest(client)
+            except Exception as e:
+                logger.error(f"Final backup digest failed: {e}")
+        await db.flush_backup_queue()
+
+    async def _journal_loop(self):
+        while True:
+            await asyncio.sleep(max(0.5, BACKUP_JOURNAL_FLUSH_INTERVAL))
+            try:
+                await db.flush_backup_queue()
+            except Exception as e:
+                logger.error(f"Backup journal flush failed: {e}")
+
+    # ----- Incoming URL digests -----
+
+    async def _digest_loop(self, client: Client):
+        while True:
+            await asyncio.sleep(max(1.0, BACKUP_DIGEST_INTERVAL))
+            try:
+                while await self.send_digest(client) >= BACKUP_DIGEST_MAX_ITEMS:
+                    pass
+            except Exception as e:
+                logger.error(f"Backup digest loop error: {e}")
+
+    async def send_digest(self, client: Client) -> int:
+        """Send one digest of due URL backups. Returns how many URLs it covered."""
+        items = await db.get_pending_backups("url", limit=max(1, BACKUP_DIGEST_MAX_ITEMS))
+        if not items:
+            return 0
+        text, ids = _build_digest(items, _url_line, lambda batch: f"#INCOMING_REQUESTS • {len(batch)} URL(s)")
+        if not await self._send(client, text, ids, "Backup digest"):
+            return 0
+        await db.complete_backups(ids, digest=True, persist=False)
+        return len(ids)
+
+    # ----- Completed upload digests -----
+
+    async def _upload_loop(self, client: Client):
+        while True:
+            try:
+                await asyncio.wait_for(self._flush_uploads.wait(), timeout=self.upload_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._flush_uploads.clear()
+            try:
+                # Backpressure: while Telegram has us paused, records keep buffering into fuller digests.
+                paused = rpc.paused_until - time.monotonic()
+                if paused > 0:
+                    await asyncio.sleep(paused)
+                flood_waits = rpc.flood_waits
+                sent = ok = 0
+                while True:
+                    count = await self.send_upload_digest(client)
+                    if count <= 0:
+                        ok = count == 0
+                        break
+                    sent += count
+                    if rpc.flood_waits != flood_waits:
+                        break
+                if rpc.flood_waits != flood_waits or not ok:
+                    self.upload_interval = min(max(1.0, UPLOAD_LOG_MAX_INTERVAL), self.upload_interval * 2)
+                    logger.info(f"Backup channel rate-limited; upload digests now every {self.upload_interval:.0f}s")
+                else:
+                    self.upload_interval = max(max(1.0, UPLOAD_LOG_DIGEST_INTERVAL), self.upload_interval / 2)
+                self.pending_uploads = max(0, self.pending_uploads - sent)
+                if UPLOAD_LOG_DAILY_CSV:
+                    await self.send_daily_csv(client)
+            except Exception as e:
+                logger.error(f"Upload digest loop error: {e}")
+
+    async def send_upload_digest(self, client: Client) -> int:
+        """Send one #UPLOAD_COMPLETE digest. Returns uploads covered, 0 if none, -1 on failure."""
+        items = await db.get_pending_backups("upload")
+        if not items:
+            return 0
+
+        def header(batch):
+            total = sum(int(item.get("file_size", 0)) for item in batch)
+            return f"#UPLOAD_COMPLETE • {len(batch)} upload(s) • {human_readable_size(total)}"
+
+        text, ids = _build_digest(items, _upload_line, header)
+        if not await self._send(client, text, ids, "Upload digest"):
+            return -1
+        await db.complete_backups(ids, digest=True, persist=False)
+        return len(ids)
+
+    # ----- Daily CSV summary -----
+
+    def _csv_path(self, day: str) -> str:
+        return os.path.join(self.csv_dir, f"upload_log_{day}.csv")
+
+    def _append_csv(self, item: dict):
+        path = self._csv_path(item["received_at"][:10])
+        new_file = not os.path.exists(path)
+        with open(path, "a", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            if new_file:
+                writer.writerow(CSV_FIELDS)
+            writer.writerow([
+                item["received_at"], item["user_id"], item["username"], item["first_name"],
+                item["source"], item["file_name"], item["file_size"], item["link"]
+            ])
+
+    def _finished_csvs(self, today: str) -> list:
+        """(path, day, rows) for the upload logs of days before `today`."""
+        logs = []
+        for path in sorted(glob.glob(self._csv_path("*"))):
+            day = os.path.basename(path)[len("upload_log_"):-len(".csv")]
+            if day >= today:
+                continue
+            with open(path, encoding="utf-8") as f:
+                rows = max(0, sum(1 for _ in f) - 1)
+            logs.append((path, day, rows))
+        return logs
+
+    async def send_daily_csv(self, client: Client):
+        """Attach finished days' upload logs to the backup channel, then delete them."""
+        today = datetime.now().strftime("%Y-%m-%d")
+        loop = asyncio.get_running_loop()
+        for path, day, rows in await loop.run_in_executor(io_executor, self._finished_csvs, today):
+            try:
+                await rpc.send_document(
+                    client, BACKUP_CHANNEL_ID, path,
+                    priority=PRIORITY_BACKUP_LOG,
+                    caption=f"#DAILY_UPLOAD_LOG • {day} • {rows} upload(s)"
+                )
+            except Exception as e:
+                logger.warning(f"Daily upload log {day} not sent, will retry: {e}")
+                return
+            await loop.run_in_executor(io_executor, os.remove, path)
+
+    # ----- File copies -----
+
+    async def _copy_loop(self, client: Client):
+        while True:
+            try:
+                items = await db.get_pending_backups("file", limit=1)
+                if not items:
+                    self._wake_copies.clear()
+                    # Also wakes periodically to pick up items whose retry delay has passed.
+                    try:
+                        await asyncio.wait_for(self._wake_copies.wait(), timeout=RETRY_DELAY)
+                    except asyncio.TimeoutError:
+                        pass
+                    continue
+                await self.copy_bucket.consume()
+                await self._copy(client, items[0])
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Backup copy loop error: {e}")
+                await asyncio.sleep(1)
+
+    async def _copy(self, client: Client, item: dict):
+        caption = (
+            f"#INCOMING_REQUEST\n"
+            f"👤 User: {item.get('first_name', '')} (ID: `{item.get('user_id')}`)\n"
+            f"🕒 Time: {item.get('received_at', '')}\n\n"
+            f"⬇️ **Original File Backup**"
+        )
+        try:
+            await rpc.copy_message(
+                client,
+                BACKUP_CHANNEL_ID,
+                item["chat_id"],
+                item["message_id"],
+                priority=PRIORITY_BACKUP_LOG,
+                caption=caption
+            )
+        except Exception as e:
+            logger.warning(f"Backup copy of message {item.get('message_id')} failed: {e}")
+            await db.fail_backups([item["id"]], RETRY_DELAY, persist=False)
+            return
+        await db.complete_backups([item["id"]], persist=False)
+
+    async def _send(self, client: Client, text: str, ids: list, label: str) -> bool:
+        try:
+            await rpc.send_message(
+                client, BACKUP_CHANNEL_ID, text,
+                priority=PRIORITY_BACKUP_LOG, disable_web_page_preview=True
+            )
+            return True
+        except Exception as e:
+            logger.warning(f"{label} failed, will retry: {e}")
+            await db.fail_backups(ids, RETRY_DELAY, persist=False)
+            return False
+
+    async def snapshot(self) -> dict:
+        return {
+            "running": any(not task.done() for task in self._tasks),
+            "upload_interval": round(self.upload_interval),
+            **(await db.get_backup_queue_stats())
+        }
+
+# Global backup dispatcher instance
+backup_dispatcher = BackupDispatcher()
@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+import asyncio
+import logging
+import time
+from config import BANDWIDTH_INGRESS_MBPS, BANDWIDTH_EGRESS_MBPS, BANDWIDTH_CONTROL_RESERVE
+from .rate_limit import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+DIRECTIONS = ("ingress", "egress")
+MBPS = 1_000_000 / 8  # bytes per second in one megabit per second
+
+DEFAULT_BANDWIDTH_LIMITS = {
+    "ingress": BANDWIDTH_INGRESS_MBPS,
+    "egress": BANDWIDTH_EGRESS_MBPS,
+    "control_reserve": BANDWIDTH_CONTROL_RESERVE,
+}
+
+REBALANCE_INTERVAL = 1.0  # seconds between fair-share recalculations
+UNSHAPED = float("inf")
+
+class Pacer:
+    """Byte pacer on a TokenBucket.
+
+    Callers take their bytes up front (the bucket may go into debt) and then
+    sleep for the returned delay, so concurrent transfers queue in order.
+    """
+
+    def __init__(self, rate: float):
+        self.bucket = TokenBucket(rate, rate)
+
+    def take(self, nbytes: int) -> float:
+        self.bucket.consume_now(nbytes)
+        if self.bucket.tokens >= 0:
+            return 0.0
+        return -self.bucket.tokens / self.bucket.rate
+
+    def set_rate(self, rate: float):
+        self.bucket.set_rate(rate, rate)
+
+def fair_level(rate: float, demands: list) -> float:
+    """Max-min fair cap: transfers wanting less than an equal share keep what they use,
+    the rest split what is left. Returns UNSHAPED when every demand fits."""
+    remaining, left = rate, len(demands)
+    for demand in sorted(demands):
+        if demand * left > remaining:
+            return remaining / left
+        remaining -= demand
+        left -= 1
+    return UNSHAPED
+
+class ShapedTransfer:
+    """One job's traffic in one direction; await `throttle(nbytes)` after each chunk."""
+
+    def __init__(self, manager, direction: str, label: str):
+        self.manager = manager
+        self.direction = direction
+        self.label = label
+        self.pacer = None
+        self.bytes = 0
+        self.throttled_seconds = 0.0
+        self.window_bytes = 0
+        self.window_throttled = 0.0
+        self.window_started = time.monotonic()
+
+    def _delay(self, nbytes: int) -> float:
+        self.bytes += nbytes
+        self.window_bytes += nbytes
+        self.manager.bytes[self.direction] += nbytes
+        if time.monotonic() - self.manager.rebalanced_at[self.direction] >= REBALANCE_INTERVAL:
+            self.manager._rebalance(self.direction)
+        pacers = [self.manager.pacers.get(self.direction), self.pacer]
+        delay = max([p.take(nbytes) for p in pacers if p is not None] or [0.0])
+        self.throttled_seconds += delay
+        self.window_throttled += delay
+        self.manager.throttled_seconds[self.direction] += delay
+        return delay
+
+    async def throttle(self, nbytes: int):
+        delay = self._delay(nbytes)
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    def demand(self, now: float) -> float:
+        """Bytes per second this transfer would use if we did not hold it back."""
+        elapsed = now - self.window_started
+        if elapsed < REBALANCE_INTERVAL / 2 or self.window_throttled > 0.05 * elapsed:
+            # New, or paced by us: it could use more than it got.
+            return UNSHAPED
+        # Never held back, so the source, the disk or the far end limits it.
+        return self.window_bytes / elapsed
+
+    def __enter__(self):
+        self.manager._join(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.manager._leave(self)
+        return False
+
+class BandwidthManager:
+    """Ingress/egress shaping for transfers.
+
+    Each direction has a global pacer at its link rate minus the control
+    reserve (left free for the MTProto connection and API calls). Running
+    transfers are capped at a max-min fair share recalculated every
+    REBALANCE_INTERVAL: a transfer limited elsewhere (a slow source, the
+    disk) only counts for what it actually uses, and what it leaves is split
+    among the others. A limit of 0 leaves the direction unshaped.
+    """
+
+    def __init__(self):
+        self.limits = dict(DEFAULT_BANDWIDTH_LIMITS)
+        self.pacers = {}
+        self.transfers = {direction: set() for direction in DIRECTIONS}
+        self.shares = {direction: 0.0 for direction in DIRECTIONS}
+        self.rebalanced_at = {direction: 0.0 for direction in DIRECTIONS}
+        self.bytes = {direction: 0 for direction in DIRECTIONS}
+        self.throttled_seconds = {direction: 0.0 for direction in DIRECTIONS}
+        self._apply()
+
+    def effective_rate(self, direction: str) -> float:
+        """Bytes per second available to transfers in `direction` (0 = unlimited)."""
+        mbps = float(self.limits.get(direction, 0) or 0)
+        reserve = min(0.9, max(0.0, float(self.limits.get("control_reserve", 0) or 0)))
+        return mbps * MBPS * (1 - reserve)
+
+    def configure(self, limits: dict):
+        """Apply admin overrides; missing keys keep their defaults."""
+        self.limits = dict(DEFAULT_BANDWIDTH_LIMITS)
+        for key, value in (limits or {}).items():
+            if key in self.limits:
+                self.limits[key] = float(value)
+        self._apply()
+
+    def _apply(self):
+        for direction in DIRECTIONS:
+            rate = self.effective_rate(direction)
+            if rate <= 0:
+                self.pacers.pop(direction, None)
+            elif direction in self.pacers:
+                self.pacers[direction].set_rate(rate)
+            else:
+                self.pacers[direction] = Pacer(rate)
+            self._rebalance(direction)
+
+    def _rebalance(self, direction: str):
+        now = time.monotonic()
+        self.rebalanced_at[direction] = now
+        transfers = self.transfers[direction]
+        rate = self.effective_rate(direction)
+        level = fair_level(rate, [t.demand(now) for t in transfers]) if rate > 0 and transfers else UNSHAPED
+        self.shares[direction] = 0.0 if level == UNSHAPED else level
+        for transfer in transfers:
+            transfer.window_bytes = 0
+            transfer.window_throttled = 0.0
+            transfer.window_started = now
+            if level == UNSHAPED:
+                # Everyone fits; the direction's pacer alone keeps the total in line.
+                transfer.pacer = None
+            elif transfer.pacer is None:
+                transfer.pacer = Pacer(level)
+            else:
+                transfer.pacer.set_rate(level)
+
+    def _join(self, transfer: ShapedTransfer):
+        self.transfers[transfer.direction].add(transfer)
+        self._rebalance(transfer.direction)
+
+    def _leave(self, transfer: ShapedTransfer):
+        self.transfers[transfer.direction].discard(transfer)
+        self._rebalance(transfer.direction)
+
+    def transfer(self, direction: str, label: str = "") -> ShapedTransfer:
+        """Shape one job's traffic; use as a `with` block around the transfer."""
+        if direction not in DIRECTIONS:
+            raise ValueError(f"Unknown bandwidth direction: {direction}")
+        return ShapedTransfer(self, direction, label)
+
+    def snapshot(self) -> dict:
+        return {
+            "limits": dict(self.limits),
+            "directions": {
+                direction: {
+                    "rate": round(self.effective_rate(direction)),
+                    "active": len(self.transfers[direction]),
+                    "share": round(self.shares[direction]),
+                    "bytes": self.bytes[direction],
+                    "throttled_seconds": round(self.throttled_seconds[direction], 1)
+                }
+                for direction in DIRECTIONS
+            }
+        }
+
+# Global bandwidth manager instance
+bandwidth = BandwidthManager()
@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+import asyncio
+import logging
+import time
+import uuid
+from collections import deque
+from config import BATCH_PARALLELISM, BATCH_GROUP_WINDOW, BATCH_SESSION_TIMEOUT, BATCH_MAX_FILES
+from .metrics import batches_total
+
+logger = logging.getLogger(__name__)
+
+class BatchFull(Exception):
+    """The batch already has BATCH_MAX_FILES members."""
+
+class Batch:
+    """Files uploaded together into one GoFile folder and answered with one summary.
+
+    Members are handed to the transfer pipeline at most BATCH_PARALLELISM at
+    a time; the rest wait here instead of occupying pipeline workers.
+    """
+
+    def __init__(self, manager, user_id: int, chat_id: int, origin: str, status_msg=None, group_id: str = None):
+        self.manager = manager
+        self.id = uuid.uuid4().hex[:10]
+        self.user_id = user_id
+        self.chat_id = chat_id
+        self.status_msg = status_msg
+        self.origin = origin  # "album" or "command"
+        self.group_id = group_id
+        self.jobs = []
+        self.pending = deque()
+        self.running = 0
+        self.finished = 0
+        self.closed = False
+        self.completed = False
+        self.folder = None
+        self.folder_error = ""
+        self.touched_at = time.monotonic()
+        self.created_at = self.touched_at
+        self._folder_lock = asyncio.Lock()
+        self._ready = asyncio.Event()
+        self._timer = None
+        if status_msg is not None:
+            self._ready.set()
+
+    def set_status_msg(self, status_msg):
+        """Attach the shared status message; members added meanwhile wait for it."""
+        self.status_msg = status_msg
+        self._ready.set()
+
+    @property
+    def done(self) -> bool:
+        return self.closed and self.finished >= len(self.jobs)
+
+    async def add(self, job):
+        await self._ready.wait()
+        if len(self.jobs) >= BATCH_MAX_FILES:
+            raise BatchFull(f"A batch holds at most {BATCH_MAX_FILES} files.")
+        job.batch = self
+        self.jobs.append(job)
+        self.pending.append(job)
+        self.touched_at = time.monotonic()
+        self.manager.touch(self)
+        await self._pump()
+
+    async def _pump(self):
+        while self.pending and self.running < max(1, BATCH_PARALLELISM):
+            self.running += 1
+            await self.manager.submit(self.pending.popleft())
+
+    async def member_done(self, job):
+        self.running -= 1
+        self.finished += 1
+        await self._pump()
+        if self.manager.on_progress is not None and not self.done:
+            await self.manager.on_progress(self)
+        await self._maybe_complete()
+
+    async def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        if self._timer is not None:
+            self._timer.cancel()
+        self.manager._forget(self)
+        await self._maybe_complete()
+
+    async def _maybe_complete(self):
+        if not self.done or self.completed:
+            return
+        self.completed = True
+        batches_total.inc(origin=self.origin, result="empty" if not self.jobs else "completed")
+        if self.manager.on_complete is not None:
+            try:
+                await self.manager.on_complete(self)
+            except Exception as e:
+                logger.error(f"Batch {self.id} completion handler failed: {e}")
+
+    async def ensure_folder(self, create):
+        """Create the batch's GoFile folder once; `create()` returns folder info or raises."""
+        async with self._folder_lock:
+            if self.folder is None and not self.folder_error:
+                try:
+                    self.folder = await create()
+                except Exception as e:
+                    # Members still upload; the summary then lists one link per file.
+                    self.folder_error = str(e) or e.__class__.__name__
+                    logger.warning(f"Batch {self.id}: GoFile folder not created: {self.folder_error}")
+            return self.folder
+
+    def close_later(self, delay: float):
+        """(Re)arm the timer that closes the batch after `delay` idle seconds."""
+        if self._timer is not None:
+            self._timer.cancel()
+        self._timer = asyncio.get_running_loop().call_later(
+            delay, lambda: asyncio.ensure_future(self.close())
+        )
+
+    def results(self) -> list:
+        return [
+            {
+                "file_name": job.file_name,
+                "file_size": job.file_size,
+                "link": job.link,
+                "error": job.error
+            }
+            for job in self.jobs
+        ]
+
+class BatchManager:
+    """Open batches by Telegram media group and by /batch session."""
+
+    def __init__(self):
+        self.media_groups = {}
+        self.sessions = {}
+        self.submit = None
+        self.on_progress = None
+        self.on_complete = None
+
+    def configure(self, submit, on_complete, on_progress=None):
+        self.submit = submit
+        self.on_complete = on_complete
+        self.on_progress = on_progress
+
+    def _forget(self, batch: Batch):
+        if batch.group_id and self.media_groups.get(batch.group_id) is batch:
+            self.media_groups.pop(batch.group_id, None)
+        if self.sessions.get(batch.user_id) is batch:
+            self.sessions.pop(batch.user_id, None)
+
+    def media_group(self, group_id: str) -> Batch:
+        return self.media_groups.get(group_id)
+
+    def open_media_group(self, group_id: str, user_id: int, chat_id: int) -> Batch:
+        """Register the album's batch before any await, so concurrent parts find it."""
+        batch = Batch(self, user_id, chat_id, "album", group_id=group_id)
+        self.media_groups[group_id] = batch
+        return batch
+
+    def session(self, user_id: int) -> Batch:
+        return self.sessions.get(user_id)
+
+    def open_session(self, user_id: int, chat_id: int, status_msg) -> Batch:
+        batch = Batch(self, user_id, chat_id, "command", status_msg=status_msg)
+        self.sessions[user_id] = batch
+        self.touch(batch)
+        return batch
+
+    def touch(self, batch: Batch):
+        """Restart the idle timer after a new member arrives."""
+        if batch.origin == "album":
+            # Telegram delivers an album as separate updates within about a second.
+            batch.close_later(BATCH_GROUP_WINDOW)
+        else:
+            # A forgotten /batch session still closes and gets its summary.
+            batch.close_later(BATCH_SESSION_TIMEOUT)
+
+    def snapshot(self) -> dict:
+        open_batches = list(self.media_groups.values()) + list(self.sessions.values())
+        return {
+            "open": len(open_batches),
+            "albums": len(self.media_groups),
+            "sessions": len(self.sessions),
+            "files": sum(len(batch.jobs) for batch in open_batches)
+        }
+
+# Global batch manager instance
+batch_manager = BatchManager()
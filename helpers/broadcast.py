@@ -1,13 +1,23 @@
 #!/usr/bin/env python3
 import asyncio
 import logging
+import uuid
+from collections import deque
 from pyrogram import Client
 from pyrogram.errors import FloodWait, InputUserDeactivated, UserIsBlocked, PeerIdInvalid
 from database import db
 from datetime import datetime
+from config import (
+    BROADCAST_WORKERS, BROADCAST_RATE, BROADCAST_PROGRESS_INTERVAL, BROADCAST_CHECKPOINT_EVERY,
+    BROADCAST_THROTTLE_RETRIES
+)
+from .rate_limit import TokenBucket
+from .rpc_governor import rpc, PRIORITY_BROADCAST, PRIORITY_STATUS_EDIT
 
 logger = logging.getLogger(__name__)
 
+ACTIVE_JOB_STATUSES = ("running", "paused")
+
 class BroadcastStats:
     def __init__(self):
         self.success = 0
@@ -17,6 +27,408 @@ class BroadcastStats:
         self.total = 0
         self.start_time = None
         self.end_time = None
+        self.active_seconds = None
+        self.resumed_at = None
+
+    @property
+    def processed(self):
+        return self.success + self.failed
+
+    @property
+    def duration(self):
+        if not self.start_time:
+            return 0.0
+        if self.active_seconds is not None:
+            # Time spent paused does not count against the rate.
+            running = (datetime.now() - self.resumed_at).total_seconds() if self.resumed_at else 0.0
+            return max(0.001, self.active_seconds + running)
+        end = self.end_time or datetime.now()
+        return max(0.001, (end - self.start_time).total_seconds())
+
+    @property
+    def rate(self):
+        """Measured deliveries per second."""
+        return self.processed / self.duration if self.start_time else 0.0
+
+    @classmethod
+    def from_job(cls, job: dict):
+        stats = cls()
+        counters = job.get("counters", {})
+        stats.success = int(counters.get("success", 0))
+        stats.failed = int(counters.get("failed", 0))
+        stats.blocked = int(counters.get("blocked", 0))
+        stats.deleted = int(counters.get("deleted", 0))
+        stats.total = int(job.get("total", 0))
+        stats.start_time = datetime.fromisoformat(job["started_at"]) if job.get("started_at") else None
+        stats.end_time = datetime.fromisoformat(job["finished_at"]) if job.get("finished_at") else None
+        if "active_seconds" in job:
+            stats.active_seconds = float(job["active_seconds"])
+            stats.resumed_at = datetime.fromisoformat(job["resumed_at"]) if job.get("resumed_at") else None
+        return stats
+
+async def send_broadcast_copy(message, user_id: int, forward: bool = False, pin: bool = False) -> str:
+    """Deliver one broadcast message. Returns the outcome name."""
+    try:
+        send = message.forward if forward else message.copy
+        sent = await rpc.call(
+            send, user_id,
+            family="send", priority=PRIORITY_BROADCAST, chat_id=user_id
+        )
+
+        if pin:
+            try:
+                await rpc.call(
+                    sent.pin, disable_notification=True,
+                    family="other", priority=PRIORITY_BROADCAST
+                )
+            except:
+                pass
+
+        return "success"
+
+    except FloodWait:
+        # The governor already paused every sender and retried; the job re-queues this user.
+        return "throttled"
+
+    except InputUserDeactivated:
+        return "deleted"
+
+    except UserIsBlocked:
+        return "blocked"
+
+    except PeerIdInvalid:
+        return "invalid"
+
+    except Exception as e:
+        logger.error(f"Broadcast error for {user_id}: {e}")
+        return "failed"
+
+def apply_outcome(counters: dict, outcome: str):
+    if outcome == "success":
+        counters["success"] = counters.get("success", 0) + 1
+        return
+    counters["failed"] = counters.get("failed", 0) + 1
+    if outcome in ("blocked", "deleted"):
+        counters[outcome] = counters.get(outcome, 0) + 1
+
+def track_active_time(job: dict, running: bool = True):
+    """Fold the current run segment into `active_seconds`."""
+    now = datetime.now()
+    if job.get("resumed_at"):
+        elapsed = (now - datetime.fromisoformat(job["resumed_at"])).total_seconds()
+        job["active_seconds"] = float(job.get("active_seconds", 0.0)) + max(0.0, elapsed)
+    job["resumed_at"] = now.isoformat() if running else ""
+
+def format_audience(audience: dict = None) -> str:
+    """Human-readable summary of a broadcast audience."""
+    audience = audience or {}
+    parts = []
+    if audience.get("active_days"):
+        parts.append(f"active ≤ {int(audience['active_days'])}d")
+    if audience.get("language"):
+        parts.append(f"lang `{audience['language']}`")
+    if audience.get("premium"):
+        parts.append("premium")
+    if audience.get("uploaders"):
+        parts.append("uploaders")
+    if audience.get("joined_after"):
+        parts.append(f"joined ≥ {audience['joined_after']}")
+    return " + ".join(parts) if parts else "All users"
+
+def format_job_progress(job: dict) -> str:
+    stats = BroadcastStats.from_job(job)
+    progress = stats.processed / stats.total * 100 if stats.total else 100.0
+    return (
+        f"📡 **Broadcasting...** `#{job['id']}`\n\n"
+        f"✅ Success: `{stats.success}`\n"
+        f"❌ Failed: `{stats.failed}`\n"
+        f"📊 Progress: `{progress:.1f}%`\n"
+        f"⚡ Rate: `{stats.rate:.1f}` msgs/s"
+    )
+
+def format_job_report(job: dict) -> str:
+    stats = BroadcastStats.from_job(job)
+    title = {
+        "completed": "📡 **Broadcast Completed!**",
+        "paused": "⏸ **Broadcast Paused**",
+        "cancelled": "⛔ **Broadcast Cancelled**",
+        "failed": "❌ **Broadcast Failed**",
+    }.get(job.get("status"), "📡 **Broadcast**")
+    return (
+        f"{title} `#{job['id']}`\n\n"
+        f"🎯 Audience: {format_audience(job.get('audience'))}\n"
+        f"👥 Total Users: `{stats.total}`\n"
+        f"✅ Success: `{stats.success}`\n"
+        f"❌ Failed: `{stats.failed}`\n"
+        f"🚫 Blocked: `{stats.blocked}`\n"
+        f"👻 Deleted: `{stats.deleted}`\n"
+        f"⏭ Skipped (unreachable): `{int(job.get('skipped_unreachable', 0))}`\n"
+        f"⏱ Duration: `{stats.duration:.1f}s`\n"
+        f"⚡ Throughput: `{stats.rate:.1f}` msgs/s"
+    )
+
+class BroadcastManager:
+    """Runs persistent broadcast jobs.
+
+    Recipients are visited in ascending user-id order. `cursor` is the last
+    user id whose delivery (and every delivery before it) has finished, and
+    counters only include those users, so a job resumed after a restart
+    continues exactly after its last checkpoint. Users skipped on FloodWait
+    are kept in `requeued` with their attempt count and retried in further
+    passes, up to BROADCAST_THROTTLE_RETRIES, before they count as failed.
+    """
+
+    def __init__(self):
+        self.tasks = {}
+        self.on_finished = None
+
+    def is_running(self, job_id: str) -> bool:
+        task = self.tasks.get(job_id)
+        return task is not None and not task.done()
+
+    async def start(
+        self,
+        client: Client,
+        source_chat: int,
+        source_message: int,
+        status_chat: int,
+        status_message: int,
+        forward: bool = False,
+        pin: bool = False,
+        created_by: int = 0,
+        include_unreachable: bool = False,
+        audience: dict = None
+    ) -> dict:
+        job = {
+            "id": uuid.uuid4().hex[:8],
+            "source_chat": source_chat,
+            "source_message": source_message,
+            "status_chat": status_chat,
+            "status_message": status_message,
+            "forward": bool(forward),
+            "pin": bool(pin),
+            "include_unreachable": bool(include_unreachable),
+            "audience": dict(audience or {}),
+            "created_by": int(created_by or 0),
+            "status": "running",
+            "cursor": None,
+            "total": 0,
+            "skipped_unreachable": 0,
+            "requeued": [],
+            "counters": {"success": 0, "failed": 0, "blocked": 0, "deleted": 0},
+            "active_seconds": 0.0,
+            "resumed_at": "",
+            "created_at": datetime.now().isoformat(),
+            "started_at": datetime.now().isoformat(),
+            "updated_at": datetime.now().isoformat(),
+            "finished_at": ""
+        }
+        await db.create_broadcast_job(job)
+        self._spawn(client, job)
+        return job
+
+    def _spawn(self, client: Client, job: dict):
+        self.tasks[job["id"]] = asyncio.create_task(self._run(client, job))
+
+    async def resume_all(self, client: Client) -> int:
+        """Restart jobs that were running when the process stopped."""
+        resumed = 0
+        for job in await db.get_broadcast_jobs(statuses=["running"]):
+            if not self.is_running(job["id"]):
+                logger.info(f"Resuming broadcast job {job['id']} after cursor {job.get('cursor')}")
+                self._spawn(client, job)
+                resumed += 1
+        return resumed
+
+    async def pause(self, job_id: str) -> bool:
+        job = await db.get_broadcast_job(job_id)
+        if not job or job.get("status") != "running":
+            return False
+        job["status"] = "paused"
+        if not self.is_running(job_id):
+            await db.save()
+        return True
+
+    async def resume(self, client: Client, job_id: str) -> bool:
+        job = await db.get_broadcast_job(job_id)
+        if not job or job.get("status") != "paused" or self.is_running(job_id):
+            return False
+        job["status"] = "running"
+        await db.save()
+        self._spawn(client, job)
+        return True
+
+    async def cancel(self, job_id: str) -> bool:
+        job = await db.get_broadcast_job(job_id)
+        if not job or job.get("status") not in ACTIVE_JOB_STATUSES:
+            return False
+        job["status"] = "cancelled"
+        if not self.is_running(job_id):
+            job["finished_at"] = datetime.now().isoformat()
+            await db.save()
+        return True
+
+    async def stop(self):
+        """Checkpoint and stop all running jobs for shutdown (they stay 'running')."""
+        for task in list(self.tasks.values()):
+            task.cancel()
+        await asyncio.gather(*self.tasks.values(), return_exceptions=True)
+
+    async def _edit_status(self, client: Client, job: dict, text: str):
+        try:
+            await rpc.call(
+                client.edit_message_text, job["status_chat"], job["status_message"], text,
+                family="edit", priority=PRIORITY_STATUS_EDIT, chat_id=job["status_chat"]
+            )
+        except Exception as e:
+            logger.debug(f"Broadcast status edit skipped for {job['id']}: {e}")
+
+    async def _report_progress(self, client: Client, job: dict):
+        last_text = ""
+        while True:
+            await asyncio.sleep(BROADCAST_PROGRESS_INTERVAL)
+            text = format_job_progress(job)
+            if text != last_text:
+                await self._edit_status(client, job, text)
+                last_text = text
+
+    async def _recipients(self, job: dict) -> list:
+        cursor = job.get("cursor")
+        audience = job.get("audience") or {}
+        user_ids = await db.resolve_audience(audience, include_unreachable=job.get("include_unreachable", False))
+        if job.get("total", 0) == 0:
+            job["total"] = len(user_ids)
+            audience_size = await db.count_audience(audience, include_unreachable=True)
+            job["skipped_unreachable"] = max(0, audience_size - len(user_ids))
+            await db.record_sends_avoided(job["skipped_unreachable"], persist=False)
+        if cursor is not None:
+            user_ids = [uid for uid in user_ids if uid > int(cursor)]
+        return user_ids
+
+    async def _run(self, client: Client, job: dict):
+        job_id = job["id"]
+        reporter = None
+        retry = {int(user_id): int(attempts) for user_id, attempts in job.get("requeued", [])}
+        # A segment cut short by a crash is only counted up to its last checkpoint.
+        job["resumed_at"] = datetime.now().isoformat()
+        try:
+            message = await client.get_messages(job["source_chat"], job["source_message"])
+            if not message or getattr(message, "empty", False):
+                raise ValueError("source message is no longer available")
+
+            recipients = await self._recipients(job)
+            worker_count = max(1, min(BROADCAST_WORKERS, len(recipients) + len(retry) or 1))
+            bucket = TokenBucket(BROADCAST_RATE, BROADCAST_RATE)
+            pending = asyncio.Queue(maxsize=worker_count * 2)
+            dispatched = deque()
+            outcomes = {}
+            since_checkpoint = 0
+
+            async def checkpoint():
+                job["requeued"] = [[user_id, attempts] for user_id, attempts in retry.items()]
+                track_active_time(job)
+                job["updated_at"] = datetime.now().isoformat()
+                await db.save()
+
+            async def sender():
+                nonlocal since_checkpoint
+                while True:
+                    item = await pending.get()
+                    try:
+                        if item is None:
+                            return
+                        user_id, attempt = item
+                        await bucket.consume()
+                        outcome = await send_broadcast_copy(
+                            message, user_id, forward=job["forward"], pin=job["pin"]
+                        )
+                        requeue = outcome == "throttled" and attempt < BROADCAST_THROTTLE_RETRIES
+                        if not requeue:
+                            await db.record_delivery(user_id, outcome, persist=False)
+                        if attempt:
+                            # A retry pass: the cursor is already past this user.
+                            if requeue:
+                                retry[user_id] = attempt + 1
+                            else:
+                                retry.pop(user_id, None)
+                                apply_outcome(job["counters"], outcome)
+                                since_checkpoint += 1
+                        else:
+                            outcomes[user_id] = "requeued" if requeue else outcome
+                        # Advance the contiguous watermark and fold finished outcomes into counters.
+                        while dispatched and dispatched[0] in outcomes:
+                            done_id = dispatched.popleft()
+                            done_outcome = outcomes.pop(done_id)
+                            if done_outcome == "requeued":
+                                retry[done_id] = 1
+                            else:
+                                apply_outcome(job["counters"], done_outcome)
+                            job["cursor"] = done_id
+                            since_checkpoint += 1
+                        if since_checkpoint >= BROADCAST_CHECKPOINT_EVERY:
+                            since_checkpoint = 0
+                            await checkpoint()
+                    finally:
+                        pending.task_done()
+
+            async def produce():
+                for user_id in recipients:
+                    if job["status"] != "running":
+                        break
+                    dispatched.append(user_id)
+                    await pending.put((user_id, 0))
+                # Throttled users get another pass once the previous one has finished.
+                while job["status"] == "running":
+                    await pending.join()
+                    if not retry:
+                        break
+                    for user_id, attempts in list(retry.items()):
+                        if job["status"] != "running":
+                            break
+                        await pending.put((user_id, attempts))
+                for _ in range(worker_count):
+                    await pending.put(None)
+
+            reporter = asyncio.create_task(self._report_progress(client, job))
+            try:
+                # A sender that dies cancels the producer instead of leaving it blocked on a full queue.
+                async with asyncio.TaskGroup() as group:
+                    for _ in range(worker_count):
+                        group.create_task(sender())
+                    group.create_task(produce())
+            except ExceptionGroup as e:
+                raise e.exceptions[0]
+
+            if job["status"] == "running":
+                job["status"] = "completed"
+        except asyncio.CancelledError:
+            # Shutdown: leave the job 'running' so it resumes on next start.
+            raise
+        except Exception as e:
+            logger.error(f"Broadcast job {job_id} failed: {e}")
+            job["status"] = "failed"
+            job["error"] = str(e)[:200]
+        finally:
+            if reporter:
+                reporter.cancel()
+                await asyncio.gather(reporter, return_exceptions=True)
+            job["requeued"] = [[user_id, attempts] for user_id, attempts in retry.items()]
+            track_active_time(job, running=False)
+            if job["status"] in ("completed", "cancelled", "failed"):
+                job["finished_at"] = datetime.now().isoformat()
+            job["updated_at"] = datetime.now().isoformat()
+            await db.save()
+            self.tasks.pop(job_id, None)
+
+        await self._edit_status(client, job, format_job_report(job))
+        if self.on_finished and job["status"] != "paused":
+            try:
+                await self.on_finished(job)
+            except Exception as e:
+                logger.error(f"Broadcast completion hook failed for {job_id}: {e}")
+
+# Global broadcast manager instance
+broadcast_manager = BroadcastManager()
 
 async def broadcast_message(
     client: Client,
@@ -26,8 +438,8 @@ async def broadcast_message(
     pin: bool = False
 ):
     """
-    Broadcast message to all users
-    
+    Broadcast message to all reachable users and wait for the job to finish
+
     Args:
         client: Pyrogram client
         message: Message to broadcast
@@ -35,97 +447,13 @@ async def broadcast_message(
         forward: Whether to forward or copy message
         pin: Whether to pin message in user's chat
     """
-    stats = BroadcastStats()
-    stats.start_time = datetime.now()
-    
-    users = await db.get_all_users()
-    stats.total = len(users)
-    
-    if stats.total == 0:
-        await status_msg.edit_text("❌ **No users to broadcast to!**")
-        return stats
-    
-    await status_msg.edit_text(
-        f"📡 **Broadcasting Started...**\n\n"
-        f"👥 Total Users: `{stats.total}`\n"
-        f"⏳ Please wait..."
-    )
-    
-    # Process users in batches to avoid rate limits
-    batch_size = 25
-    user_ids = list(users.keys())
-    
-    for i in range(0, len(user_ids), batch_size):
-        batch = user_ids[i:i + batch_size]
-        
-        for user_id in batch:
-            try:
-                user_id_int = int(user_id)
-                
-                if forward:
-                    sent = await message.forward(user_id_int)
-                else:
-                    sent = await message.copy(user_id_int)
-                
-                if pin:
-                    try:
-                        await sent.pin(disable_notification=True)
-                    except:
-                        pass
-                
-                stats.success += 1
-                
-            except FloodWait as e:
-                await asyncio.sleep(e.value)
-                try:
-                    if forward:
-                        await message.forward(int(user_id))
-                    else:
-                        await message.copy(int(user_id))
-                    stats.success += 1
-                except:
-                    stats.failed += 1
-                    
-            except InputUserDeactivated:
-                stats.deleted += 1
-                stats.failed += 1
-                
-            except UserIsBlocked:
-                stats.blocked += 1
-                stats.failed += 1
-                
-            except PeerIdInvalid:
-                stats.failed += 1
-                
-            except Exception as e:
-                logger.error(f"Broadcast error for {user_id}: {e}")
-                stats.failed += 1
-        
-        # Update progress every batch
-        progress = (i + len(batch)) / stats.total * 100
-        await status_msg.edit_text(
-            f"📡 **Broadcasting...**\n\n"
-            f"✅ Success: `{stats.success}`\n"
-            f"❌ Failed: `{stats.failed}`\n"
-            f"📊 Progress: `{progress:.1f}%`"
-        )
-        
-        # Small delay between batches
-        await asyncio.sleep(0.5)
-    
-    stats.end_time = datetime.now()
-    duration = (stats.end_time - stats.start_time).seconds
-    
-    final_text = (
-        f"📡 **Broadcast Completed!**\n\n"
-        f"👥 Total Users: `{stats.total}`\n"
-        f"✅ Success: `{stats.success}`\n"
-        f"❌ Failed: `{stats.failed}`\n"
-        f"🚫 Blocked: `{stats.blocked}`\n"
-        f"👻 Deleted: `{stats.deleted}`\n"
-        f"⏱ Duration: `{duration}s`"
+    job = await broadcast_manager.start(
+        client,
+        message.chat.id, message.id,
+        status_msg.chat.id, status_msg.id,
+        forward=forward, pin=pin
     )
-    
-    await status_msg.edit_text(final_text)
-    
-    return stats
\ No newline at end of file
+    task = broadcast_manager.tasks.get(job["id"])
+    if task:
+        await asyncio.gather(task, return_exceptions=True)
+    return BroadcastStats.from_job(job)
@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+import asyncio
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+import aiofiles
+from config import DISK_WRITE_BUFFER, DISK_IO_WORKERS
+from .metrics import disk_written_bytes, disk_write_seconds, disk_blocked_seconds
+
+logger = logging.getLogger(__name__)
+
+# Disk writes get their own threads so slow disks never starve the default executor.
+io_executor = ThreadPoolExecutor(max_workers=DISK_IO_WORKERS, thread_name_prefix="disk-io")
+
+class WriteBehindFile:
+    """Buffered async file writer.
+
+    Chunks are collected in memory and flushed in the background once
+    `buffer_size` bytes are pending, so the producer keeps reading the
+    network while the previous block is written. At most one write is in
+    flight; the producer only waits when a second full buffer is ready.
+
+    Usage:
+        async with WriteBehindFile(path) as f:
+            await f.write(chunk)
+        f.stats()
+    """
+
+    def __init__(self, path: str, buffer_size: int = DISK_WRITE_BUFFER):
+        self.path = path
+        self.buffer_size = max(64 * 1024, int(buffer_size))
+        self.buffer = bytearray()
+        self.bytes_written = 0
+        self.write_seconds = 0.0
+        self.blocked_seconds = 0.0
+        self.started_at = time.monotonic()
+        self._file = None
+        self._pending = None
+
+    async def __aenter__(self):
+        self._file = await aiofiles.open(self.path, "wb", executor=io_executor)
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        try:
+            if exc_type is None:
+                await self.flush()
+            else:
+                try:
+                    await self._wait_pending()
+                except Exception as e:
+                    # Let the download's own error propagate, not the write it interrupted.
+                    logger.warning(f"Background write to {self.path} failed during abort: {e}")
+        finally:
+            await self._file.close()
+        return False
+
+    async def _write_block(self, block: bytes):
+        started = time.perf_counter()
+        await self._file.write(block)
+        elapsed = time.perf_counter() - started
+        self.write_seconds += elapsed
+        self.bytes_written += len(block)
+        disk_write_seconds.inc(elapsed)
+        disk_written_bytes.inc(len(block))
+
+    async def _wait_pending(self):
+        if self._pending is None:
+            return
+        started = time.perf_counter()
+        try:
+            await self._pending
+        finally:
+            self._pending = None
+            blocked = time.perf_counter() - started
+            self.blocked_seconds += blocked
+            disk_blocked_seconds.inc(blocked)
+
+    async def write(self, chunk: bytes):
+        self.buffer += chunk
+        if len(self.buffer) < self.buffer_size:
+            return
+        # Backpressure: only blocks when the disk is slower than the network.
+        await self._wait_pending()
+        block, self.buffer = bytes(self.buffer), bytearray()
+        self._pending = asyncio.ensure_future(self._write_block(block))
+
+    async def flush(self):
+        await self._wait_pending()
+        if self.buffer:
+            block, self.buffer = bytes(self.buffer), bytearray()
+            started = time.perf_counter()
+            await self._write_block(block)
+            blocked = time.perf_counter() - started
+            self.blocked_seconds += blocked
+            disk_blocked_seconds.inc(blocked)
+
+    def stats(self) -> dict:
+        elapsed = max(0.001, time.monotonic() - self.started_at)
+        return {
+            "bytes": self.bytes_written,
+            "write_seconds": round(self.write_seconds, 3),
+            "blocked_seconds": round(self.blocked_seconds, 3),
+            "disk_mbps": round(self.bytes_written / max(0.001, self.write_seconds) / (1024 * 1024), 2),
+            "elapsed": round(elapsed, 3)
+        }
@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+import logging
+import re
+import time
+from collections import OrderedDict
+from config import (
+    ADMIN_IDS, OWNER_ID,
+    FLOOD_URL_RATE, FLOOD_URL_BURST, FLOOD_FILE_RATE, FLOOD_FILE_BURST,
+    FLOOD_COMMAND_RATE, FLOOD_COMMAND_BURST, FLOOD_TEXT_RATE, FLOOD_TEXT_BURST,
+    FLOOD_CALLBACK_RATE, FLOOD_CALLBACK_BURST, FLOOD_GLOBAL_RATE, FLOOD_GLOBAL_BURST,
+    FLOOD_WARN_WINDOW, BATCH_MAX_FILES
+)
+from .batches import batch_manager
+from .rate_limit import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+# kind -> {"rate": updates per second, "burst": bucket size}; "global" covers every user.
+DEFAULT_FLOOD_LIMITS = {
+    "url": {"rate": FLOOD_URL_RATE, "burst": FLOOD_URL_BURST},
+    "file": {"rate": FLOOD_FILE_RATE, "burst": FLOOD_FILE_BURST},
+    "command": {"rate": FLOOD_COMMAND_RATE, "burst": FLOOD_COMMAND_BURST},
+    "text": {"rate": FLOOD_TEXT_RATE, "burst": FLOOD_TEXT_BURST},
+    "callback": {"rate": FLOOD_CALLBACK_RATE, "burst": FLOOD_CALLBACK_BURST},
+    "global": {"rate": FLOOD_GLOBAL_RATE, "burst": FLOOD_GLOBAL_BURST},
+}
+
+MAX_USER_BUCKETS = 10000
+MAX_MEDIA_GROUPS = 1000  # recent albums whose flood decision is remembered
+URL_PATTERN = re.compile(r"https?://", re.IGNORECASE)
+
+def classify_message(message) -> str:
+    """Map a message to the flood-guard kind used for its limit.
+
+    Files sent into an open /batch session return None: the session was
+    charged once, as a command, and BATCH_MAX_FILES bounds it.
+    """
+    if message.document or message.video or message.audio or message.photo:
+        batch = batch_manager.session(message.from_user.id) if message.from_user else None
+        if batch is not None and len(batch.jobs) < BATCH_MAX_FILES:
+            return None
+        return "file"
+    text = message.text or message.caption or ""
+    if text.startswith("/"):
+        return "command"
+    if URL_PATTERN.search(text):
+        return "url"
+    return "text"
+
+class FloodDecision:
+    def __init__(self, allowed: bool, warn: bool = False, retry_after: float = 0.0, scope: str = ""):
+        self.allowed = allowed
+        self.warn = warn
+        self.retry_after = retry_after
+        self.scope = scope
+
+class FloodGuard:
+    """Token-bucket limits per user and update kind, plus one global bucket.
+
+    Checks are synchronous and touch no database or Telegram API, so they
+    can run before any other handler work.
+    """
+
+    def __init__(self):
+        self.limits = {kind: dict(limit) for kind, limit in DEFAULT_FLOOD_LIMITS.items()}
+        self.user_buckets = OrderedDict()
+        self.global_bucket = self._new_bucket("global")
+        self.last_warned = {}
+        self.media_groups = OrderedDict()
+        self.allowed = 0
+        self.dropped = {kind: 0 for kind in DEFAULT_FLOOD_LIMITS}
+        self.warnings = 0
+
+    def _new_bucket(self, kind: str):
+        limit = self.limits.get(kind) or {}
+        rate = float(limit.get("rate", 0) or 0)
+        if rate <= 0:
+            return None
+        return TokenBucket(rate, max(1, int(limit.get("burst", 1) or 1)))
+
+    def configure(self, limits: dict):
+        """Apply admin-provided limits; missing kinds keep their defaults."""
+        for kind, limit in (limits or {}).items():
+            if kind in self.limits:
+                self.limits[kind] = {"rate": float(limit.get("rate", 0)), "burst": int(limit.get("burst", 1))}
+        self.user_buckets.clear()
+        self.global_bucket = self._new_bucket("global")
+
+    def _user_bucket(self, user_id: int, kind: str):
+        key = (int(user_id), kind)
+        if key in self.user_buckets:
+            self.user_buckets.move_to_end(key)
+            return self.user_buckets[key]
+        if len(self.user_buckets) >= MAX_USER_BUCKETS:
+            for stale in [k for k, b in self.user_buckets.items() if b is None or b.idle]:
+                del self.user_buckets[stale]
+            while len(self.user_buckets) >= MAX_USER_BUCKETS:
+                self.user_buckets.popitem(last=False)
+        bucket = self._new_bucket(kind)
+        self.user_buckets[key] = bucket
+        return bucket
+
+    def is_exempt(self, user_id: int) -> bool:
+        return user_id in ADMIN_IDS or user_id == OWNER_ID
+
+    def check_message(self, message) -> FloodDecision:
+        """Check a message; an album is charged once and its other parts share that decision."""
+        group_id = message.media_group_id
+        if group_id and group_id in self.media_groups:
+            self.media_groups.move_to_end(group_id)
+            allowed, scope = self.media_groups[group_id]
+            if allowed:
+                self.allowed += 1
+                return FloodDecision(True)
+            self.dropped[scope] = self.dropped.get(scope, 0) + 1
+            return FloodDecision(False, scope=scope)
+        decision = self.check(message.from_user.id, classify_message(message))
+        if group_id:
+            self.media_groups[group_id] = (decision.allowed, decision.scope)
+            while len(self.media_groups) > MAX_MEDIA_GROUPS:
+                self.media_groups.popitem(last=False)
+        return decision
+
+    def check(self, user_id: int, kind: str) -> FloodDecision:
+        """Charge one update of `kind`; kind None only counts against the global bucket."""
+        if self.is_exempt(user_id):
+            return FloodDecision(True)
+
+        bucket = self._user_bucket(user_id, kind) if kind else None
+        scope = kind
+        wait = bucket.wait_time() if bucket else 0.0
+        if wait <= 0 and self.global_bucket:
+            scope = "global"
+            wait = self.global_bucket.wait_time()
+        if wait <= 0:
+            if bucket:
+                bucket.try_consume()
+            if self.global_bucket:
+                self.global_bucket.try_consume()
+            self.allowed += 1
+            return FloodDecision(True)
+
+        self.dropped[scope] = self.dropped.get(scope, 0) + 1
+        now = time.monotonic()
+        warn = now - self.last_warned.get(user_id, 0) >= FLOOD_WARN_WINDOW
+        if warn:
+            self.last_warned[user_id] = now
+            self.warnings += 1
+            if len(self.last_warned) > MAX_USER_BUCKETS:
+                self.last_warned = {
+                    uid: at for uid, at in self.last_warned.items() if now - at < FLOOD_WARN_WINDOW
+                }
+        return FloodDecision(False, warn=warn, retry_after=wait, scope=scope)
+
+    def snapshot(self) -> dict:
+        return {
+            "limits": {kind: dict(limit) for kind, limit in self.limits.items()},
+            "allowed": self.allowed,
+            "dropped": dict(self.dropped),
+            "warnings": self.warnings,
+            "tracked_buckets": len(self.user_buckets)
+        }
+
+# Global flood guard instance
+flood_guard = FloodGuard()
@@ -9,6 +9,7 @@ except ImportError:
     from pyrogram.errors import UserNotParticipant, ChatAdminRequired, PeerIdInvalid
 from database import db
 from config import SUPPORT_CHAT
+from .rpc_governor import rpc, PRIORITY_USER_REPLY
 import logging
 
 logger = logging.getLogger(__name__)
@@ -24,11 +25,20 @@ def get_channel_candidates(channel_id: int) -> list:
             candidates.append(int(trimmed))
     return list(dict.fromkeys(candidates))
 
-async def check_subscription(client: Client, user_id: int, channel_id: int) -> bool:
-    """Check if user is subscribed to a channel"""
+async def check_subscription(
+    client: Client, user_id: int, channel_id: int,
+    priority: int = PRIORITY_USER_REPLY, raise_errors: bool = False
+) -> bool:
+    """Check if user is subscribed to a channel.
+
+    With `raise_errors`, an RPC error on every channel-id variant is re-raised
+    instead of being reported as "not a member".
+    """
+    answered = False
+    error = None
     for candidate in get_channel_candidates(channel_id):
         try:
-            member = await client.get_chat_member(candidate, user_id)
+            member = await rpc.get_chat_member(client, candidate, user_id, priority=priority)
             # pyrofork returns enum types (e.g. ChatMemberStatus.left) rather than plain strings.
             # Normalise to lowercase string and check both plain and dotted forms.
             normalized_status = str(member.status).lower()
@@ -38,9 +48,11 @@ async def check_subscription(client: Client, user_id: int, channel_id: int) -> b
                 or any(normalized_status.endswith(f".{s}") for s in non_member_statuses)
             )
             if is_non_member:
+                answered = True
                 continue
             return True
         except UserNotParticipant:
+            answered = True
             continue
         except ChatAdminRequired:
             # Bot is not admin in this channel — cannot verify membership.
@@ -55,10 +67,15 @@ async def check_subscription(client: Client, user_id: int, channel_id: int) -> b
             continue
         except Exception as e:
             logger.error(f"FSub check error for channel {candidate}: {e}")
+            error = e
             continue
+    if raise_errors and error is not None and not answered:
+        raise error
     return False
 
-async def check_force_sub(client: Client, user_id: int) -> tuple:
+async def check_force_sub(
+    client: Client, user_id: int, priority: int = PRIORITY_USER_REPLY, raise_errors: bool = False
+) -> tuple:
     """
     Check if user is subscribed to all required channels
     Returns: (is_subscribed: bool, missing_channels: list)
@@ -68,7 +85,9 @@ async def check_force_sub(client: Client, user_id: int) -> tuple:
     
     for channel in channels:
         channel_id = channel["id"]
-        is_subscribed = await check_subscription(client, user_id, channel_id)
+        is_subscribed = await check_subscription(
+            client, user_id, channel_id, priority=priority, raise_errors=raise_errors
+        )
         
         if not is_subscribed:
             missing_channels.append(channel)
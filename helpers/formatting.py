@@ -0,0 +1,10 @@
+#!/usr/bin/env python3
+
+def human_readable_size(size) -> str:
+    """Byte count as a short string, e.g. `1.50 MB`."""
+    size = float(size or 0)
+    for unit in ['B', 'KB', 'MB', 'GB', 'TB']:
+        if size < 1024:
+            return f"{size:.2f} {unit}"
+        size /= 1024
+    return f"{size:.2f} PB"
@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+import asyncio
+import logging
+import time
+from pyrogram import Client
+from database import db
+from config import (
+    ADMIN_IDS, OWNER_ID,
+    FSUB_SWEEP_INTERVAL, FSUB_SWEEP_ACTIVE_DAYS, FSUB_SWEEP_MAX_USERS,
+    FSUB_SWEEP_BATCH_SIZE, FSUB_SWEEP_RATE
+)
+from .force_sub import check_force_sub
+from .rpc_governor import PRIORITY_BACKGROUND
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+class SweepProgress:
+    def __init__(self, trigger: str = "manual", requested_by: int = 0):
+        self.trigger = trigger
+        self.requested_by = requested_by
+        self.status = "running"
+        self.total = 0
+        self.checked = 0
+        self.passed = 0
+        self.failed = 0
+        self.revoked = 0
+        self.errors = 0
+        self.started_at = time.monotonic()
+        self.finished_at = None
+        self.started_iso = datetime.now().isoformat()
+
+    @property
+    def elapsed(self) -> float:
+        end = self.finished_at if self.finished_at is not None else time.monotonic()
+        return max(0.001, end - self.started_at)
+
+    @property
+    def throughput(self) -> float:
+        """Users verified per second."""
+        return self.checked / self.elapsed
+
+    def to_dict(self) -> dict:
+        return {
+            "trigger": self.trigger,
+            "requested_by": self.requested_by,
+            "status": self.status,
+            "total": self.total,
+            "checked": self.checked,
+            "passed": self.passed,
+            "failed": self.failed,
+            "revoked": self.revoked,
+            "errors": self.errors,
+            "duration": round(self.elapsed, 2),
+            "throughput": round(self.throughput, 2),
+            "started_at": self.started_iso
+        }
+
+class FsubSweeper:
+    """Re-verify recently active users against required channels in the background."""
+
+    def __init__(self):
+        self.progress = None
+        self._task = None
+        self._periodic_task = None
+        self._cancel = asyncio.Event()
+
+    def is_running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self, client: Client, trigger: str = "manual", requested_by: int = 0) -> bool:
+        """Start a sweep unless one is already running. Returns True if started."""
+        if self.is_running():
+            return False
+        self._cancel = asyncio.Event()
+        self.progress = SweepProgress(trigger=trigger, requested_by=requested_by)
+        self._task = asyncio.create_task(self._run(client, self.progress))
+        return True
+
+    def cancel(self) -> bool:
+        if not self.is_running():
+            return False
+        self._cancel.set()
+        return True
+
+    async def wait(self):
+        if self._task:
+            await asyncio.gather(self._task, return_exceptions=True)
+
+    async def _select_users(self) -> list:
+        since_unix = int(time.time()) - max(1, FSUB_SWEEP_ACTIVE_DAYS) * 86400
+        user_ids = await db.get_recently_active_user_ids(since_unix, limit=FSUB_SWEEP_MAX_USERS)
+        banned = set(await db.get_banned_users())
+        return [
+            uid for uid in user_ids
+            if uid not in ADMIN_IDS and uid != OWNER_ID and uid not in banned
+        ]
+
+    async def _check_user(self, client: Client, user_id: int, aggressive: bool, progress: SweepProgress):
+        try:
+            # A failed lookup (e.g. ChannelPrivate) is an error, not a revocation.
+            is_subscribed, missing_channels = await check_force_sub(
+                client, user_id, priority=PRIORITY_BACKGROUND, raise_errors=True
+            )
+        except Exception as e:
+            logger.error(f"FSub sweep check failed for {user_id}: {e}")
+            progress.errors += 1
+            return
+
+        is_revoked = not is_subscribed and aggressive
+        await db.record_enforcement_check(
+            passed=is_subscribed,
+            revoked=is_revoked,
+            user_id=user_id,
+            persist=False
+        )
+        progress.checked += 1
+        if is_subscribed:
+            progress.passed += 1
+            return
+        progress.failed += 1
+        if is_revoked:
+            progress.revoked += 1
+            await db.log_user_event(
+                user_id,
+                "enforcement_revoked",
+                metadata={
+                    "reason": "missing_required_channels",
+                    "missing_count": len(missing_channels),
+                    "source": "fsub_sweeper"
+                },
+                persist=False
+            )
+
+    async def _run(self, client: Client, progress: SweepProgress):
+        try:
+            user_ids = await self._select_users()
+            progress.total = len(user_ids)
+            aggressive = (await db.get_enforcement_mode()) == "aggressive"
+            batch_size = max(1, FSUB_SWEEP_BATCH_SIZE)
+            batch_interval = batch_size / max(0.1, FSUB_SWEEP_RATE)
+
+            for i in range(0, len(user_ids), batch_size):
+                if self._cancel.is_set():
+                    progress.status = "cancelled"
+                    break
+                batch_started = time.monotonic()
+                batch = user_ids[i:i + batch_size]
+                await asyncio.gather(*[
+                    self._check_user(client, uid, aggressive, progress) for uid in batch
+                ])
+                await db.save()
+
+                # Pace batches so the sweep never exceeds FSUB_SWEEP_RATE users/sec.
+                remaining = batch_interval - (time.monotonic() - batch_started)
+                if remaining > 0:
+                    try:
+                        await asyncio.wait_for(self._cancel.wait(), timeout=remaining)
+                    except asyncio.TimeoutError:
+                        pass
+            else:
+                progress.status = "completed"
+        except Exception as e:
+            logger.error(f"FSub sweep aborted: {e}")
+            progress.status = "failed"
+        finally:
+            progress.finished_at = time.monotonic()
+            try:
+                await db.record_fsub_sweep(progress.to_dict())
+            except Exception as e:
+                logger.error(f"Failed to store FSub sweep summary: {e}")
+            logger.info(
+                f"FSub sweep {progress.status}: {progress.checked}/{progress.total} checked, "
+                f"{progress.revoked} revoked, {progress.throughput:.2f} users/s"
+            )
+
+    async def run_periodic(self, client: Client):
+        """Sweep on FSUB_SWEEP_INTERVAL while aggressive enforcement is active."""
+        if FSUB_SWEEP_INTERVAL <= 0:
+            return
+        while True:
+            await asyncio.sleep(FSUB_SWEEP_INTERVAL)
+            try:
+                if await db.get_enforcement_mode() != "aggressive":
+                    continue
+                if not await db.is_fsub_enabled():
+                    continue
+                if self.start(client, trigger="scheduled"):
+                    await self.wait()
+            except Exception as e:
+                logger.error(f"Scheduled FSub sweep failed: {e}")
+
+    def start_periodic(self, client: Client):
+        if self._periodic_task is None or self._periodic_task.done():
+            self._periodic_task = asyncio.create_task(self.run_periodic(client))
+
+    async def stop(self):
+        self.cancel()
+        await self.wait()
+        if self._periodic_task:
+            self._periodic_task.cancel()
+            await asyncio.gather(self._periodic_task, return_exceptions=True)
+
+# Global sweeper instance
+fsub_sweeper = FsubSweeper()
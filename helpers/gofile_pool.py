@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+import hashlib
+import logging
+import time
+from collections import deque
+from config import GOFILE_ACCOUNTS, GOFILE_API_TOKEN, GOFILE_FOLDER_ID, GOFILE_QUARANTINE_SECONDS
+from .metrics import gofile_account_in_flight, gofile_account_quarantined
+
+logger = logging.getLogger(__name__)
+
+ERROR_WINDOW = 600  # seconds of errors that count against an account
+AUTH_STATUSES = ("auth", "token", "unauthorized", "forbidden")
+QUOTA_STATUSES = ("quota", "storage", "limit", "premium", "full")
+
+def parse_accounts(raw: str) -> list:
+    """`token[:folder_id]` pairs separated by commas or newlines."""
+    accounts = []
+    for entry in raw.replace("\n", ",").split(","):
+        entry = entry.strip()
+        if not entry:
+            continue
+        token, _, folder_id = entry.partition(":")
+        accounts.append((token.strip(), folder_id.strip()))
+    return accounts
+
+def classify_failure(http_status: int, api_status: str = "") -> str:
+    """Map an upload failure to "auth", "quota" or "error" (only the first two quarantine)."""
+    api_status = (api_status or "").lower()
+    if http_status in (401, 403) or any(word in api_status for word in AUTH_STATUSES):
+        return "auth"
+    if http_status in (413, 507) or any(word in api_status for word in QUOTA_STATUSES):
+        return "quota"
+    return "error"
+
+class GofileAccount:
+    def __init__(self, token: str, folder_id: str = ""):
+        self.token = token
+        self.folder_id = folder_id
+        # Stable, non-secret id for stats and logs.
+        self.id = hashlib.sha1(token.encode()).hexdigest()[:8] if token else "guest"
+        self.in_flight = 0
+        self.uploads = 0
+        self.bytes_stored = 0
+        self.errors = deque()
+        self.quarantined_until = 0.0
+        self.last_error = ""
+
+    def recent_errors(self, now: float = None) -> int:
+        now = now or time.monotonic()
+        while self.errors and now - self.errors[0] > ERROR_WINDOW:
+            self.errors.popleft()
+        return len(self.errors)
+
+    def quarantined(self, now: float = None) -> bool:
+        return self.quarantined_until > (now or time.monotonic())
+
+    @property
+    def headers(self) -> dict:
+        return {"Authorization": f"Bearer {self.token}"} if self.token else {}
+
+class AccountLease:
+    """One upload's hold on an account; report the outcome before leaving the block."""
+
+    def __init__(self, pool, account: GofileAccount):
+        self.pool = pool
+        self.account = account
+
+    def __enter__(self) -> GofileAccount:
+        self.account.in_flight += 1
+        gofile_account_in_flight.set(self.account.in_flight, account=self.account.id)
+        return self.account
+
+    def __exit__(self, exc_type, exc, tb):
+        self.account.in_flight -= 1
+        gofile_account_in_flight.set(self.account.in_flight, account=self.account.id)
+        return False
+
+class GofileAccountPool:
+    """Balance uploads across GoFile accounts.
+
+    Each upload goes to the healthy account with the fewest uploads in
+    flight, then the fewest recent errors, then the least data stored.
+    Auth or quota failures quarantine an account for
+    GOFILE_QUARANTINE_SECONDS; other errors only count against it.
+    """
+
+    def __init__(self, accounts: list = None):
+        if accounts is None:
+            accounts = parse_accounts(GOFILE_ACCOUNTS) or [(GOFILE_API_TOKEN, GOFILE_FOLDER_ID)]
+        self.accounts = [GofileAccount(token, folder_id) for token, folder_id in accounts]
+
+    def load(self, stats: dict):
+        """Restore per-account totals saved in the database."""
+        for account in self.accounts:
+            saved = (stats or {}).get(account.id) or {}
+            account.uploads = int(saved.get("uploads", 0))
+            account.bytes_stored = int(saved.get("bytes_stored", 0))
+
+    def ranked(self) -> list:
+        """Accounts in the order an upload should try them."""
+        now = time.monotonic()
+        healthy = [a for a in self.accounts if not a.quarantined(now)]
+        healthy.sort(key=lambda a: (a.in_flight, a.recent_errors(now), a.bytes_stored))
+        if healthy:
+            return healthy
+        # Everything is quarantined: try the account that comes back soonest rather than failing outright.
+        return sorted(self.accounts, key=lambda a: a.quarantined_until)[:1]
+
+    def lease(self, account: GofileAccount) -> AccountLease:
+        return AccountLease(self, account)
+
+    @property
+    def primary(self) -> GofileAccount:
+        return self.ranked()[0]
+
+    def report_success(self, account: GofileAccount, size: int):
+        account.uploads += 1
+        account.bytes_stored += int(size or 0)
+
+    def report_failure(self, account: GofileAccount, kind: str, detail: str = "") -> bool:
+        """Record a failed upload. Returns True when the account was quarantined."""
+        account.errors.append(time.monotonic())
+        account.last_error = f"{kind}: {detail}"[:200]
+        if kind not in ("auth", "quota"):
+            return False
+        account.quarantined_until = time.monotonic() + GOFILE_QUARANTINE_SECONDS
+        gofile_account_quarantined.set(1, account=account.id)
+        logger.warning(f"GoFile account {account.id} quarantined for {GOFILE_QUARANTINE_SECONDS}s ({kind}: {detail})")
+        return True
+
+    def snapshot(self) -> list:
+        now = time.monotonic()
+        rows = []
+        for account in self.accounts:
+            quarantined = account.quarantined(now)
+            if not quarantined:
+                gofile_account_quarantined.set(0, account=account.id)
+            rows.append({
+                "id": account.id,
+                "folder_id": account.folder_id,
+                "in_flight": account.in_flight,
+                "uploads": account.uploads,
+                "bytes_stored": account.bytes_stored,
+                "recent_errors": account.recent_errors(now),
+                "quarantined_for": round(max(0.0, account.quarantined_until - now)),
+                "last_error": account.last_error
+            })
+        return rows
+
+# Global GoFile account pool
+gofile_pool = GofileAccountPool()
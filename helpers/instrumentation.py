@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+import contextvars
+import functools
+import inspect
+import logging
+import time
+from pyrogram import StopPropagation, ContinuePropagation
+from config import HANDLER_SLOW_SECONDS
+
+logger = logging.getLogger(__name__)
+
+SUB_BUCKET_BITS = 5
+SUB_BUCKET_COUNT = 1 << SUB_BUCKET_BITS
+
+class LatencyHistogram:
+    """Log-linear latency histogram in the style of HdrHistogram.
+
+    Values are recorded in microseconds into SUB_BUCKET_COUNT linear slots
+    per power of two, so percentiles keep ~3% relative precision with a
+    few hundred buckets at most, however many samples are recorded.
+    """
+
+    def __init__(self):
+        self.counts = {}
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    @staticmethod
+    def _index(micros: int) -> int:
+        if micros < SUB_BUCKET_COUNT:
+            return micros
+        shift = micros.bit_length() - SUB_BUCKET_BITS - 1
+        return ((shift + 1) << SUB_BUCKET_BITS) + ((micros >> shift) - SUB_BUCKET_COUNT)
+
+    @staticmethod
+    def _upper_bound(index: int) -> int:
+        if index < SUB_BUCKET_COUNT:
+            return index
+        shift = (index >> SUB_BUCKET_BITS) - 1
+        mantissa = (index & (SUB_BUCKET_COUNT - 1)) + SUB_BUCKET_COUNT
+        return ((mantissa + 1) << shift) - 1
+
+    def record(self, seconds: float):
+        seconds = max(0.0, seconds)
+        index = self._index(int(seconds * 1_000_000))
+        self.counts[index] = self.counts.get(index, 0) + 1
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    def percentile(self, percent: float) -> float:
+        """Value (seconds) at or below which `percent` of samples fall."""
+        if not self.count:
+            return 0.0
+        target = max(1, int(self.count * percent / 100 + 0.999999))
+        seen = 0
+        for index in sorted(self.counts):
+            seen += self.counts[index]
+            if seen >= target:
+                return min(self.max, self._upper_bound(index) / 1_000_000)
+        return self.max
+
+    def summary(self) -> dict:
+        return {
+            "p50": round(self.percentile(50), 4),
+            "p95": round(self.percentile(95), 4),
+            "p99": round(self.percentile(99), 4),
+            "max": round(self.max, 4),
+            "mean": round(self.total / self.count, 4) if self.count else 0.0
+        }
+
+class HandlerTiming:
+    """Time attributed to the handler currently running in this context."""
+
+    def __init__(self):
+        self.db_seconds = 0.0
+        self.rpc_seconds = 0.0
+        self.db_depth = 0
+
+_current_timing = contextvars.ContextVar("handler_timing", default=None)
+
+class HandlerMetrics:
+    def __init__(self):
+        self.handlers = {}
+
+    def _stats(self, name: str) -> dict:
+        stats = self.handlers.get(name)
+        if stats is None:
+            stats = {
+                "calls": 0,
+                "errors": 0,
+                "slow": 0,
+                "wall": LatencyHistogram(),
+                "db": LatencyHistogram(),
+                "rpc": LatencyHistogram()
+            }
+            self.handlers[name] = stats
+        return stats
+
+    def observe(self, name: str, wall: float, timing: HandlerTiming, failed: bool = False):
+        stats = self._stats(name)
+        stats["calls"] += 1
+        if failed:
+            stats["errors"] += 1
+        stats["wall"].record(wall)
+        stats["db"].record(timing.db_seconds)
+        stats["rpc"].record(timing.rpc_seconds)
+        if wall >= HANDLER_SLOW_SECONDS:
+            stats["slow"] += 1
+            logger.warning(
+                f"Slow handler {name}: {wall:.2f}s "
+                f"(db {timing.db_seconds:.2f}s, rpc {timing.rpc_seconds:.2f}s)"
+            )
+
+    def wrap_handler(self, callback):
+        """Wrap a Pyrogram handler callback so each run is measured."""
+        if getattr(callback, "__instrumented__", False):
+            return callback
+        name = getattr(callback, "__name__", repr(callback))
+
+        @functools.wraps(callback)
+        async def wrapper(*args, **kwargs):
+            timing = HandlerTiming()
+            token = _current_timing.set(timing)
+            started = time.perf_counter()
+            failed = False
+            try:
+                return await callback(*args, **kwargs)
+            except (StopPropagation, ContinuePropagation):
+                raise
+            except Exception:
+                failed = True
+                raise
+            finally:
+                _current_timing.reset(token)
+                self.observe(name, time.perf_counter() - started, timing, failed=failed)
+
+        wrapper.__instrumented__ = True
+        return wrapper
+
+    def instrument_dispatcher(self, client) -> int:
+        """Wrap every handler registered on a started client. Returns the count."""
+        wrapped = 0
+        for handlers in client.dispatcher.groups.values():
+            for handler in handlers:
+                if inspect.iscoroutinefunction(handler.callback):
+                    handler.callback = self.wrap_handler(handler.callback)
+                    wrapped += 1
+        return wrapped
+
+    def snapshot(self) -> dict:
+        """Per-handler percentiles (seconds), slowest p95 first."""
+        rows = {
+            name: {
+                "calls": stats["calls"],
+                "errors": stats["errors"],
+                "slow": stats["slow"],
+                "wall": stats["wall"].summary(),
+                "db": stats["db"].summary(),
+                "rpc": stats["rpc"].summary()
+            }
+            for name, stats in self.handlers.items()
+        }
+        return dict(sorted(rows.items(), key=lambda item: item[1]["wall"]["p95"], reverse=True))
+
+def _timed_coroutine(func, kind: str):
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        timing = _current_timing.get()
+        if timing is None:
+            return await func(*args, **kwargs)
+        # Nested DB calls (methods calling _save_db, etc.) count once.
+        outer = kind == "rpc" or timing.db_depth == 0
+        if kind == "db":
+            timing.db_depth += 1
+        started = time.perf_counter()
+        try:
+            return await func(*args, **kwargs)
+        finally:
+            if kind == "db":
+                timing.db_depth -= 1
+            if outer:
+                elapsed = time.perf_counter() - started
+                if kind == "db":
+                    timing.db_seconds += elapsed
+                else:
+                    timing.rpc_seconds += elapsed
+    return wrapper
+
+def instrument_database(database):
+    """Attribute time spent in the database's async methods to the running handler."""
+    for name, method in inspect.getmembers(database, inspect.iscoroutinefunction):
+        if not name.startswith("__"):
+            setattr(database, name, _timed_coroutine(method, "db"))
+
+def instrument_client(client):
+    """Attribute time spent in Telegram RPCs (every call goes through invoke)."""
+    client.invoke = _timed_coroutine(client.invoke, "rpc")
+
+# Global handler metrics instance
+handler_metrics = HandlerMetrics()
@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+from config import LOOP_MONITOR_INTERVAL, LOOP_LAG_THRESHOLD
+from .instrumentation import LatencyHistogram
+from .metrics import loop_lag_seconds, loop_lag_last
+
+logger = logging.getLogger(__name__)
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MAX_TRACKED_SITES = 50
+
+class LoopMonitor:
+    """Measure event-loop lag and find the code that blocks the loop.
+
+    A heartbeat task on the loop records how late each sleep wakes up. A
+    watchdog thread notices when the heartbeat stops, captures the loop
+    thread's stack with sys._current_frames(), and the heartbeat files the
+    stall under the innermost project call site once the loop recovers.
+    """
+
+    def __init__(self, interval: float = LOOP_MONITOR_INTERVAL, threshold: float = LOOP_LAG_THRESHOLD):
+        self.interval = max(0.01, interval)
+        self.threshold = threshold
+        self.lag = LatencyHistogram()
+        self.stalls = 0
+        self.sites = {}
+        self._beat = time.monotonic()
+        self._captured = None
+        self._lock = threading.Lock()
+        self._loop_thread_id = None
+        self._task = None
+        self._thread = None
+        self._stop = threading.Event()
+
+    def start(self):
+        """Start the heartbeat and watchdog; call from the running loop."""
+        if self._task is not None and not self._task.done():
+            return
+        self._loop_thread_id = threading.get_ident()
+        self._beat = time.monotonic()
+        self._stop.clear()
+        self._task = asyncio.create_task(self._heartbeat())
+        self._thread = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+        self._thread.start()
+
+    async def stop(self):
+        self._stop.set()
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+
+    async def _heartbeat(self):
+        while True:
+            started = time.monotonic()
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            self._beat = now
+            lag = max(0.0, now - started - self.interval)
+            self.lag.record(lag)
+            loop_lag_seconds.observe(lag)
+            loop_lag_last.set(lag)
+            with self._lock:
+                captured, self._captured = self._captured, None
+            if lag >= self.threshold:
+                self._record_stall(captured, lag)
+
+    def _watch(self):
+        while not self._stop.wait(self.interval):
+            if time.monotonic() - self._beat - self.interval < self.threshold:
+                continue
+            with self._lock:
+                if self._captured is not None:
+                    continue
+            frame = sys._current_frames().get(self._loop_thread_id)
+            if frame is None:
+                continue
+            stack = traceback.extract_stack(frame)
+            with self._lock:
+                self._captured = stack
+
+    @staticmethod
+    def _call_site(stack) -> str:
+        if not stack:
+            return "(not captured)"
+        site = stack[-1]
+        for frame in reversed(stack):
+            path = os.path.abspath(frame.filename)
+            if path.startswith(PROJECT_ROOT) and "site-packages" not in path and path != os.path.abspath(__file__):
+                site = frame
+                break
+        path = os.path.relpath(site.filename, PROJECT_ROOT) if site.filename.startswith(PROJECT_ROOT) else site.filename
+        return f"{path}:{site.lineno} in {site.name}"
+
+    def _record_stall(self, stack, lag: float):
+        self.stalls += 1
+        site = self._call_site(stack)
+        entry = self.sites.get(site)
+        if entry is None:
+            if len(self.sites) >= MAX_TRACKED_SITES:
+                smallest = min(self.sites, key=lambda key: self.sites[key]["total"])
+                del self.sites[smallest]
+            entry = {"count": 0, "total": 0.0, "max": 0.0, "stack": []}
+            self.sites[site] = entry
+        entry["count"] += 1
+        entry["total"] += lag
+        entry["max"] = max(entry["max"], lag)
+        if stack:
+            entry["stack"] = traceback.format_list(stack[-6:])
+        logger.warning(
+            f"Event loop blocked for {lag:.3f}s at {site}"
+            + ("\n" + "".join(entry["stack"]) if stack else "")
+        )
+
+    def snapshot(self, top: int = 5) -> dict:
+        sites = sorted(self.sites.items(), key=lambda item: item[1]["total"], reverse=True)[:top]
+        return {
+            "lag": self.lag.summary(),
+            "threshold": self.threshold,
+            "stalls": self.stalls,
+            "top_sites": [
+                {
+                    "site": site,
+                    "count": entry["count"],
+                    "total": round(entry["total"], 3),
+                    "max": round(entry["max"], 3)
+                }
+                for site, entry in sites
+            ]
+        }
+
+# Global loop monitor instance
+loop_monitor = LoopMonitor()
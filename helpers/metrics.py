@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+import bisect
+import logging
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+TRANSFER_BUCKETS = (1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800, 3600)
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_labels(labelnames, values, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(labelnames, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _format_value(value) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Metric:
+    """Base for metrics kept as plain dicts keyed by label values.
+
+    Updates are single dict operations with no locks: they run on the event
+    loop, and the few made from executor threads rely on the GIL, where a
+    rare lost increment is acceptable for monitoring data.
+    """
+
+    kind = "untyped"
+
+    def __init__(self, name: str, help_text: str, labelnames=()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(labels.get(name, "") for name in self.labelnames)
+
+    def samples(self):
+        return []
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for suffix, key, extra, value in self.samples():
+            lines.append(f"{self.name}{suffix}{_format_labels(self.labelnames, key, extra)} {_format_value(value)}")
+        return "\n".join(lines)
+
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str, labelnames=()):
+        super().__init__(name, help_text, labelnames)
+        self.values = {} if self.labelnames else {(): 0}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        self.values[key] = self.values.get(key, 0) + amount
+
+    def samples(self):
+        return [("", key, "", value) for key, value in sorted(self.values.items())]
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def __init__(self, name: str, help_text: str, labelnames=(), function=None):
+        super().__init__(name, help_text, labelnames)
+        self.values = {} if self.labelnames else {(): 0}
+        self.function = function
+
+    def set(self, value: float, **labels):
+        self.values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        self.values[key] = self.values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def samples(self):
+        if self.function is not None:
+            try:
+                return [("", (), "", self.function())]
+            except Exception as e:
+                logger.debug(f"Gauge {self.name} callback failed: {e}")
+                return []
+        return [("", key, "", value) for key, value in sorted(self.values.items())]
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self.series = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        series = self.series.get(key)
+        if series is None:
+            # [per-bucket counts..., +Inf count, sum]
+            series = [0] * (len(self.buckets) + 1) + [0.0]
+            self.series[key] = series
+        series[bisect.bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    def samples(self):
+        rows = []
+        for key, series in sorted(self.series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), series[:-1]):
+                cumulative += count
+                rows.append(("_bucket", key, f'le="{_format_value(bound)}"', cumulative))
+            rows.append(("_sum", key, "", series[-1]))
+            rows.append(("_count", key, "", cumulative))
+        return rows
+
+class MetricsRegistry:
+    def __init__(self, namespace: str = ""):
+        self.namespace = namespace
+        self.metrics = {}
+
+    def _register(self, metric: Metric) -> Metric:
+        if self.namespace:
+            metric.name = f"{self.namespace}_{metric.name}"
+        self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help_text: str, labelnames=()) -> Counter:
+        return self._register(Counter(name, help_text, labelnames))
+
+    def gauge(self, name: str, help_text: str, labelnames=(), function=None) -> Gauge:
+        return self._register(Gauge(name, help_text, labelnames, function=function))
+
+    def histogram(self, name: str, help_text: str, labelnames=(), buckets=DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, help_text, labelnames, buckets=buckets))
+
+    def render(self) -> str:
+        """Prometheus text exposition format (version 0.0.4)."""
+        return "\n".join(metric.render() for metric in self.metrics.values()) + "\n"
+
+# Global registry and the bot's metrics
+metrics = MetricsRegistry("gofile_bot")
+
+active_workers = metrics.gauge("active_workers", "Jobs currently in the transfer pipeline.")
+stage_workers = metrics.gauge("pipeline_stage_workers", "Worker pool size of each pipeline stage.", ["stage"])
+stage_busy_workers = metrics.gauge("pipeline_stage_busy_workers", "Workers currently running a job in each stage.", ["stage"])
+stage_busy_seconds = metrics.counter(
+    "pipeline_stage_busy_seconds_total", "Worker seconds spent running jobs; divide the rate by workers for utilization.", ["stage"]
+)
+stage_blocked_seconds = metrics.counter(
+    "pipeline_stage_blocked_seconds_total", "Seconds stage workers waited for room in the next stage's queue.", ["stage"]
+)
+stage_queue_depth = metrics.gauge("pipeline_stage_queue_depth", "Jobs waiting in each stage's queue.", ["stage"])
+stage_queue_wait = metrics.histogram(
+    "pipeline_stage_queue_wait_seconds", "Time jobs waited in a stage's queue before a worker took them.", ["stage"],
+    buckets=(0.01, 0.1, 0.5, 1, 5, 15, 30, 60, 120, 300, 600, 1800)
+)
+background_tasks_running = metrics.gauge("background_tasks_running", "Post-upload finalize tasks still running.")
+background_task_results = metrics.counter(
+    "background_task_results_total", "Post-upload finalize steps by step and result.", ["step", "result"]
+)
+downloaded_bytes = metrics.counter("downloaded_bytes_total", "Bytes downloaded from Telegram or URLs.", ["source"])
+uploaded_bytes = metrics.counter("uploaded_bytes_total", "Bytes uploaded to GoFile.")
+job_phase_seconds = metrics.histogram(
+    "job_phase_seconds", "Duration of each job phase.", ["phase"], buckets=TRANSFER_BUCKETS
+)
+jobs_total = metrics.counter("jobs_total", "Finished queue jobs by type and result.", ["type", "result"])
+gofile_uploads = metrics.counter("gofile_uploads_total", "GoFile upload attempts by server and result.", ["server", "result"])
+gofile_account_in_flight = metrics.gauge("gofile_account_in_flight", "Uploads running on each GoFile account.", ["account"])
+gofile_account_quarantined = metrics.gauge(
+    "gofile_account_quarantined", "1 while a GoFile account is quarantined after auth or quota failures.", ["account"]
+)
+batches_total = metrics.counter("batches_total", "Finished upload batches by origin and result.", ["origin", "result"])
+floodwait_seconds = metrics.counter("telegram_floodwait_seconds_total", "Seconds of FloodWait reported by Telegram.")
+disk_written_bytes = metrics.counter("disk_written_bytes_total", "Bytes written to disk by download writers.")
+disk_write_seconds = metrics.counter("disk_write_seconds_total", "Seconds spent in download disk writes (I/O threads).")
+disk_blocked_seconds = metrics.counter("disk_blocked_seconds_total", "Seconds downloads waited for pending disk writes.")
+upload_cache_hits = metrics.counter(
+    "upload_cache_hits_total", "Requests answered from the upload cache without a transfer.", ["source"]
+)
+url_requests_coalesced = metrics.counter(
+    "url_requests_coalesced_total", "URL requests attached to an identical transfer already in progress."
+)
+db_save_seconds = metrics.histogram("db_save_seconds", "Time spent writing the JSON database.")
+db_size_bytes = metrics.gauge("db_size_bytes", "Size of the JSON database file after the last save.")
+loop_lag_seconds = metrics.histogram(
+    "event_loop_lag_seconds", "How late the event loop woke a periodic probe.",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5)
+)
+loop_lag_last = metrics.gauge("event_loop_lag_last_seconds", "Event loop lag measured by the latest probe.")
@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+import asyncio
+import logging
+import time
+from .instrumentation import LatencyHistogram
+from .metrics import (
+    stage_workers, stage_busy_workers, stage_busy_seconds,
+    stage_blocked_seconds, stage_queue_depth, stage_queue_wait
+)
+
+logger = logging.getLogger(__name__)
+
+class Stage:
+    """One pipeline step: a worker pool fed by its own queue."""
+
+    def __init__(self, name: str, handler, workers: int, queue_size: int = 0):
+        self.name = name
+        self.handler = handler
+        self.workers = max(1, int(workers))
+        self.queue = asyncio.Queue(maxsize=max(0, int(queue_size)))
+        self.busy = 0
+        self.busy_seconds = 0.0
+        self.blocked_seconds = 0.0
+        self.processed = 0
+        self.errors = 0
+        self.wait = LatencyHistogram()
+        self.tasks = []
+
+class Pipeline:
+    """Jobs flow through named stages, each with its own worker pool.
+
+    A stage handler returns the name of the next stage, or None when the
+    job is finished. Hand-off queues can be bounded: a worker whose next
+    stage is full waits before taking new work, so a slow stage pushes back
+    on the ones feeding it instead of piling up staged files.
+    """
+
+    def __init__(self, on_error=None, on_done=None):
+        self.stages = {}
+        self.order = []
+        self.on_error = on_error
+        self.on_done = on_done
+        self.in_flight = 0
+        self.started_at = None
+        self._idle = asyncio.Event()
+        self._idle.set()
+
+    def add_stage(self, name: str, handler, workers: int, queue_size: int = 0) -> Stage:
+        stage = Stage(name, handler, workers, queue_size)
+        self.stages[name] = stage
+        self.order.append(name)
+        stage_workers.set(stage.workers, stage=name)
+        stage_queue_depth.set(0, stage=name)
+        return stage
+
+    def start(self):
+        self.started_at = time.monotonic()
+        for stage in self.stages.values():
+            for _ in range(stage.workers):
+                stage.tasks.append(asyncio.create_task(self._worker(stage)))
+
+    async def submit(self, job, stage: str = None):
+        """Queue a new job at the first stage (or `stage`)."""
+        self.in_flight += 1
+        self._idle.clear()
+        await self._put(self.stages[stage or self.order[0]], job)
+
+    def queued(self) -> int:
+        return sum(stage.queue.qsize() for stage in self.stages.values())
+
+    async def _put(self, stage: Stage, job):
+        await stage.queue.put((time.monotonic(), job))
+        stage_queue_depth.set(stage.queue.qsize(), stage=stage.name)
+
+    async def _worker(self, stage: Stage):
+        while True:
+            enqueued_at, job = await stage.queue.get()
+            stage_queue_depth.set(stage.queue.qsize(), stage=stage.name)
+            started = time.monotonic()
+            stage.wait.record(started - enqueued_at)
+            stage_queue_wait.observe(started - enqueued_at, stage=stage.name)
+            stage.busy += 1
+            stage_busy_workers.set(stage.busy, stage=stage.name)
+
+            next_stage = None
+            try:
+                next_stage = await stage.handler(job)
+            except Exception as e:
+                stage.errors += 1
+                if self.on_error is not None:
+                    try:
+                        await self.on_error(job, stage.name, e)
+                    except Exception as handler_error:
+                        logger.error(f"Pipeline error handler failed: {handler_error}")
+                else:
+                    logger.error(f"Pipeline stage {stage.name} failed: {e}")
+            finally:
+                elapsed = time.monotonic() - started
+                stage.busy -= 1
+                stage.busy_seconds += elapsed
+                stage.processed += 1
+                stage_busy_workers.set(stage.busy, stage=stage.name)
+                stage_busy_seconds.inc(elapsed, stage=stage.name)
+                stage.queue.task_done()
+
+            if next_stage:
+                blocked_from = time.monotonic()
+                await self._put(self.stages[next_stage], job)
+                blocked = time.monotonic() - blocked_from
+                stage.blocked_seconds += blocked
+                stage_blocked_seconds.inc(blocked, stage=stage.name)
+            else:
+                await self._finish(job)
+
+    async def _finish(self, job):
+        try:
+            if self.on_done is not None:
+                await self.on_done(job)
+        except Exception as e:
+            logger.error(f"Pipeline completion handler failed: {e}")
+        finally:
+            self.in_flight -= 1
+            if self.in_flight <= 0:
+                self._idle.set()
+
+    async def join(self):
+        """Wait until every submitted job has left the pipeline."""
+        await self._idle.wait()
+
+    async def stop(self):
+        tasks = [task for stage in self.stages.values() for task in stage.tasks]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def snapshot(self) -> dict:
+        uptime = max(0.001, time.monotonic() - self.started_at) if self.started_at else 0.001
+        return {
+            "in_flight": self.in_flight,
+            "stages": {
+                name: {
+                    "workers": stage.workers,
+                    "busy": stage.busy,
+                    "queued": stage.queue.qsize(),
+                    "queue_limit": stage.queue.maxsize,
+                    "processed": stage.processed,
+                    "errors": stage.errors,
+                    "utilization": round(stage.busy_seconds / (stage.workers * uptime) * 100, 1),
+                    "blocked_seconds": round(stage.blocked_seconds, 1),
+                    "queue_wait": stage.wait.summary()
+                }
+                for name, stage in self.stages.items()
+            }
+        }
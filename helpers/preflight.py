@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+import asyncio
+import logging
+import re
+import time
+from collections import OrderedDict
+from urllib.parse import unquote, urlsplit
+import aiohttp
+from config import MAX_FILE_SIZE, PREFLIGHT_TIMEOUT, PREFLIGHT_CACHE_TTL, PREFLIGHT_REJECT_HTML
+from .staging import safe_file_name
+
+logger = logging.getLogger(__name__)
+
+MAX_CACHED_PROBES = 1000
+CONTENT_RANGE_TOTAL = re.compile(r"/\s*(\d+)\s*$")
+FILENAME_EXTENDED = re.compile(r"filename\*\s*=\s*([\w-]*)'[^']*'([^;]+)", re.IGNORECASE)
+FILENAME_QUOTED = re.compile(r'filename\s*=\s*"([^"]*)"', re.IGNORECASE)
+FILENAME_PLAIN = re.compile(r"filename\s*=\s*([^;]+)", re.IGNORECASE)
+
+def disposition_filename(header: str) -> str:
+    """File name from a Content-Disposition header (RFC 6266, filename* preferred)."""
+    if not header:
+        return ""
+    match = FILENAME_EXTENDED.search(header)
+    if match:
+        return unquote(match.group(2).strip().strip('"'), encoding=match.group(1) or "utf-8", errors="replace")
+    match = FILENAME_QUOTED.search(header) or FILENAME_PLAIN.search(header)
+    return match.group(1).strip() if match else ""
+
+class PreflightResult:
+    def __init__(self, url: str):
+        self.url = url
+        self.checked = False
+        self.status = 0
+        self.size = 0
+        self.content_type = ""
+        self.file_name = ""
+        self.accept_ranges = False
+        self.etag = ""
+        self.last_modified = ""
+        self.method = ""
+        self.error = ""
+        self.rejection = ""
+
+    @property
+    def ok(self) -> bool:
+        return not self.rejection
+
+    def to_dict(self) -> dict:
+        return {
+            "url": self.url,
+            "checked": self.checked,
+            "status": self.status,
+            "size": self.size,
+            "content_type": self.content_type,
+            "file_name": self.file_name,
+            "accept_ranges": self.accept_ranges,
+            "etag": self.etag,
+            "last_modified": self.last_modified,
+            "method": self.method,
+            "rejection": self.rejection
+        }
+
+class Preflight:
+    """Probe URLs with HEAD (or a one-byte ranged GET) before they are queued.
+
+    Results are cached per URL for PREFLIGHT_CACHE_TTL seconds, and
+    concurrent probes of the same URL share one request.
+    """
+
+    def __init__(self, ttl: float = PREFLIGHT_CACHE_TTL):
+        self.ttl = ttl
+        self.cache = OrderedDict()
+        self.probes = 0
+        self.cache_hits = 0
+        self.rejected = 0
+
+    async def check(self, url: str) -> PreflightResult:
+        now = time.monotonic()
+        cached = self.cache.get(url)
+        if cached and cached[0] > now:
+            self.cache_hits += 1
+            self.cache.move_to_end(url)
+            return await asyncio.shield(cached[1])
+        task = asyncio.ensure_future(self._probe(url))
+        self.cache[url] = (now + self.ttl, task)
+        while len(self.cache) > MAX_CACHED_PROBES:
+            self.cache.popitem(last=False)
+        result = await asyncio.shield(task)
+        if not result.ok:
+            self.rejected += 1
+        return result
+
+    async def _probe(self, url: str) -> PreflightResult:
+        self.probes += 1
+        result = PreflightResult(url)
+        timeout = aiohttp.ClientTimeout(total=PREFLIGHT_TIMEOUT)
+        try:
+            async with aiohttp.ClientSession(timeout=timeout) as session:
+                async with session.head(url, allow_redirects=True) as response:
+                    self._read_headers(result, response, "HEAD")
+                # Many servers refuse HEAD or omit the length; one byte of a ranged GET tells us the total.
+                if result.status in (403, 405, 501) or (result.status < 400 and not result.size):
+                    async with session.get(url, headers={"Range": "bytes=0-0"}, allow_redirects=True) as response:
+                        self._read_headers(result, response, "GET")
+            result.checked = True
+        except Exception as e:
+            # Unreachable from here is not proof the download fails; let the job find out.
+            result.error = str(e) or e.__class__.__name__
+            logger.info(f"Pre-flight probe failed for {url}: {result.error}")
+            return result
+
+        if result.status >= 400:
+            result.rejection = f"The link returned HTTP {result.status}."
+        elif result.size and result.size > MAX_FILE_SIZE:
+            result.rejection = f"The file is larger than the {MAX_FILE_SIZE // 1024 ** 3} GB limit."
+        elif PREFLIGHT_REJECT_HTML and result.content_type.startswith("text/html") and not result.file_name:
+            result.rejection = "The link opens a web page, not a downloadable file."
+        return result
+
+    @staticmethod
+    def _read_headers(result: PreflightResult, response, method: str):
+        headers = response.headers
+        result.status = response.status
+        result.method = method
+        result.content_type = headers.get("Content-Type", "").split(";")[0].strip().lower()
+        if response.status == 206:
+            match = CONTENT_RANGE_TOTAL.search(headers.get("Content-Range", ""))
+            result.size = int(match.group(1)) if match else 0
+            result.accept_ranges = True
+        elif response.content_length:
+            result.size = response.content_length
+        result.accept_ranges = result.accept_ranges or headers.get("Accept-Ranges", "").lower() == "bytes"
+        result.etag = headers.get("ETag", result.etag)
+        result.last_modified = headers.get("Last-Modified", result.last_modified)
+        name = disposition_filename(headers.get("Content-Disposition", ""))
+        if not name:
+            # After redirects the final URL often carries the real name.
+            name = unquote(urlsplit(str(response.url)).path.rsplit("/", 1)[-1])
+            name = name if "." in name else ""
+        if name:
+            result.file_name = safe_file_name(name, "")
+
+    def snapshot(self) -> dict:
+        return {
+            "probes": self.probes,
+            "cache_hits": self.cache_hits,
+            "rejected": self.rejected,
+            "cached": len(self.cache)
+        }
+
+# Global pre-flight prober instance
+preflight = Preflight()
@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+import asyncio
+import logging
+import os
+import time
+from collections import deque
+import aiohttp
+from config import PROGRESS_EDIT_INTERVAL
+from .file_writer import io_executor
+from .formatting import human_readable_size
+from .rpc_governor import rpc, PRIORITY_STATUS_EDIT
+
+logger = logging.getLogger(__name__)
+
+SPEED_WINDOW_SECONDS = 10
+UPLOAD_CHUNK_SIZE = 256 * 1024
+PROGRESS_BAR_WIDTH = 12
+
+def format_duration(seconds) -> str:
+    if seconds is None:
+        return "--"
+    seconds = int(max(0, seconds))
+    hours, rem = divmod(seconds, 3600)
+    minutes, secs = divmod(rem, 60)
+    if hours:
+        return f"{hours}h {minutes:02d}m"
+    if minutes:
+        return f"{minutes}m {secs:02d}s"
+    return f"{secs}s"
+
+class TransferProgress:
+    """Byte counter for one transfer phase.
+
+    Writers only touch `done`/`total` (safe from executor threads); speed
+    and ETA are computed from samples taken on the event loop.
+    """
+
+    def __init__(self, total: int = 0):
+        self.total = int(total or 0)
+        self.done = 0
+        self.started_at = time.monotonic()
+        self.samples = deque()
+
+    def add(self, n: int):
+        self.done += n
+
+    def update(self, done: int, total: int = None):
+        self.done = int(done)
+        if total:
+            self.total = int(total)
+
+    def sample(self):
+        now = time.monotonic()
+        self.samples.append((now, self.done))
+        while len(self.samples) > 2 and now - self.samples[0][0] > SPEED_WINDOW_SECONDS:
+            self.samples.popleft()
+
+    @property
+    def elapsed(self) -> float:
+        return max(0.001, time.monotonic() - self.started_at)
+
+    @property
+    def speed(self) -> float:
+        """Bytes per second over the recent sample window."""
+        if len(self.samples) >= 2:
+            (t0, d0), (t1, d1) = self.samples[0], self.samples[-1]
+            if t1 > t0:
+                return max(0.0, (d1 - d0) / (t1 - t0))
+        return self.done / self.elapsed
+
+    @property
+    def eta(self):
+        speed = self.speed
+        if not self.total or speed <= 0:
+            return None
+        return max(0, self.total - self.done) / speed
+
+    @property
+    def percent(self):
+        if not self.total:
+            return None
+        return min(100.0, self.done / self.total * 100)
+
+    def render(self) -> str:
+        percent = self.percent
+        if percent is None:
+            bar = ""
+            amount = f"`{human_readable_size(self.done)}`"
+        else:
+            filled = int(PROGRESS_BAR_WIDTH * percent / 100)
+            bar = f"`[{'■' * filled}{'□' * (PROGRESS_BAR_WIDTH - filled)}] {percent:.1f}%`\n"
+            amount = f"`{human_readable_size(self.done)}` / `{human_readable_size(self.total)}`"
+        return (
+            f"{bar}"
+            f"📦 **Done:** {amount}\n"
+            f"⚡ **Speed:** `{human_readable_size(self.speed)}/s`\n"
+            f"⏳ **ETA:** `{format_duration(self.eta)}`"
+        )
+
+class StatusEditCoalescer:
+    """Collapse edits of the same status message.
+
+    Identical text is never re-sent, and progress edits are limited to one
+    per `interval` seconds per message. Forced edits (phase changes, final
+    results) bypass the interval but still skip unchanged text.
+    """
+
+    def __init__(self, interval: float = PROGRESS_EDIT_INTERVAL):
+        self.interval = interval
+        self.last_text = {}
+        self.last_edit_at = {}
+        self.skipped = 0
+        self.sent = 0
+
+    @staticmethod
+    def _key(message):
+        chat = getattr(message, "chat", None)
+        return (chat.id if chat else 0, message.id)
+
+    async def edit(self, message, text: str, force: bool = False, priority: int = PRIORITY_STATUS_EDIT, **kwargs) -> bool:
+        if message is None:
+            # Batch members report through their batch's status message instead.
+            return False
+        key = self._key(message)
+        now = time.monotonic()
+        if self.last_text.get(key) == text:
+            self.skipped += 1
+            return False
+        if not force and now - self.last_edit_at.get(key, 0) < self.interval:
+            self.skipped += 1
+            return False
+        self.last_edit_at[key] = now
+        await rpc.edit_text(message, text, priority=priority, **kwargs)
+        self.last_text[key] = text
+        self.sent += 1
+        return True
+
+    def forget(self, message):
+        if message is None:
+            return
+        key = self._key(message)
+        self.last_text.pop(key, None)
+        self.last_edit_at.pop(key, None)
+
+status_edits = StatusEditCoalescer()
+
+class ProgressReporter:
+    """Periodically render a TransferProgress into a status message.
+
+    Usage:
+        async with ProgressReporter(status_msg, progress, lambda p: header + p.render()):
+            ... transfer ...
+    """
+
+    def __init__(self, message, progress: TransferProgress, render, interval: float = PROGRESS_EDIT_INTERVAL):
+        self.message = message
+        self.progress = progress
+        self.render = render
+        self.interval = max(1.0, float(interval))
+        self._task = None
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            self.progress.sample()
+            try:
+                await status_edits.edit(self.message, self.render(self.progress))
+            except Exception as e:
+                logger.debug(f"Progress edit skipped: {e}")
+
+    async def __aenter__(self):
+        self.progress.sample()
+        self._task = asyncio.create_task(self._run())
+        return self.progress
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        return False
+
+class FileUploadPayload(aiohttp.payload.Payload):
+    """File body for a multipart upload that reports bytes sent to a TransferProgress.
+
+    It has a known size, so aiohttp still sends a Content-Length instead of
+    chunked encoding. Reads run on the disk executor and bandwidth pacing is
+    awaited on the loop, so a throttled upload never parks a thread of the
+    shared default executor.
+    """
+
+    def __init__(self, path: str, progress: TransferProgress, shaper=None, content_type: str = "application/octet-stream"):
+        super().__init__(path, content_type=content_type, filename=os.path.basename(path))
+        self.path = path
+        self.progress = progress
+        self.shaper = shaper
+        self._file_size = os.path.getsize(path)
+
+    @property
+    def size(self) -> int:
+        return self._file_size
+
+    async def write(self, writer):
+        loop = asyncio.get_running_loop()
+        f = await loop.run_in_executor(io_executor, open, self.path, "rb")
+        try:
+            while True:
+                chunk = await loop.run_in_executor(io_executor, f.read, UPLOAD_CHUNK_SIZE)
+                if not chunk:
+                    break
+                await writer.write(chunk)
+                self.progress.add(len(chunk))
+                if self.shaper is not None:
+                    await self.shaper.throttle(len(chunk))
+        finally:
+            f.close()
+
+    def decode(self, encoding: str = "utf-8", errors: str = "strict") -> str:
+        raise TypeError("File upload payloads are streamed, not decoded")
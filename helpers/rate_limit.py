@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+import asyncio
+import time
+
+class TokenBucket:
+    """Classic token bucket: `rate` tokens per second, bursting up to `capacity`."""
+
+    def __init__(self, rate: float, capacity: float = None):
+        self.rate = max(0.001, float(rate))
+        self.capacity = max(1.0, float(capacity if capacity is not None else rate))
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        elapsed = now - self.updated_at
+        if elapsed > 0:
+            self.tokens = min(self.capacity, self.tokens + elapsed * self.rate)
+            self.updated_at = now
+
+    def wait_time(self, tokens: float = 1) -> float:
+        """Seconds until `tokens` are available (0 when they are available now)."""
+        self._refill()
+        needed = min(tokens, self.capacity) - self.tokens
+        return 0.0 if needed <= 0 else needed / self.rate
+
+    def try_consume(self, tokens: float = 1) -> bool:
+        if self.wait_time(tokens) > 0:
+            return False
+        self.tokens -= min(tokens, self.capacity)
+        return True
+
+    def consume_now(self, tokens: float = 1):
+        """Take tokens unconditionally; the balance may go negative (debt)."""
+        self._refill()
+        self.tokens -= tokens
+
+    async def consume(self, tokens: float = 1):
+        while True:
+            wait = self.wait_time(tokens)
+            if wait <= 0:
+                self.tokens -= min(tokens, self.capacity)
+                return
+            await asyncio.sleep(wait)
+
+    def set_rate(self, rate: float, capacity: float = None):
+        self._refill()
+        self.rate = max(0.001, float(rate))
+        self.capacity = max(1.0, float(capacity if capacity is not None else rate))
+        self.tokens = min(self.tokens, self.capacity)
+
+    @property
+    def idle(self) -> bool:
+        """True once the bucket has fully refilled and can be discarded."""
+        self._refill()
+        return self.tokens >= self.capacity
@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+import asyncio
+import logging
+import time
+from pyrogram import Client
+from pyrogram.enums import ChatAction
+from pyrogram.errors import FloodWait, InputUserDeactivated, UserIsBlocked, PeerIdInvalid
+from database import db
+from config import REACHABILITY_PROBE_RATE
+from .rate_limit import TokenBucket
+from .rpc_governor import rpc, PRIORITY_BACKGROUND
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+class ProbeProgress:
+    def __init__(self, requested_by: int = 0):
+        self.requested_by = requested_by
+        self.status = "running"
+        self.total = 0
+        self.probed = 0
+        self.recovered = 0
+        self.errors = 0
+        self.started_at = time.monotonic()
+        self.finished_at = None
+        self.started_iso = datetime.now().isoformat()
+
+    @property
+    def elapsed(self) -> float:
+        end = self.finished_at if self.finished_at is not None else time.monotonic()
+        return max(0.001, end - self.started_at)
+
+    def to_dict(self) -> dict:
+        return {
+            "requested_by": self.requested_by,
+            "status": self.status,
+            "total": self.total,
+            "probed": self.probed,
+            "recovered": self.recovered,
+            "errors": self.errors,
+            "duration": round(self.elapsed, 2),
+            "started_at": self.started_iso
+        }
+
+class ReachabilityProber:
+    """Re-check users that broadcasts skip, at a low rate.
+
+    A chat action is invisible in the chat history but fails the same way a
+    message would for blocked or deleted accounts, so users who unblocked the
+    bot rejoin the broadcast audience without being sent anything.
+    """
+
+    def __init__(self):
+        self.progress = None
+        self._task = None
+        self._cancel = asyncio.Event()
+
+    def is_running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self, client: Client, requested_by: int = 0) -> bool:
+        """Start a probe unless one is already running. Returns True if started."""
+        if self.is_running():
+            return False
+        self._cancel = asyncio.Event()
+        self.progress = ProbeProgress(requested_by=requested_by)
+        self._task = asyncio.create_task(self._run(client, self.progress))
+        return True
+
+    def cancel(self) -> bool:
+        if not self.is_running():
+            return False
+        self._cancel.set()
+        return True
+
+    async def wait(self):
+        if self._task:
+            await asyncio.gather(self._task, return_exceptions=True)
+
+    async def _probe_user(self, client: Client, user_id: int) -> str:
+        try:
+            await rpc.call(
+                client.send_chat_action, user_id, ChatAction.TYPING,
+                family="other", priority=PRIORITY_BACKGROUND
+            )
+            return "success"
+        except UserIsBlocked:
+            return "blocked"
+        except InputUserDeactivated:
+            return "deleted"
+        except PeerIdInvalid:
+            return "invalid"
+        except FloodWait:
+            return "throttled"
+
+    async def _run(self, client: Client, progress: ProbeProgress):
+        try:
+            # Deactivated accounts never come back; only blocked/failing users are re-probed.
+            user_ids = await db.get_unreachable_user_ids(include_deactivated=False)
+            progress.total = len(user_ids)
+            bucket = TokenBucket(REACHABILITY_PROBE_RATE, 1)
+
+            for user_id in user_ids:
+                if self._cancel.is_set():
+                    progress.status = "cancelled"
+                    break
+                await bucket.consume()
+                try:
+                    outcome = await self._probe_user(client, user_id)
+                except Exception as e:
+                    logger.debug(f"Reachability probe failed for {user_id}: {e}")
+                    progress.errors += 1
+                    continue
+                progress.probed += 1
+                if outcome == "success":
+                    progress.recovered += 1
+                await db.record_delivery(user_id, outcome, persist=False)
+            else:
+                progress.status = "completed"
+        except Exception as e:
+            logger.error(f"Reachability probe aborted: {e}")
+            progress.status = "failed"
+        finally:
+            progress.finished_at = time.monotonic()
+            try:
+                await db.record_reachability_probe(progress.to_dict())
+            except Exception as e:
+                logger.error(f"Failed to store reachability probe summary: {e}")
+            logger.info(
+                f"Reachability probe {progress.status}: {progress.probed}/{progress.total} probed, "
+                f"{progress.recovered} recovered"
+            )
+
+    async def stop(self):
+        self.cancel()
+        await self.wait()
+
+# Global prober instance
+reachability_prober = ReachabilityProber()
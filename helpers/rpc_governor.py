@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from pyrogram.errors import FloodWait
+from config import (
+    RPC_SEND_RATE, RPC_EDIT_RATE, RPC_MEMBER_RATE,
+    RPC_PRIVATE_CHAT_RATE, RPC_GROUP_CHAT_RATE, RPC_FLOODWAIT_RETRIES
+)
+from .rate_limit import TokenBucket
+from .metrics import floodwait_seconds
+
+logger = logging.getLogger(__name__)
+
+# Priority classes: lower value is served first within a priority lane.
+PRIORITY_USER_REPLY = 0
+PRIORITY_STATUS_EDIT = 1
+PRIORITY_BACKUP_LOG = 2
+PRIORITY_BROADCAST = 3
+PRIORITY_BACKGROUND = 4
+
+PRIORITY_NAMES = {
+    PRIORITY_USER_REPLY: "user_reply",
+    PRIORITY_STATUS_EDIT: "status_edit",
+    PRIORITY_BACKUP_LOG: "backup_log",
+    PRIORITY_BROADCAST: "broadcast",
+    PRIORITY_BACKGROUND: "background",
+}
+
+# family -> (rate per second, burst, apply per-chat limits)
+METHOD_FAMILIES = {
+    "send": (RPC_SEND_RATE, RPC_SEND_RATE, True),
+    "edit": (RPC_EDIT_RATE, RPC_EDIT_RATE, True),
+    "member": (RPC_MEMBER_RATE, RPC_MEMBER_RATE, False),
+    "other": (RPC_MEMBER_RATE, RPC_MEMBER_RATE, False),
+}
+
+# Message sends and edits share one lane, so the priority order holds across
+# them: a waiting status edit holds back backup-log and broadcast sends.
+PRIORITY_LANES = {"send": "message", "edit": "message"}
+
+MAX_CHAT_BUCKETS = 5000
+POLL_INTERVAL = 0.05
+
+class RpcGovernor:
+    """Central scheduler for Telegram RPCs.
+
+    Every call goes through a per-family token bucket and, for message
+    sends/edits, a per-chat bucket. Waiters of a higher priority class hold
+    back lower classes in the same lane, and a FloodWait seen by any caller
+    pauses every caller until it expires.
+    """
+
+    def __init__(self):
+        self.family_buckets = {
+            name: TokenBucket(rate, burst) for name, (rate, burst, _) in METHOD_FAMILIES.items()
+        }
+        self.chat_buckets = OrderedDict()
+        self.paused_until = 0.0
+        self.contenders = {
+            PRIORITY_LANES.get(name, name): [0] * len(PRIORITY_NAMES) for name in METHOD_FAMILIES
+        }
+        self.waiting = [0] * len(PRIORITY_NAMES)
+        self.in_flight = 0
+        self.calls = {name: 0 for name in METHOD_FAMILIES}
+        self.errors = 0
+        self.flood_waits = 0
+        self.flood_wait_seconds = 0
+        self.wait_seconds = [0.0] * len(PRIORITY_NAMES)
+
+    def _family(self, family: str) -> str:
+        return family if family in self.family_buckets else "other"
+
+    def _chat_bucket(self, family: str, chat_id):
+        if chat_id is None or not METHOD_FAMILIES[family][2]:
+            return None
+        key = int(chat_id)
+        bucket = self.chat_buckets.get(key)
+        if bucket is None:
+            if len(self.chat_buckets) >= MAX_CHAT_BUCKETS:
+                self._prune_chat_buckets()
+            rate = RPC_PRIVATE_CHAT_RATE if key > 0 else RPC_GROUP_CHAT_RATE
+            bucket = TokenBucket(rate, max(1, rate * 3))
+            self.chat_buckets[key] = bucket
+        else:
+            self.chat_buckets.move_to_end(key)
+        return bucket
+
+    def _prune_chat_buckets(self):
+        for key in [k for k, b in self.chat_buckets.items() if b.idle]:
+            del self.chat_buckets[key]
+        while len(self.chat_buckets) >= MAX_CHAT_BUCKETS:
+            self.chat_buckets.popitem(last=False)
+
+    def report_flood_wait(self, seconds: int, family: str = "other"):
+        """Pause all callers for `seconds`; shared by every caller."""
+        seconds = max(1, int(seconds or 1))
+        self.flood_waits += 1
+        self.flood_wait_seconds += seconds
+        floodwait_seconds.inc(seconds)
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+        logger.warning(f"FloodWait {seconds}s on '{family}' RPC; pausing all Telegram calls.")
+
+    async def acquire(self, family: str = "send", priority: int = PRIORITY_USER_REPLY, chat_id=None):
+        family = self._family(family)
+        priority = max(0, min(len(PRIORITY_NAMES) - 1, int(priority)))
+        family_bucket = self.family_buckets[family]
+        chat_bucket = self._chat_bucket(family, chat_id)
+        contenders = self.contenders[PRIORITY_LANES.get(family, family)]
+        contending = False
+        started = time.monotonic()
+        self.waiting[priority] += 1
+        try:
+            while True:
+                now = time.monotonic()
+                if self.paused_until > now:
+                    await asyncio.sleep(self.paused_until - now)
+                    continue
+
+                # A waiter blocked only by its own chat does not hold back other chats.
+                chat_wait = chat_bucket.wait_time() if chat_bucket else 0.0
+                if chat_wait > 0:
+                    if contending:
+                        contenders[priority] -= 1
+                        contending = False
+                    await asyncio.sleep(chat_wait)
+                    continue
+
+                if not contending:
+                    contenders[priority] += 1
+                    contending = True
+                if any(contenders[p] > 0 for p in range(priority)):
+                    await asyncio.sleep(POLL_INTERVAL)
+                    continue
+
+                family_wait = family_bucket.wait_time()
+                if family_wait <= 0:
+                    family_bucket.try_consume()
+                    if chat_bucket:
+                        chat_bucket.try_consume()
+                    return
+                await asyncio.sleep(min(family_wait, POLL_INTERVAL))
+        finally:
+            if contending:
+                contenders[priority] -= 1
+            self.waiting[priority] -= 1
+            self.wait_seconds[priority] += time.monotonic() - started
+
+    async def call(
+        self,
+        func,
+        *args,
+        family: str = "send",
+        priority: int = PRIORITY_USER_REPLY,
+        chat_id=None,
+        retries: int = RPC_FLOODWAIT_RETRIES,
+        **kwargs
+    ):
+        """Run `func(*args, **kwargs)` under the governor, retrying after FloodWait."""
+        family = self._family(family)
+        attempt = 0
+        while True:
+            await self.acquire(family, priority, chat_id)
+            self.in_flight += 1
+            self.calls[family] += 1
+            try:
+                return await func(*args, **kwargs)
+            except FloodWait as e:
+                self.report_flood_wait(e.value, family)
+                attempt += 1
+                if attempt > retries:
+                    self.errors += 1
+                    raise
+            except Exception:
+                self.errors += 1
+                raise
+            finally:
+                self.in_flight -= 1
+
+    # Convenience wrappers for the common call sites.
+
+    async def send_message(self, client, chat_id, text, priority: int = PRIORITY_USER_REPLY, **kwargs):
+        return await self.call(client.send_message, chat_id, text, family="send", priority=priority, chat_id=chat_id, **kwargs)
+
+    async def copy_message(self, client, chat_id, from_chat_id, message_id, priority: int = PRIORITY_USER_REPLY, **kwargs):
+        return await self.call(
+            client.copy_message, chat_id, from_chat_id, message_id,
+            family="send", priority=priority, chat_id=chat_id, **kwargs
+        )
+
+    async def send_document(self, client, chat_id, document, priority: int = PRIORITY_USER_REPLY, **kwargs):
+        return await self.call(client.send_document, chat_id, document, family="send", priority=priority, chat_id=chat_id, **kwargs)
+
+    async def edit_text(self, message, text, priority: int = PRIORITY_STATUS_EDIT, **kwargs):
+        chat_id = message.chat.id if getattr(message, "chat", None) else None
+        return await self.call(message.edit_text, text, family="edit", priority=priority, chat_id=chat_id, **kwargs)
+
+    async def reply_text(self, message, text, priority: int = PRIORITY_USER_REPLY, **kwargs):
+        chat_id = message.chat.id if getattr(message, "chat", None) else None
+        return await self.call(message.reply_text, text, family="send", priority=priority, chat_id=chat_id, **kwargs)
+
+    async def get_chat_member(self, client, chat_id, user_id, priority: int = PRIORITY_USER_REPLY):
+        return await self.call(client.get_chat_member, chat_id, user_id, family="member", priority=priority)
+
+    def snapshot(self) -> dict:
+        """Queue depth and counters for admin panels and metrics."""
+        return {
+            "queue_depth": {PRIORITY_NAMES[p]: self.waiting[p] for p in PRIORITY_NAMES},
+            "wait_seconds": {PRIORITY_NAMES[p]: round(self.wait_seconds[p], 3) for p in PRIORITY_NAMES},
+            "in_flight": self.in_flight,
+            "calls": dict(self.calls),
+            "errors": self.errors,
+            "flood_waits": self.flood_waits,
+            "flood_wait_seconds": self.flood_wait_seconds,
+            "paused_for": round(max(0.0, self.paused_until - time.monotonic()), 1),
+            "chat_buckets": len(self.chat_buckets)
+        }
+
+# Global governor instance
+rpc = RpcGovernor()
@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+import asyncio
+import logging
+import os
+import re
+import shutil
+import time
+import uuid
+from config import DOWNLOAD_DIR, STAGING_SWEEP_INTERVAL, STAGING_MAX_AGE_HOURS
+from .file_writer import io_executor
+
+logger = logging.getLogger(__name__)
+
+UNSAFE_NAME_CHARS = re.compile(r'[\x00-\x1f/\\:*?"<>|]')
+MAX_NAME_LENGTH = 150
+
+def safe_file_name(name, fallback: str = "file") -> str:
+    """Strip path components and characters that are unsafe on common filesystems."""
+    name = os.path.basename(str(name or "").replace("\\", "/")).strip()
+    name = UNSAFE_NAME_CHARS.sub("_", name).strip(". ")
+    if not name:
+        return fallback
+    if len(name) > MAX_NAME_LENGTH:
+        root, ext = os.path.splitext(name)
+        name = root[:MAX_NAME_LENGTH - len(ext[:20])] + ext[:20]
+    return name
+
+class StagingJob:
+    """A private directory for one job's files, removed with everything in it when the job ends."""
+
+    def __init__(self, area, job_id: str):
+        self.area = area
+        self.id = job_id
+        self.dir = os.path.join(area.root, job_id)
+
+    def path(self, file_name: str) -> str:
+        return os.path.join(self.dir, safe_file_name(file_name))
+
+    def open(self):
+        os.makedirs(self.dir, exist_ok=True)
+        self.area.active.add(self.id)
+        return self
+
+    def close(self):
+        self.area.active.discard(self.id)
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+    def __enter__(self):
+        return self.open()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+def _tree_size(path: str):
+    files, size = 0, 0
+    if os.path.isfile(path):
+        return 1, os.path.getsize(path)
+    for root, _, names in os.walk(path):
+        for name in names:
+            try:
+                size += os.path.getsize(os.path.join(root, name))
+                files += 1
+            except OSError:
+                continue
+    return files, size
+
+def _remove(path: str):
+    if os.path.isdir(path):
+        shutil.rmtree(path, ignore_errors=True)
+    else:
+        os.remove(path)
+
+class StagingArea:
+    """Per-job staging directories under DOWNLOAD_DIR/jobs plus their janitor."""
+
+    def __init__(self, base_dir: str = DOWNLOAD_DIR):
+        self.base_dir = base_dir
+        self.root = os.path.join(base_dir, "jobs")
+        self.active = set()
+        self.last_sweep = {}
+        self._periodic_task = None
+
+    def job(self) -> StagingJob:
+        """Create a job with a collision-free id; use as a `with` block or open()/close()."""
+        return StagingJob(self, f"{int(time.time())}-{uuid.uuid4().hex[:12]}")
+
+    def _reclaim(self, max_age: float = None) -> dict:
+        """Remove leftovers that belong to no running job. Runs in an I/O thread."""
+        os.makedirs(self.root, exist_ok=True)
+        now = time.time()
+        candidates = [os.path.join(self.root, name) for name in os.listdir(self.root) if name not in self.active]
+        # Loose files from before per-job directories existed.
+        candidates += [
+            os.path.join(self.base_dir, name) for name in os.listdir(self.base_dir)
+            if os.path.join(self.base_dir, name) != self.root
+        ]
+        removed_files, freed = 0, 0
+        for path in candidates:
+            try:
+                if max_age is not None and now - os.path.getmtime(path) < max_age:
+                    continue
+                files, size = _tree_size(path)
+                _remove(path)
+                removed_files += files
+                freed += size
+            except OSError as e:
+                logger.warning(f"Could not reclaim staging leftover {path}: {e}")
+        return {"files": removed_files, "bytes": freed, "at": now}
+
+    async def reclaim(self, max_age: float = None) -> dict:
+        loop = asyncio.get_running_loop()
+        result = await loop.run_in_executor(io_executor, self._reclaim, max_age)
+        self.last_sweep = result
+        return result
+
+    async def reclaim_orphans(self) -> dict:
+        """Startup janitor: no job is running yet, so every staged file is an orphan."""
+        return await self.reclaim()
+
+    async def run_periodic(self):
+        """Remove leftovers older than STAGING_MAX_AGE_HOURS every STAGING_SWEEP_INTERVAL."""
+        if STAGING_SWEEP_INTERVAL <= 0:
+            return
+        while True:
+            await asyncio.sleep(STAGING_SWEEP_INTERVAL)
+            try:
+                result = await self.reclaim(max_age=STAGING_MAX_AGE_HOURS * 3600)
+                if result["files"]:
+                    logger.info(f"Staging sweep removed {result['files']} file(s), {result['bytes']} bytes")
+            except Exception as e:
+                logger.error(f"Staging sweep failed: {e}")
+
+    def start_periodic(self):
+        if self._periodic_task is None or self._periodic_task.done():
+            self._periodic_task = asyncio.create_task(self.run_periodic())
+
+    async def stop(self):
+        if self._periodic_task:
+            self._periodic_task.cancel()
+            await asyncio.gather(self._periodic_task, return_exceptions=True)
+
+# Global staging area instance
+staging = StagingArea()
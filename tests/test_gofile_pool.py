@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+import unittest
+from unittest import mock
+from helpers import gofile_pool as pool_module
+from helpers.gofile_pool import GofileAccountPool, classify_failure, parse_accounts
+
+class ClassifyFailureTest(unittest.TestCase):
+    def test_auth_failures(self):
+        self.assertEqual(classify_failure(401), "auth")
+        self.assertEqual(classify_failure(403), "auth")
+        self.assertEqual(classify_failure(200, "error-auth"), "auth")
+        self.assertEqual(classify_failure(200, "error-token"), "auth")
+
+    def test_quota_and_rate_limit_failures(self):
+        self.assertEqual(classify_failure(413), "quota")
+        self.assertEqual(classify_failure(200, "error-rateLimit"), "quota")
+        self.assertEqual(classify_failure(200, "error-storageLimit"), "quota")
+        self.assertEqual(classify_failure(200, "error-notPremium"), "quota")
+
+    def test_other_failures(self):
+        self.assertEqual(classify_failure(500), "error")
+        self.assertEqual(classify_failure(502, ""), "error")
+
+class ParseAccountsTest(unittest.TestCase):
+    def test_tokens_and_folders(self):
+        self.assertEqual(
+            parse_accounts("tok1:fold1, tok2\n tok3:fold3 ,"),
+            [("tok1", "fold1"), ("tok2", ""), ("tok3", "fold3")]
+        )
+
+class GofileAccountPoolTest(unittest.TestCase):
+    def setUp(self):
+        self.now = 1000.0
+        patcher = mock.patch.object(pool_module.time, "monotonic", lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.pool = GofileAccountPool([("token-a", "folder-a"), ("token-b", "folder-b"), ("token-c", "")])
+        self.a, self.b, self.c = self.pool.accounts
+
+    def test_rotates_to_least_loaded_account(self):
+        with self.pool.lease(self.pool.primary) as first:
+            with self.pool.lease(self.pool.primary) as second:
+                third = self.pool.primary
+        self.assertEqual(len({first.id, second.id, third.id}), 3)
+        self.assertEqual(self.a.in_flight + self.b.in_flight + self.c.in_flight, 0)
+
+    def test_prefers_fewer_errors_then_less_stored(self):
+        self.pool.report_failure(self.a, "error", "HTTP 500")
+        self.pool.report_success(self.b, 5000)
+        self.assertEqual([a.id for a in self.pool.ranked()], [self.c.id, self.b.id, self.a.id])
+
+    def test_plain_errors_do_not_quarantine(self):
+        self.assertFalse(self.pool.report_failure(self.a, "error", "HTTP 502"))
+        self.assertIn(self.a, self.pool.ranked())
+
+    def test_rate_limit_quarantines_and_fails_over(self):
+        kind = classify_failure(200, "error-rateLimit")
+        self.assertTrue(self.pool.report_failure(self.a, kind, "error-rateLimit"))
+        ranked = self.pool.ranked()
+        self.assertNotIn(self.a, ranked)
+        self.assertEqual(len(ranked), 2)
+
+    def test_auth_failure_quarantines_until_it_expires(self):
+        self.assertTrue(self.pool.report_failure(self.b, classify_failure(401), "HTTP 401"))
+        self.assertNotIn(self.b, self.pool.ranked())
+        row = next(row for row in self.pool.snapshot() if row["id"] == self.b.id)
+        self.assertEqual(row["quarantined_for"], pool_module.GOFILE_QUARANTINE_SECONDS)
+
+        self.now += pool_module.GOFILE_QUARANTINE_SECONDS + 1
+        self.assertIn(self.b, self.pool.ranked())
+
+    def test_all_quarantined_falls_back_to_first_to_recover(self):
+        self.pool.report_failure(self.a, "auth")
+        self.now += 10
+        self.pool.report_failure(self.b, "quota")
+        self.pool.report_failure(self.c, "quota")
+        self.assertEqual(self.pool.ranked(), [self.a])
+
+    def test_load_restores_saved_totals(self):
+        self.pool.load({self.c.id: {"uploads": 3, "bytes_stored": 42}})
+        self.assertEqual((self.c.uploads, self.c.bytes_stored), (3, 42))
+        self.assertEqual(self.a.uploads, 0)
+
+if __name__ == "__main__":
+    unittest.main()